@@ -0,0 +1,5 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Benchmarks of python-plugwise, run with 'python -m benchmarks'
+"""
@@ -0,0 +1,58 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Run benchmarks and write results as JSON
+"""
+import argparse
+from datetime import datetime
+import json
+import platform
+import sys
+from benchmarks import network, protocol
+
+BENCHMARKS = {
+    "parser": protocol.parser_throughput,
+    "serialize": protocol.serialize_throughput,
+    "send": network.send_throughput,
+    "discovery": network.discovery_time,
+    "first_power_reading": network.first_power_reading,
+    "relay_latency": network.relay_latency,
+    "download": network.download_throughput,
+    "historian": network.historian_throughput,
+    "memory": network.memory_per_node,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Benchmark python-plugwise"
+    )
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help="benchmarks to run (%s), default all" % ", ".join(BENCHMARKS),
+    )
+    parser.add_argument("--output", help="write JSON results to file")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmark(s): " + ", ".join(unknown))
+    results = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {},
+    }
+    for name in args.benchmarks or BENCHMARKS:
+        print("Run benchmark " + name, file=sys.stderr)
+        results["results"][name] = BENCHMARKS[name]()
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+End-to-end benchmarks of a stick connected to a simulated network
+"""
+import gc
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from plugwise.constants import SENSOR_POWER_USE, SIMULATOR_ACK_DELAY, SIMULATOR_LATENCY
+from plugwise.events import NewNodeEvent, SensorEvent
+from plugwise.exceptions import TimeoutException
+from plugwise.historian import PlugwiseHistorian
+from plugwise.messages.requests import NodePingRequest
+from plugwise.nodes.circle import PlugwiseCircle
+from plugwise.stick import stick
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCAN_TIME_OUT = 300
+
+
+class SimulatorProcess(object):
+    """
+    Simulated stick in a separate process, so it does not
+    compete with the measured stick for the interpreter lock
+    """
+
+    def __init__(
+        self, circles, latency=SIMULATOR_LATENCY, ack_delay=SIMULATOR_ACK_DELAY
+    ):
+        self._process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "plugwise.simulator",
+                "--circles",
+                str(circles),
+                "--latency",
+                str(latency),
+                "--ack-delay",
+                str(ack_delay),
+                "--seed",
+                "1",
+                "--tcp",
+                "127.0.0.1:0",
+            ],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+        )
+        self.port = self._process.stdout.readline().decode().split()[-1]
+
+    def stop(self):
+        self._process.terminate()
+        self._process.wait()
+        self._process.stdout.close()
+
+
+def connect_and_scan(port) -> tuple:
+    """ Return initialized stick with all nodes discovered and the discovery time """
+    plugwise = stick(port)
+    plugwise.connect()
+    plugwise.initialize_stick()
+    finished = threading.Event()
+    start = time.monotonic()
+    plugwise.scan(finished.set)
+    if not finished.wait(SCAN_TIME_OUT):
+        plugwise.disconnect()
+        raise TimeoutException("Discovery of nodes not finished")
+    return (plugwise, time.monotonic() - start)
+
+
+def latency_stats(latencies) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "mean": statistics.mean(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "max": latencies[-1],
+    }
+
+
+def send_throughput(requests=100) -> dict:
+    """
+    Return requests per second submitted by stick.send() and answered
+    by a simulator without latency at a loopback socket
+    """
+    simulator = SimulatorProcess(0, latency=0, ack_delay=0)
+    try:
+        (plugwise, _) = connect_and_scan(simulator.port)
+        answered = threading.Semaphore(0)
+        start = time.monotonic()
+        for _ in range(requests):
+            plugwise.send(
+                NodePingRequest(plugwise.node(plugwise.circle_plus_mac).mac),
+                lambda *args: answered.release(),
+            )
+        for _ in range(requests):
+            if not answered.acquire(timeout=SCAN_TIME_OUT):
+                raise TimeoutException("Not all requests are answered")
+        seconds = time.monotonic() - start
+        plugwise.disconnect()
+    finally:
+        simulator.stop()
+    return {"requests": requests, "requests_per_second": requests / seconds}
+
+
+def discovery_time(sizes=(8, 32, 64)) -> dict:
+    """ Return seconds to discover all nodes of networks of given sizes """
+    results = {}
+    for size in sizes:
+        simulator = SimulatorProcess(size - 1)
+        try:
+            (plugwise, seconds) = connect_and_scan(simulator.port)
+            results[str(size)] = {
+                "seconds": seconds,
+                "discovered": len(plugwise.nodes()),
+            }
+            plugwise.disconnect()
+        finally:
+            simulator.stop()
+    return results
+
+
+def relay_latency(nodes=32, switches=50) -> dict:
+    """
+    Return seconds between switching a relay and its acknowledge,
+    without and with polling the power usage of all nodes
+    """
+    simulator = SimulatorProcess(nodes - 1)
+    results = {}
+    try:
+        (plugwise, _) = connect_and_scan(simulator.port)
+        circles = [plugwise.node(mac) for mac in plugwise.nodes()]
+        for load in ("idle", "polling"):
+            if load == "polling":
+                plugwise.auto_update(5)
+            latencies = []
+            for i in range(switches):
+                switched = threading.Event()
+                start = time.monotonic()
+                circles[i % len(circles)].set_relay_state(
+                    i // len(circles) % 2 == 1, lambda *args: switched.set()
+                )
+                if not switched.wait(SCAN_TIME_OUT):
+                    raise TimeoutException("Relay switch is not acknowledged")
+                latencies.append(time.monotonic() - start)
+                # Spread switches over polling cycles
+                time.sleep(0.1)
+            results[load] = latency_stats(latencies)
+        plugwise.disconnect()
+    finally:
+        simulator.stop()
+    return results
+
+
+def first_power_reading(sizes=(8, 64)) -> dict:
+    """
+    Return seconds from start of scan until the first node is discovered
+    and until the first power reading, requested as soon as a Circle is found
+    """
+    results = {}
+    for size in sizes:
+        simulator = SimulatorProcess(size - 1)
+        try:
+            plugwise = stick(simulator.port)
+            plugwise.connect()
+            plugwise.initialize_stick()
+            events = plugwise.events(
+                filter=lambda event: isinstance(event, NewNodeEvent)
+                or (
+                    isinstance(event, SensorEvent)
+                    and event.sensor == SENSOR_POWER_USE["id"]
+                )
+            )
+            start = time.monotonic()
+            plugwise.scan()
+            (first_node, first_reading) = (None, None)
+            while first_reading is None:
+                event = events.get(timeout=SCAN_TIME_OUT)
+                if event is None:
+                    plugwise.disconnect()
+                    raise TimeoutException("No power reading received")
+                if isinstance(event, SensorEvent):
+                    first_reading = time.monotonic() - start
+                elif isinstance(plugwise.node(event.mac), PlugwiseCircle):
+                    if first_node is None:
+                        first_node = time.monotonic() - start
+                    plugwise.node(event.mac).update_power_usage()
+            events.close()
+            results[str(size)] = {
+                "first_node": first_node,
+                "first_power_reading": first_reading,
+            }
+            plugwise.disconnect()
+        finally:
+            simulator.stop()
+    return results
+
+
+def download_log(plugwise) -> dict:
+    """ Download complete power log of all Circles and return download counters """
+    download = plugwise.download_power_log()
+    for _ in download:
+        pass
+    return download.progress()
+
+
+def download_throughput(nodes=4) -> dict:
+    """ Return power log records per second of a complete power log download """
+    simulator = SimulatorProcess(nodes - 1)
+    try:
+        (plugwise, _) = connect_and_scan(simulator.port)
+        progress = download_log(plugwise)
+        plugwise.disconnect()
+    finally:
+        simulator.stop()
+    return {
+        "nodes": nodes,
+        "records": progress["records"],
+        "failed": progress["failed"],
+        "seconds": progress["elapsed"],
+        "records_per_second": progress["records_per_second"],
+    }
+
+
+def historian_throughput(nodes=4) -> dict:
+    """ Return rows per second written by the historian during a power log download """
+    simulator = SimulatorProcess(nodes - 1)
+    try:
+        (plugwise, _) = connect_and_scan(simulator.port)
+        with tempfile.TemporaryDirectory() as folder:
+            historian = PlugwiseHistorian(
+                plugwise, os.path.join(folder, "historian.db")
+            )
+            historian.start()
+            download_log(plugwise)
+            historian.stop()
+        plugwise.disconnect()
+    finally:
+        simulator.stop()
+    stats = historian.stats()
+    return {
+        "rows": stats["rows_written"],
+        "transactions": stats["transactions"],
+        "rows_per_second": stats["rows_per_second"],
+    }
+
+
+def memory_per_node(sizes=(8, 64)) -> dict:
+    """ Return bytes allocated by the stick per discovered node """
+    allocated = {}
+    for size in sizes:
+        simulator = SimulatorProcess(size - 1)
+        try:
+            gc.collect()
+            tracemalloc.start()
+            (plugwise, _) = connect_and_scan(simulator.port)
+            gc.collect()
+            allocated[size] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            plugwise.disconnect()
+        finally:
+            simulator.stop()
+    (small, large) = (min(sizes), max(sizes))
+    return {
+        "bytes_per_node": (allocated[large] - allocated[small]) / (large - small),
+        "bytes": {str(size): value for size, value in allocated.items()},
+    }
@@ -0,0 +1,115 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Benchmarks of parsing and serializing messages
+"""
+from datetime import datetime
+import logging
+import timeit
+from plugwise.constants import ACK_SUCCESS, LOGADDR_OFFSET
+from plugwise.messages.requests import (
+    CircleClockSetRequest,
+    CirclePowerBufferRequest,
+    CirclePowerUsageRequest,
+    CircleSwitchRelayRequest,
+    NodeInfoRequest,
+    NodePingRequest,
+    StickInitRequest,
+)
+from plugwise.parser import PlugwiseParser
+from plugwise.simulator import SimulatedStick, build_frame
+from plugwise.util import crc_fun
+
+REPEAT = 3
+
+
+class ParserSink(object):
+    """ Stick counting the messages of the parser """
+
+    def __init__(self):
+        self.logger = logging.getLogger("python-plugwise")
+        self.expected_responses = {}
+        self.messages = 0
+
+    def new_message(self, message):
+        self.messages += 1
+
+
+def response_frames() -> dict:
+    """ Return a frame of every response message type, generated by the simulator """
+    simulator = SimulatedStick(circles=1, scans=1, senses=1, seed=0)
+    frames = []
+    simulator.send_frame = frames.append
+    circle_plus = simulator.circle_plus
+    (scan, sense) = [simulator.nodes[mac] for mac in simulator.registered[1:]]
+    scan.awake()
+    scan.motion()
+    sense.report()
+    result = {
+        "NodeAckSmallResponse": build_frame(b"0000", b"0001", ACK_SUCCESS),
+        "StickInitResponse": build_frame(b"0011", b"0001", simulator.stick_info()),
+        "NodeAwakeResponse": frames[0],
+        "NodeSwitchGroupResponse": frames[1],
+        "SenseReportResponse": frames[2],
+    }
+    requests = (
+        ("NodeAckLargeResponse", b"0017", b"01"),
+        ("NodePingResponse", b"000D", b""),
+        ("CirclePowerUsageResponse", b"0012", b""),
+        ("CirclePlusScanResponse", b"0018", b"00"),
+        ("NodeInfoResponse", b"0023", b""),
+        ("CircleCalibrationResponse", b"0026", b""),
+        ("CirclePlusRealTimeClockResponse", b"0029", b""),
+        ("CircleClockResponse", b"003E", b""),
+        ("CirclePowerBufferResponse", b"0048", b"%08X" % LOGADDR_OFFSET),
+        ("NodeFeaturesResponse", b"005F", b""),
+    )
+    for (name, msg_id, args) in requests:
+        for (response_id, payload) in circle_plus.handle(msg_id, args):
+            result[name] = build_frame(response_id, b"0001", payload)
+    return result
+
+
+def parser_throughput(frames=10000) -> dict:
+    """ Return parsed frames per second for each response message type """
+    results = {}
+    for (name, frame) in response_frames().items():
+        sink = ParserSink()
+        parser = PlugwiseParser(sink)
+        seconds = min(
+            timeit.repeat(lambda: parser.feed(frame), repeat=REPEAT, number=frames)
+        )
+        assert sink.messages == frames * REPEAT, name + " frame is not parsed"
+        results[name] = {
+            "frames_per_second": frames / seconds,
+            "bytes_per_second": frames * len(frame) / seconds,
+        }
+    return results
+
+
+def serialize_throughput(messages=10000) -> dict:
+    """ Return serialized messages per second for common requests and CRC throughput """
+    mac = b"000D6F0000000001"
+    requests = (
+        StickInitRequest(),
+        NodePingRequest(mac),
+        NodeInfoRequest(mac),
+        CirclePowerUsageRequest(mac),
+        CircleSwitchRelayRequest(mac, True),
+        CirclePowerBufferRequest(mac, 100),
+        CircleClockSetRequest(mac, datetime.utcnow()),
+    )
+    results = {}
+    for request in requests:
+        seconds = min(timeit.repeat(request.serialize, repeat=REPEAT, number=messages))
+        results[request.__class__.__name__] = {
+            "messages_per_second": messages / seconds,
+            "bytes_per_second": messages * len(request.serialize()) / seconds,
+        }
+    data = b"0049" + mac + b"0" * 64
+    seconds = min(timeit.repeat(lambda: crc_fun(data), repeat=REPEAT, number=messages))
+    results["crc"] = {
+        "messages_per_second": messages / seconds,
+        "bytes_per_second": messages * len(data) / seconds,
+    }
+    return results
@@ -59,7 +59,7 @@ def scan_finished():
     )
     print(
         "Circle+ Power consumption previous hour (kWh): "
-        + str(node.get_power_consumption_previous_hour())
+        + str(node.get_power_consumption_prev_hour())
     )
     print(
         "Circle+ Power consumption today (kWh)        : "
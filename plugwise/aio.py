@@ -0,0 +1,62 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Helpers to use the stick and its nodes from an asyncio event loop
+"""
+import asyncio
+from plugwise.constants import (
+    EVENT_BUFFER_SIZE,
+    EVENT_OVERFLOW_DROP_OLDEST,
+    SENSOR_AVAILABLE,
+)
+from plugwise.events import AvailabilityEvent, EventStream, SensorEvent
+from plugwise.exceptions import TimeoutException
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+async def wait_for_callback(request, timeout=None):
+    """
+    Call request with a callback and wait until the callback is executed
+    by the stick. Returns the first argument passed to the callback.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def callback(*args):
+        loop.call_soon_threadsafe(_set_result, future, args[0] if args else None)
+
+    request(callback)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutException
+
+
+def _is_state_event(event) -> bool:
+    return isinstance(event, (SensorEvent, AvailabilityEvent))
+
+
+class AsyncStateStream(EventStream):
+    """
+    Stream of (mac, sensor, value) tuples for all state changes of the nodes
+    of a stick, to be used with 'async for'. Changes before iteration starts
+    are buffered like events of an event stream.
+    """
+
+    def __init__(
+        self,
+        stick,
+        buffer_size=EVENT_BUFFER_SIZE,
+        overflow=EVENT_OVERFLOW_DROP_OLDEST,
+    ):
+        super().__init__(stick, _is_state_event, buffer_size, overflow)
+
+    async def __anext__(self):
+        event = await super().__anext__()
+        if isinstance(event, AvailabilityEvent):
+            return (event.mac, SENSOR_AVAILABLE["id"], event.available)
+        return (event.mac, event.sensor, event.value)
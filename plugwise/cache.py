@@ -0,0 +1,73 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Persistent cache of plugwise network information
+"""
+import json
+import logging
+import os
+import threading
+from plugwise.constants import CACHE_FILE
+
+
+class PlugwiseCache(object):
+    """
+    Simple key/value store persisted as json file.
+    Without a folder the values are only kept in memory.
+    """
+
+    def __init__(self, folder=None, file_name=CACHE_FILE):
+        self.logger = logging.getLogger("python-plugwise")
+        self._lock = threading.Lock()
+        self._data = {}
+        self._file = None
+        if folder:
+            self._file = os.path.join(folder, file_name)
+            self._load()
+
+    def get(self, key, default=None):
+        """ Return cached value """
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value):
+        """ Store value and persist cache when value is changed """
+        with self._lock:
+            if self._data.get(key) == value:
+                return
+            self._data[key] = value
+            self._save()
+
+    def remove(self, key):
+        """ Remove value from cache """
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self._save()
+
+    def _load(self):
+        """ Load cached values from file """
+        if not os.path.exists(self._file):
+            return
+        try:
+            with open(self._file, "r") as cache_file:
+                self._data = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            self.logger.warning(
+                "Ignore invalid plugwise cache file %s : %s", self._file, e
+            )
+            self._data = {}
+
+    def _save(self):
+        """ Write cached values to file """
+        if not self._file:
+            return
+        temp_file = self._file + ".tmp"
+        try:
+            with open(temp_file, "w") as cache_file:
+                json.dump(self._data, cache_file)
+            os.replace(temp_file, self._file)
+        except OSError as e:
+            self.logger.warning(
+                "Failed to write plugwise cache file %s : %s", self._file, e
+            )
@@ -0,0 +1,207 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Capture traffic of a connection to a file and replay it
+"""
+from collections import namedtuple
+import struct
+import threading
+import time
+from plugwise.connections.connection import StickConnection
+from plugwise.constants import MESSAGE_TIME_OUT, REPLAY_SPEED
+from plugwise.exceptions import CaptureError, PortError
+from plugwise.message import PlugwiseMessage
+
+# Layout of capture file: header followed by records, all little endian.
+# Header: magic, format version, start of capture (unix time)
+HEADER = struct.Struct("<4sHd")
+MAGIC = b"PWCP"
+VERSION = 1
+# Record: seconds since start (monotonic clock), direction, size of data, followed by data
+RECORD = struct.Struct("<dBH")
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+CaptureRecord = namedtuple("CaptureRecord", ["timestamp", "direction", "data"])
+
+
+class CaptureWriter(object):
+    """ Write data received from and sent to the stick to a capture file """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, "wb")
+        self._start = time.monotonic()
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self.records = 0
+
+    def write(self, direction, data):
+        """ Add data with current timestamp """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(
+                RECORD.pack(time.monotonic() - self._start, direction, len(data)) + data
+            )
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """ Return start time (unix time) and iterator of records of capture file """
+    try:
+        capture_file = open(path, "rb")
+    except OSError as err:
+        raise CaptureError(err)
+    (magic, version, start) = HEADER.unpack(
+        capture_file.read(HEADER.size).ljust(HEADER.size, b"\0")
+    )
+    if magic != MAGIC or version != VERSION:
+        capture_file.close()
+        raise CaptureError("Unknown format of capture file " + path)
+
+    def records():
+        with capture_file:
+            while True:
+                header = capture_file.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    # End of (interrupted) capture
+                    return
+                (timestamp, direction, size) = RECORD.unpack(header)
+                data = capture_file.read(size)
+                if len(data) < size:
+                    return
+                yield CaptureRecord(timestamp, direction, data)
+
+    return (start, records())
+
+
+class RecordingConnection(StickConnection):
+    """
+    Connection writing all received data and sent messages of another
+    connection to a capture file. Sent messages are captured when queued.
+    """
+
+    def __init__(self, connection, path):
+        super().__init__(connection.port, connection.stick)
+        self.connection = connection
+        self.capture_path = path
+        self._capture = None
+        # Receive data of connection to capture it before parsing
+        connection.stick = self
+
+    @property
+    def logger(self):
+        return self.stick.logger
+
+    def connect(self):
+        if self._capture is None:
+            self._capture = CaptureWriter(self.capture_path)
+        self.connection.connect()
+
+    def feed_parser(self, data):
+        self._capture.write(DIRECTION_IN, data)
+        self.stick.feed_parser(data)
+
+    def send(self, message: PlugwiseMessage, callback=None):
+        self._capture.write(DIRECTION_OUT, message.serialize())
+        self.connection.send(message, callback)
+
+    def is_connected(self):
+        return self.connection.is_connected()
+
+    def read_thread_alive(self):
+        return self.connection.read_thread_alive()
+
+    def write_thread_alive(self):
+        return self.connection.write_thread_alive()
+
+    def disconnect(self):
+        self.connection.disconnect()
+        if self._capture:
+            self._capture.close()
+            self._capture = None
+
+
+class ReplayConnection(StickConnection):
+    """
+    Connection feeding the received data of a capture file to the stick,
+    at the captured pace divided by speed (0 is as fast as possible).
+
+    Received data is not fed before the stick has sent as many messages as
+    were sent before it in the capture, so responses never arrive before
+    their request. The content of sent messages is discarded.
+    """
+
+    def __init__(self, port, stick=None, speed=REPLAY_SPEED):
+        super().__init__(port, stick)
+        self.speed = speed
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._sent = threading.Condition()
+        self._messages_sent = 0
+        self._records = None
+
+    def _open_connection(self):
+        """Open capture file"""
+        self.stick.logger.debug("Open capture file %s", self.port)
+        try:
+            (_, self._records) = read_capture(self.port)
+        except CaptureError as err:
+            self.stick.logger.debug(
+                "Failed to open capture file %s, %s",
+                self.port,
+                err,
+            )
+            raise PortError(err)
+        self._stop.clear()
+        self._reader_start("replay_reader_thread")
+        self._writer_start("replay_writer_thread")
+        self._is_connected = True
+
+    def _reader_deamon(self):
+        """Thread to feed captured data on time"""
+        start = time.monotonic()
+        captured_sent = 0
+        for record in self._records:
+            if record.direction == DIRECTION_OUT:
+                captured_sent += 1
+                continue
+            with self._sent:
+                if not self._sent.wait_for(
+                    lambda: self._messages_sent >= captured_sent or self._stop.is_set(),
+                    MESSAGE_TIME_OUT,
+                ):
+                    self.stick.logger.debug(
+                        "Replay %s without request %s of capture",
+                        record.data,
+                        str(captured_sent),
+                    )
+            if self.speed:
+                delay = start + record.timestamp / self.speed - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+            if self._stop.is_set():
+                break
+            self.stick.feed_parser(record.data)
+        self.finished.set()
+        self.stick.logger.debug("Replay of %s finished", self.port)
+        # Keep reader alive like a connection without new data
+        self._stop.wait()
+
+    def _write_data(self, data):
+        """Count sent message, responses are replayed from capture"""
+        with self._sent:
+            self._messages_sent += 1
+            self._sent.notify_all()
+
+    def _close_connection(self):
+        """Stop replay"""
+        with self._sent:
+            self._stop.set()
+            self._sent.notify_all()
+        self._reader_thread.join()
+        self._records.close()
@@ -72,20 +72,20 @@ class StickConnection(object):
     def _writer_deamon(self):
         """Thread to write data from queue to existing connection."""
         while self.run_writer_thread:
-            try:
-                (message, callback) = self._write_queue.get(block=True, timeout=1)
-            except queue.Empty:
-                time.sleep(SLEEP_TIME)
-            else:
-                self.stick.logger.debug(
-                    "Sending %s to plugwise stick (%s)",
-                    message.__class__.__name__,
-                    message.serialize(),
-                )
-                self._write_data(message.serialize())
-                time.sleep(SLEEP_TIME)
-                if callback:
-                    callback()
+            (message, callback) = self._write_queue.get()
+            if message is None:
+                # Wake up to stop
+                continue
+            data = message.serialize()
+            self.stick.logger.debug(
+                "Sending %s to plugwise stick (%s)",
+                message.__class__.__name__,
+                data,
+            )
+            self._write_data(data)
+            time.sleep(SLEEP_TIME)
+            if callback:
+                callback()
         self.stick.logger.debug("Writer deamon stopped")
 
     def _write_data(self, data):
@@ -106,11 +106,11 @@ class StickConnection(object):
 
     def read_thread_alive(self):
         """Return state of write thread"""
-        return self._reader_thread.isAlive() if self.run_reader_thread else False
+        return self._reader_thread.is_alive() if self.run_reader_thread else False
 
     def write_thread_alive(self):
         """Return state of write thread"""
-        return self._writer_thread.isAlive() if self.run_writer_thread else False
+        return self._writer_thread.is_alive() if self.run_writer_thread else False
 
     ################################################
     ###             Close connection             ###
@@ -122,8 +122,9 @@ class StickConnection(object):
             self._is_connected = False
             self.run_writer_thread = False
             self.run_reader_thread = False
+            self._write_queue.put_nowait((None, None))
             max_wait = 5 * SLEEP_TIME
-            while self._writer_thread.isAlive():
+            while self._writer_thread.is_alive():
                 time.sleep(SLEEP_TIME)
                 max_wait -= SLEEP_TIME
             self._close_connection()
@@ -74,7 +74,10 @@ class PlugwiseUSBConnection(StickConnection):
         """Read thread."""
         if self._is_connected:
             try:
-                serial_data = self._serial.read_all()
+                # Wait (max 1 second) for the first byte, then read all available data
+                serial_data = self._serial.read(1)
+                if serial_data and self._serial.in_waiting:
+                    serial_data += self._serial.read(self._serial.in_waiting)
             except serial.serialutil.SerialException as err:
                 self.stick.logger.debug(
                     "Error while reading data from serial port : %s", err
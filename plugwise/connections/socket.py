@@ -18,11 +18,19 @@ class SocketConnection(StickConnection):
 
     def __init__(self, port, stick=None):
         super().__init__(port, stick)
-        # get the address from a <host>:<port> format
-        port_split = self.port.split(":")
-        self._socket_host = port_split[0]
-        self._socket_port = int(port_split[1])
-        self._socket_address = (self._socket_host, self._socket_port)
+        if self.port.startswith("unix:"):
+            # get the path from a unix:<path> format
+            self._socket_family = socket.AF_UNIX
+            self._socket_host = "unix"
+            self._socket_port = self.port[5:]
+            self._socket_address = self._socket_port
+        else:
+            # get the address from a <host>:<port> format
+            port_split = self.port.split(":")
+            self._socket_family = socket.AF_INET
+            self._socket_host = port_split[0]
+            self._socket_port = int(port_split[1])
+            self._socket_address = (self._socket_host, self._socket_port)
 
     def _open_connection(self):
         """Open socket"""
@@ -32,7 +40,7 @@ class SocketConnection(StickConnection):
             str(self._socket_port),
         )
         try:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket = socket.socket(self._socket_family, socket.SOCK_STREAM)
             self._socket.connect(self._socket_address)
         except Exception as err:
             self.stick.logger.debug(
@@ -55,6 +63,8 @@ class SocketConnection(StickConnection):
     def _close_connection(self):
         """Close the socket."""
         try:
+            # Shutdown first to unblock reader waiting for data
+            self._socket.shutdown(socket.SHUT_RDWR)
             self._socket.close()
         except Exception as err:
             self.stick.logger.debug(
@@ -48,15 +48,92 @@ SED_AWAKE_BUTTON = 5  # SED awake due to button press
 # Max timeout in seconds
 MESSAGE_TIME_OUT = 15  # Stick responds with timeout messages after 10 sec.
 MESSAGE_RETRY = 2
+# Max seconds to wait for the response of a request from asyncio, including retries
+ASYNC_REQUEST_TIME_OUT = MESSAGE_TIME_OUT * (MESSAGE_RETRY + 1)
+# Max seconds to wait for the scan and discovery of all nodes from asyncio
+ASYNC_SCAN_TIME_OUT = 300
 
 # plugwise year information is offset from y2k
 PLUGWISE_EPOCH = 2000
 PULSES_PER_KW_SECOND = 468.9385193
 LOGADDR_OFFSET = 278528
 
+# Default interval in minutes of power logs of Circles
+LOG_INTERVAL_DEFAULT = 60
+
+# Collecting power log buffers
+# Each log address contains 4 log buffers
+LOG_SYNC_INITIAL = 14  # Log addresses to collect without history (today and yesterday)
+LOG_SYNC_RECENT = 2  # Most recent log addresses collected at normal priority
+LOG_SYNC_CHUNK = 4  # Older log addresses requested at once at low priority
+LOG_SYNC_MAX_BACKFILL = 42  # Max log addresses to collect after an outage (7 days)
+LOG_SYNC_TIMEOUT = 300  # Seconds without response before a log sync is restarted
+
+# Long term energy history store
+ENERGY_STORE_FOLDER = "energy"
+STORE_GROW_HOURS = 24 * 366
+ENERGY_INDEX_HOURS = 24 * 366  # Max hours of energy history kept in memory per node
+
+# Historian database
+HISTORIAN_FLUSH_SIZE = 500  # Max rows written in one transaction
+HISTORIAN_FLUSH_INTERVAL = 5  # Seconds between writes of buffered rows
+
+# Download of complete power log memory
+DOWNLOAD_WINDOW = 4  # Max outstanding log requests of a download
+DOWNLOAD_TIMEOUT = 60  # Seconds to wait for a log response before it is requested again
+DOWNLOAD_RETRY = 2  # Max times a log address is requested again
+DOWNLOAD_CHECK_INTERVAL = 1  # Seconds between checks for unanswered log requests
+
+# Number of threads executing callbacks, 0 executes callbacks in the receiving thread
+CALLBACK_WORKERS = 2
+
+# Default window in seconds to combine state changes into one batch notification
+BATCH_WINDOW = 0.25
+
+# Stick sharing server
+# Seconds to wait for stick to acknowledge a forwarded request before the next one
+SERVER_ACK_TIMEOUT = MESSAGE_TIME_OUT
+SERVER_QUEUE_SIZE = 100  # Max requests waiting to be forwarded per client
+
+# Event streams
+EVENT_BUFFER_SIZE = 1000  # Default max number of buffered events per stream
+EVENT_OVERFLOW_DROP_OLDEST = "drop_oldest"
+EVENT_OVERFLOW_DROP_NEWEST = "drop_newest"
+EVENT_OVERFLOW_COALESCE = "coalesce"  # Replace buffered event of same node and sensor
+
+# Simulated stick and network
+SIMULATOR_ACK_DELAY = 0.005  # Seconds before stick acknowledges a request
+SIMULATOR_LATENCY = 0.05  # Average seconds before a node responds
+SIMULATOR_NODE_TIME_OUT = 10  # Seconds before stick reports a timeout (as real stick)
+SIMULATOR_LOG_HOURS = 24 * 7  # Hours of power log history of simulated Circles
+SIMULATOR_SED_INTERVAL = 60  # Seconds between awake messages of simulated SED's
+
+# Replay speed of captured traffic, 0 replays as fast as possible
+REPLAY_SPEED = 1
+
+# Shared memory export of node state
+SHARED_STATE_NAME = "plugwise_state"
+SHARED_STATE_NODES = 128  # Max number of nodes in shared memory segment
+SHARED_STATE_READ_TIME_OUT = 1  # Seconds to wait for a record being written
+
 # Default sleep between sending messages
 SLEEP_TIME = 150 / 1000
 
+# Priority of requests waiting to be sent, lowest value is sent first
+PRIORITY_HIGH = 1
+PRIORITY_MEDIUM = 2
+PRIORITY_LOW = 3
+
+# File name of persistent cache inside cache folder
+CACHE_FILE = "plugwise.cache"
+CACHE_SCAN_BITMAP = "scan_bitmap"
+CACHE_LOG_ADDRESS = "log_address"
+CACHE_ENERGY_TOTAL = "energy_total"
+CACHE_LOG_INTERVAL = "log_interval"
+
+# Number of addresses in memory of Circle+ for linked nodes
+CIRCLE_PLUS_ADDRESSES = 64
+
 # Max seconds the internal clock of plugwise nodes
 # are allowed to drift in seconds
 MAX_TIME_DRIFT = 30
@@ -67,6 +144,9 @@ WATCHDOG_DEAMON = 60
 # Automatically accept new join requests
 ACCEPT_JOIN_REQUESTS = False
 
+# Max number of nodes of which the node type is requested at the same time
+DISCOVERY_INFO_CONCURRENCY = 4
+
 # Node types
 NODE_TYPE_STICK = 0
 NODE_TYPE_CIRCLE_PLUS = 1  # AME_NC
@@ -139,6 +219,9 @@ SENSE_TEMPERATURE_OFFSET = 46.85
 
 # Callback types
 CB_NEW_NODE = "NEW_NODE"
+# Node object created, also for nodes found by a scan. Executed directly by the
+# thread adding the node, callbacks must return quickly.
+CB_NODE_ADDED = "NODE_ADDED"
 CB_JOIN_REQUEST = "JOIN_REQUEST"
 
 # Unit of measurement
@@ -194,7 +277,7 @@ SENSOR_POWER_CONSUMPTION_CURRENT_HOUR = {
 SENSOR_POWER_CONSUMPTION_PREVIOUS_HOUR = {
     "id": "power_con_prev_hour",
     "name": "Power consumption previous hour",
-    "state": "get_power_consumption_previous_hour",
+    "state": "get_power_consumption_prev_hour",
     "unit": ENERGY_KILO_WATT_HOUR,
 }
 SENSOR_POWER_CONSUMPTION_TODAY = {
@@ -209,6 +292,12 @@ SENSOR_POWER_CONSUMPTION_YESTERDAY = {
     "state": "get_power_consumption_yesterday",
     "unit": ENERGY_KILO_WATT_HOUR,
 }
+SENSOR_POWER_CONSUMPTION_TOTAL = {
+    "id": "power_con_total",
+    "name": "Power consumption total",
+    "state": "get_power_consumption_total",
+    "unit": ENERGY_KILO_WATT_HOUR,
+}
 SENSOR_POWER_PRODUCTION_CURRENT_HOUR = {
     "id": "power_prod_cur_hour",
     "name": "Power production current hour",
@@ -0,0 +1,129 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Discovery of the node type of linked plugwise nodes
+"""
+from collections import deque
+import threading
+import time
+
+
+class DiscoveryPipeline(object):
+    """
+    Discover linked nodes while limiting the number of outstanding requests.
+
+    The action is called as action(mac, done) and must call done(success)
+    exactly once. Calibration and clock requests are not part of discovery,
+    nodes request them when they are needed.
+    """
+
+    def __init__(self, action, concurrency=1, callback=None):
+        self._action = action
+        self._concurrency = concurrency
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._nodes = set()
+        self._pending = deque()
+        self._active = set()
+        self._done = 0
+        self._failed = 0
+        self._running = False
+        self._finished = False
+        self.started = None
+        self.first_ready = None
+        self.finished = None
+
+    def add(self, mac):
+        """ Add node to be discovered """
+        with self._lock:
+            if mac in self._nodes:
+                return
+            self._nodes.add(mac)
+            self._pending.append(mac)
+        if self._running:
+            self._dispatch()
+
+    def start(self):
+        """ Start discovery of the nodes """
+        self.started = time.monotonic()
+        self._running = True
+        self._dispatch()
+
+    def is_active(self, mac) -> bool:
+        """ Return True if discovery of node is waiting for a response """
+        with self._lock:
+            return mac in self._active
+
+    def request_failed(self, mac):
+        """ Request of node is dropped, mark discovery of node failed """
+        self._node_done(mac, False)
+
+    def is_finished(self) -> bool:
+        """ Return True when discovery of all nodes is finished """
+        return self._finished
+
+    def progress(self) -> dict:
+        """ Return progress counters of discovery """
+        with self._lock:
+            progress = {
+                "nodes": len(self._nodes),
+                "pending": len(self._pending),
+                "active": len(self._active),
+                "done": self._done,
+                "failed": self._failed,
+            }
+        now = self.finished if self.finished else time.monotonic()
+        progress.update(
+            {
+                "finished": self._finished,
+                "elapsed": (now - self.started) if self.started else 0.0,
+                "first_node_ready": (self.first_ready - self.started)
+                if self.first_ready
+                else None,
+            }
+        )
+        return progress
+
+    def _dispatch(self):
+        """ Start discovery of nodes for as long as the concurrency limit allows """
+        actions = []
+        finished = False
+        with self._lock:
+            while self._pending and len(self._active) < self._concurrency:
+                mac = self._pending.popleft()
+                self._active.add(mac)
+                actions.append(mac)
+            if (
+                not actions
+                and not self._finished
+                and not (self._pending or self._active)
+            ):
+                self._finished = True
+                self.finished = time.monotonic()
+                finished = True
+        for mac in actions:
+            self._action(mac, self._done_callback(mac))
+        if finished and self._callback:
+            self._callback()
+
+    def _done_callback(self, mac):
+        """ Return callback to mark discovery of node as done """
+
+        def done(success=True):
+            self._node_done(mac, success)
+
+        return done
+
+    def _node_done(self, mac, success):
+        """ Finish discovery of node """
+        with self._lock:
+            if mac not in self._active:
+                return
+            self._active.remove(mac)
+            if success:
+                self._done += 1
+                if self.first_ready is None:
+                    self.first_ready = time.monotonic()
+            else:
+                self._failed += 1
+        self._dispatch()
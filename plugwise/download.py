@@ -0,0 +1,182 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Download of the complete power log memory of Circle nodes
+"""
+from collections import deque
+import queue
+import time
+from plugwise.constants import (
+    DOWNLOAD_CHECK_INTERVAL,
+    DOWNLOAD_RETRY,
+    DOWNLOAD_TIMEOUT,
+    DOWNLOAD_WINDOW,
+    PRIORITY_LOW,
+)
+from plugwise.nodes.circle import PlugwiseCircle
+
+
+class PowerLogDownload(object):
+    """
+    Stream all logged power usage of one or more Circles.
+
+    Iterating yields (mac, timestamp, kWh) tuples, one for each logged hour.
+    The timestamp is the (UTC) log date as stored by the node.
+    Log addresses are requested at low priority and never more than
+    `window` requests are outstanding, so regular communication is not delayed.
+
+    The download can be resumed by passing the dict returned by checkpoint()
+    to a new download. All addresses below the checkpoint of a node are
+    completed, addresses received above it may be returned once more.
+    The checkpoint stays at the lowest address given up, so a resumed
+    download requests it again.
+    """
+
+    def __init__(self, stick, macs, checkpoint=None, window=DOWNLOAD_WINDOW):
+        self.stick = stick
+        self._macs = list(macs)
+        self._window = window
+        self._queue = queue.Queue()
+        self._checkpoint = dict(checkpoint) if checkpoint else {}
+        self._completed = {}
+        self._todo = deque()
+        self._outstanding = {}
+        self._info_pending = {}
+        self._nodes = {}
+        self.records = 0
+        self.failed = []
+        self.started = None
+        self.finished = None
+
+    def __iter__(self):
+        return self._download()
+
+    def checkpoint(self) -> dict:
+        """ Return first log address not completed yet for each node """
+        return dict(self._checkpoint)
+
+    def progress(self) -> dict:
+        """ Return download counters """
+        now = self.finished if self.finished else time.monotonic()
+        elapsed = (now - self.started) if self.started else 0.0
+        return {
+            "records": self.records,
+            "outstanding": len(self._outstanding),
+            "todo": len(self._todo),
+            "failed": len(self.failed),
+            "elapsed": elapsed,
+            "records_per_second": (self.records / elapsed) if elapsed else 0.0,
+        }
+
+    def _download(self):
+        """ Generator requesting log addresses and yielding received log records """
+        for mac in self._macs:
+            node = self.stick.node(mac)
+            if isinstance(node, PlugwiseCircle):
+                self._nodes[mac] = node
+            else:
+                self.stick.logger.warning(
+                    "Skip power log download of %s, not a discovered Circle", mac
+                )
+        self.started = time.monotonic()
+        for node in self._nodes.values():
+            node.subscribe_power_log(self._log_received)
+        try:
+            for mac, node in self._nodes.items():
+                if node._last_log_address == None:
+                    self._info_pending[mac] = time.monotonic()
+                    node._request_info(self._info_callback(mac))
+                else:
+                    self._add_node(mac, node._last_log_address)
+            self._request_next()
+            next_check = time.monotonic() + DOWNLOAD_CHECK_INTERVAL
+            while self._todo or self._outstanding or self._info_pending:
+                # Check for expired requests at a fixed interval, also while
+                # responses keep arriving
+                now = time.monotonic()
+                if now >= next_check:
+                    self._resend_expired()
+                    next_check = now + DOWNLOAD_CHECK_INTERVAL
+                    continue
+                try:
+                    item = self._queue.get(timeout=next_check - now)
+                except queue.Empty:
+                    continue
+                mac, log_address, log_records = item
+                if log_address == None:
+                    # Info response received
+                    self._info_pending.pop(mac, None)
+                    if self._nodes[mac]._last_log_address != None:
+                        self._add_node(mac, self._nodes[mac]._last_log_address)
+                elif (mac, log_address) in self._outstanding:
+                    del self._outstanding[(mac, log_address)]
+                    self._address_completed(mac, log_address)
+                    for (dt, kwh) in log_records:
+                        self.records += 1
+                        yield (mac, dt, kwh)
+                self._request_next()
+        finally:
+            for node in self._nodes.values():
+                node.unsubscribe_power_log(self._log_received)
+            self.finished = time.monotonic()
+
+    def _add_node(self, mac, last_log_address):
+        """ Queue all log addresses of node not downloaded yet """
+        first = self._checkpoint.get(mac, 0)
+        self._checkpoint[mac] = first
+        self._completed[mac] = set()
+        for log_address in range(first, last_log_address + 1):
+            self._todo.append((mac, log_address))
+
+    def _info_callback(self, mac):
+        """ Return callback for info request of node """
+
+        def info_received():
+            self._queue.put((mac, None, None))
+
+        return info_received
+
+    def _log_received(self, mac, log_address, log_records):
+        """ Pass received log records to the download generator """
+        self._queue.put((mac, log_address, log_records))
+
+    def _request_next(self):
+        """ Request queued log addresses as long as the window allows """
+        while self._todo and len(self._outstanding) < self._window:
+            mac, log_address = self._todo.popleft()
+            self._request(mac, log_address, 0)
+
+    def _request(self, mac, log_address, retry):
+        """ Send log request at low priority """
+        self._outstanding[(mac, log_address)] = (time.monotonic(), retry)
+        self._nodes[mac]._request_power_buffer(log_address, priority=PRIORITY_LOW)
+
+    def _resend_expired(self):
+        """ Request log addresses again which are not answered in time """
+        expired = time.monotonic() - DOWNLOAD_TIMEOUT
+        for (mac, sent) in list(self._info_pending.items()):
+            if sent < expired:
+                self.stick.logger.warning(
+                    "Skip power log download of %s, node info not received", mac
+                )
+                del self._info_pending[mac]
+        for (mac, log_address), (sent, retry) in list(self._outstanding.items()):
+            if sent > expired:
+                continue
+            if retry < DOWNLOAD_RETRY:
+                self._request(mac, log_address, retry + 1)
+            else:
+                self.stick.logger.warning(
+                    "Give up power log address %s of %s", str(log_address), mac
+                )
+                del self._outstanding[(mac, log_address)]
+                self.failed.append((mac, log_address))
+        self._request_next()
+
+    def _address_completed(self, mac, log_address):
+        """ Move checkpoint of node forward for all completed log addresses """
+        completed = self._completed[mac]
+        completed.add(log_address)
+        while self._checkpoint[mac] in completed:
+            completed.remove(self._checkpoint[mac])
+            self._checkpoint[mac] += 1
@@ -0,0 +1,173 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Stream of events of all nodes of a stick
+"""
+import asyncio
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from itertools import count
+import threading
+import time
+from plugwise.constants import (
+    EVENT_BUFFER_SIZE,
+    EVENT_OVERFLOW_COALESCE,
+    EVENT_OVERFLOW_DROP_NEWEST,
+    EVENT_OVERFLOW_DROP_OLDEST,
+    SENSOR_AVAILABLE,
+)
+
+SensorEvent = namedtuple("SensorEvent", ["mac", "sensor", "value", "timestamp"])
+AvailabilityEvent = namedtuple("AvailabilityEvent", ["mac", "available", "timestamp"])
+JoinRequestEvent = namedtuple("JoinRequestEvent", ["mac", "timestamp"])
+NewNodeEvent = namedtuple("NewNodeEvent", ["mac", "timestamp"])
+
+
+def state_event(mac, sensor, value):
+    """ Return event for state change of sensor of node """
+    if sensor == SENSOR_AVAILABLE["id"]:
+        return AvailabilityEvent(mac, value, datetime.now())
+    return SensorEvent(mac, sensor, value, datetime.now())
+
+
+class EventStream(object):
+    """
+    Buffer of events of all nodes, to be read by iterating, with 'async for'
+    or in batches using get_batch() or async_get_batch().
+
+    Only events for which filter(event) returns True are buffered. When the
+    buffer is full the oldest event (drop_oldest) or the new event
+    (drop_newest) is dropped. With coalesce a new sensor or availability
+    event replaces a buffered event of the same node and sensor.
+    """
+
+    def __init__(
+        self,
+        stick,
+        filter=None,
+        buffer_size=EVENT_BUFFER_SIZE,
+        overflow=EVENT_OVERFLOW_DROP_OLDEST,
+    ):
+        if overflow not in (
+            EVENT_OVERFLOW_DROP_OLDEST,
+            EVENT_OVERFLOW_DROP_NEWEST,
+            EVENT_OVERFLOW_COALESCE,
+        ):
+            raise ValueError("Unknown overflow policy " + str(overflow))
+        self.stick = stick
+        self._filter = filter
+        self._buffer_size = buffer_size
+        self._overflow = overflow
+        self._condition = threading.Condition()
+        self._buffer = OrderedDict()
+        self._counter = count()
+        self._waiters = []
+        self._closed = False
+        self.dropped = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self.get()
+        if event is None:
+            raise StopIteration
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        events = await self.async_get_batch(1)
+        if not events:
+            raise StopAsyncIteration
+        return events[0]
+
+    def get(self, timeout=None):
+        """ Return next event, None when stream is closed or timeout expired """
+        events = self.get_batch(1, timeout)
+        return events[0] if events else None
+
+    def get_batch(self, max_events=None, timeout=None) -> list:
+        """
+        Return buffered events (max max_events), waits until at least one event
+        is available, the timeout expired or the stream is closed.
+        """
+        with self._condition:
+            if timeout is None:
+                while not self._buffer and not self._closed:
+                    self._condition.wait()
+            else:
+                end = time.monotonic() + timeout
+                while not self._buffer and not self._closed:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            return self._take(max_events)
+
+    async def async_get_batch(self, max_events=None) -> list:
+        """ Return buffered events (max max_events), wait for events in event loop """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._buffer or self._closed:
+                    return self._take(max_events)
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+
+    def close(self):
+        """ Stop stream, iteration ends after the buffered events """
+        self.stick._remove_event_stream(self)
+        with self._condition:
+            self._closed = True
+            self._wake_up()
+
+    def add(self, event):
+        """ Buffer event """
+        if self._filter and not self._filter(event):
+            return
+        with self._condition:
+            if self._closed:
+                return
+            key = next(self._counter)
+            if self._overflow == EVENT_OVERFLOW_COALESCE:
+                if isinstance(event, SensorEvent):
+                    key = (event.mac, event.sensor)
+                elif isinstance(event, AvailabilityEvent):
+                    key = (event.mac, SENSOR_AVAILABLE["id"])
+                if key in self._buffer:
+                    self._buffer[key] = event
+                    return
+            if len(self._buffer) >= self._buffer_size:
+                self.dropped += 1
+                if self._overflow == EVENT_OVERFLOW_DROP_NEWEST:
+                    return
+                self._buffer.popitem(last=False)
+            self._buffer[key] = event
+            self._wake_up()
+
+    def _take(self, max_events):
+        """ Remove and return buffered events """
+        if max_events is None or max_events >= len(self._buffer):
+            events = list(self._buffer.values())
+            self._buffer.clear()
+        else:
+            events = [self._buffer.popitem(last=False)[1] for _ in range(max_events)]
+        return events
+
+    def _wake_up(self):
+        """ Wake up waiting readers """
+        self._condition.notify_all()
+        for (loop, waiter) in self._waiters:
+            try:
+                loop.call_soon_threadsafe(self._set_waiter, waiter)
+            except RuntimeError:
+                # Event loop is closed
+                pass
+        self._waiters = []
+
+    def _set_waiter(self, waiter):
+        if not waiter.done():
+            waiter.set_result(None)
@@ -42,3 +42,21 @@ class TimeoutException(PlugwiseException):
     """Timeout expired while waiting for response from node"""
 
     pass
+
+
+class SharedStateError(PlugwiseException):
+    """Shared memory segment not available or unknown layout"""
+
+    pass
+
+
+class CaptureError(PlugwiseException):
+    """Capture file not available or unknown format"""
+
+    pass
+
+
+class EnergyStoreError(PlugwiseException):
+    """Energy store file of unknown format"""
+
+    pass
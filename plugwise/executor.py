@@ -0,0 +1,120 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Execute callbacks outside the thread receiving messages
+"""
+from collections import deque
+import logging
+import queue
+import threading
+import time
+
+
+class CallbackExecutor(object):
+    """
+    Pool of worker threads executing callbacks.
+
+    Callbacks submitted with the same key (e.g. the mac of a node) are executed
+    one at a time in order of submission, callbacks of different keys in parallel.
+    Latency per callback is measured to find slow subscribers.
+    """
+
+    def __init__(self, workers):
+        self.logger = logging.getLogger("python-plugwise")
+        self._lock = threading.Lock()
+        self._ready = queue.Queue()
+        self._pending = {}
+        self._running = set()
+        self._depth = 0
+        self._max_depth = 0
+        self._max_wait = 0.0
+        self._stats = {}
+        self._workers = workers
+        self._threads = []
+        self.start()
+
+    def start(self):
+        """ Start worker threads, when not running """
+        if self._threads:
+            return
+        for i in range(self._workers):
+            thread = threading.Thread(
+                None, self._worker_loop, "callback_thread_" + str(i), (), {}
+            )
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, callback, *args):
+        """ Queue callback to be executed with given arguments """
+        with self._lock:
+            if key not in self._pending:
+                self._pending[key] = deque()
+            self._pending[key].append((callback, args, time.monotonic()))
+            self._depth += 1
+            if self._depth > self._max_depth:
+                self._max_depth = self._depth
+            if key in self._running:
+                # Key is already queued or being executed
+                return
+            self._running.add(key)
+        self._ready.put(key)
+
+    def stop(self):
+        """ Stop worker threads """
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+
+    def metrics(self) -> dict:
+        """ Return queue depth and latency of all callbacks """
+        with self._lock:
+            return {
+                "queue_depth": self._depth,
+                "max_queue_depth": self._max_depth,
+                "max_wait": self._max_wait,
+                "callbacks": {
+                    name: {
+                        "calls": stats[0],
+                        "avg_time": stats[1] / stats[0],
+                        "max_time": stats[2],
+                    }
+                    for name, stats in self._stats.items()
+                },
+            }
+
+    def _worker_loop(self):
+        """ Execute callbacks of ready keys """
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+            with self._lock:
+                (callback, args, submitted) = self._pending[key].popleft()
+            start = time.monotonic()
+            try:
+                callback(*args)
+            except Exception as e:
+                self.logger.error("Error while executing callback : %s", e)
+            finished = time.monotonic()
+            name = getattr(callback, "__qualname__", repr(callback))
+            with self._lock:
+                self._depth -= 1
+                if start - submitted > self._max_wait:
+                    self._max_wait = start - submitted
+                stats = self._stats.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += finished - start
+                if finished - start > stats[2]:
+                    stats[2] = finished - start
+                if self._pending[key]:
+                    requeue = True
+                else:
+                    requeue = False
+                    self._running.discard(key)
+                    del self._pending[key]
+            if requeue:
+                self._ready.put(key)
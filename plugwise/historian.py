@@ -0,0 +1,209 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Persist power readings of Circle nodes in a SQLite database
+"""
+from datetime import timedelta
+import sqlite3
+import threading
+import time
+from plugwise.constants import (
+    CB_NODE_ADDED,
+    HISTORIAN_FLUSH_INTERVAL,
+    HISTORIAN_FLUSH_SIZE,
+)
+from plugwise.history import ONE_HOUR
+from plugwise.nodes.circle import PlugwiseCircle
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS power_usage (
+        mac TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        power_1s REAL,
+        power_8s REAL,
+        consumption_hour REAL,
+        production_hour REAL
+    )""",
+    """CREATE INDEX IF NOT EXISTS power_usage_mac_timestamp
+        ON power_usage (mac, timestamp)""",
+    """CREATE TABLE IF NOT EXISTS power_log (
+        mac TEXT NOT NULL,
+        hour TEXT NOT NULL,
+        consumption REAL,
+        PRIMARY KEY (mac, hour)
+    )""",
+)
+INSERT_USAGE = "INSERT INTO power_usage VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_LOG = "INSERT OR REPLACE INTO power_log VALUES (?, ?, ?)"
+
+
+class PlugwiseHistorian(object):
+    """
+    Collect power usage updates and power log records of all Circles
+    and write them in batches to a SQLite database (WAL mode) from a separate thread.
+
+    Rows are written when flush_size rows are buffered or every flush_interval seconds.
+    All timestamps are stored in UTC as ISO formatted text, power log records
+    are stored as total energy of the logged hour with the start of the hour.
+    """
+
+    def __init__(
+        self,
+        stick,
+        path,
+        flush_size=HISTORIAN_FLUSH_SIZE,
+        flush_interval=HISTORIAN_FLUSH_INTERVAL,
+    ):
+        self.stick = stick
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._usage_rows = []
+        self._log_rows = []
+        self._nodes = []
+        self._thread = None
+        self._run_writer = False
+        self.rows_written = 0
+        self.transactions = 0
+        self.write_time = 0.0
+
+    def start(self):
+        """ Subscribe to all (future) Circles and start writer thread """
+        self._run_writer = True
+        self._thread = threading.Thread(
+            None, self._writer_loop, "historian_thread", (), {}
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        # Subscribe before existing nodes are added so no node is missed
+        self.stick.subscribe_stick_callback(self._subscribe_node, CB_NODE_ADDED)
+        for mac in self.stick.nodes():
+            self._subscribe_node(mac)
+
+    def stop(self):
+        """ Unsubscribe from nodes and write all buffered rows """
+        self.stick.unsubscribe_stick_callback(self._subscribe_node, CB_NODE_ADDED)
+        with self._lock:
+            nodes, self._nodes = self._nodes, []
+        for node in nodes:
+            node.unsubscribe_power_usage(self._power_usage)
+            node.unsubscribe_power_log(self._power_log)
+        self._run_writer = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        """ Return write counters """
+        return {
+            "rows_written": self.rows_written,
+            "transactions": self.transactions,
+            "rows_buffered": len(self._usage_rows) + len(self._log_rows),
+            "rows_per_second": (self.rows_written / self.write_time)
+            if self.write_time
+            else 0.0,
+        }
+
+    def _subscribe_node(self, mac):
+        """ Subscribe to power records of Circle """
+        node = self.stick.node(mac)
+        if not isinstance(node, PlugwiseCircle):
+            return
+        with self._lock:
+            if node in self._nodes:
+                return
+            self._nodes.append(node)
+        node.subscribe_power_usage(self._power_usage)
+        node.subscribe_power_log(self._power_log)
+
+    def _power_usage(self, mac, timestamp, power_1s, power_8s, consumed, produced):
+        """ Buffer power usage update """
+        if timestamp is None:
+            return
+        self._add_rows(
+            self._usage_rows,
+            [
+                (
+                    mac,
+                    (timestamp - self.stick.timezone_delta).isoformat(),
+                    power_1s,
+                    power_8s,
+                    consumed,
+                    produced,
+                )
+            ],
+        )
+
+    def _power_log(self, mac, log_address, log_records):
+        """
+        Buffer total energy of the hours of power log records.
+        Records are logged at the end of the log interval of the node,
+        which can be shorter than an hour.
+        """
+        node = self.stick.node(mac)
+        interval = timedelta(minutes=node.get_log_interval()[0])
+        hours = {}
+        for (dt, kwh) in log_records:
+            hour_start = (dt - interval).replace(minute=0, second=0, microsecond=0)
+            # Energy of all intervals of the hour combined by the node
+            hours[hour_start] = node.power_history.get(hour_start + ONE_HOUR, kwh)
+        self._add_rows(
+            self._log_rows,
+            [(mac, hour_start.isoformat(), kwh) for hour_start, kwh in hours.items()],
+        )
+
+    def _add_rows(self, rows, new_rows):
+        """ Add rows to buffer and wake up writer when buffer is full """
+        with self._lock:
+            rows.extend(new_rows)
+            buffered = len(self._usage_rows) + len(self._log_rows)
+        if buffered >= self.flush_size:
+            self._wakeup.set()
+
+    def _writer_loop(self):
+        """ Write buffered rows in batches until stopped """
+        try:
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.commit()
+        except sqlite3.Error as e:
+            self.stick.logger.error(
+                "Failed to open historian database %s : %s", self.path, e
+            )
+            self._run_writer = False
+            return
+        while self._run_writer:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._flush(db)
+        self._flush(db)
+        db.close()
+
+    def _flush(self, db):
+        """ Write all buffered rows using transactions of max flush_size rows """
+        with self._lock:
+            usage_rows, self._usage_rows = self._usage_rows, []
+            log_rows, self._log_rows = self._log_rows, []
+        for (statement, rows) in ((INSERT_USAGE, usage_rows), (INSERT_LOG, log_rows)):
+            for i in range(0, len(rows), self.flush_size):
+                batch = rows[i : i + self.flush_size]
+                start = time.monotonic()
+                try:
+                    with db:
+                        db.executemany(statement, batch)
+                except sqlite3.Error as e:
+                    self.stick.logger.error(
+                        "Failed to write %s rows to historian database : %s",
+                        str(len(batch)),
+                        e,
+                    )
+                    continue
+                self.write_time += time.monotonic() - start
+                self.rows_written += len(batch)
+                self.transactions += 1
@@ -0,0 +1,332 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Hourly energy history of a node
+"""
+from array import array
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+import math
+from plugwise.constants import PLUGWISE_EPOCH
+
+HISTORY_START = datetime(PLUGWISE_EPOCH, 1, 1)
+ONE_HOUR = timedelta(hours=1)
+
+
+def hour_number(dt) -> int:
+    """ Return number of hours between start of plugwise epoch and given datetime """
+    return (dt - HISTORY_START) // ONE_HOUR
+
+
+def hour_datetime(hour) -> datetime:
+    """ Return datetime of given hour number """
+    return HISTORY_START + hour * ONE_HOUR
+
+
+class EnergyIndex(object):
+    """
+    Energy (kWh) per hour with prefix sums (Fenwick tree) to get the total
+    of any range of hours in O(log n). Day and month totals are updated
+    for every stored hour. The covered range of hours grows when needed,
+    hours without data contain NaN.
+
+    When max_hours is given the covered range never exceeds it, the oldest
+    hours (and their part of the day and month totals) are dropped to make
+    room for newer hours and hours before the covered range are ignored.
+    """
+
+    def __init__(self, max_hours=None):
+        self.max_hours = max_hours
+        self._base = 0
+        self._values = array("d")
+        self._tree = array("d")
+        self._count = 0
+        self._days = {}
+        self._months = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, hour) -> bool:
+        return self._covers(hour) and not math.isnan(self._values[hour - self._base])
+
+    def get(self, hour, default=None):
+        """ Return energy of given hour number """
+        if hour in self:
+            return self._values[hour - self._base]
+        return default
+
+    def hours(self):
+        """ Return iterator of stored hour numbers in order """
+        return (
+            self._base + index
+            for index, value in enumerate(self._values)
+            if not math.isnan(value)
+        )
+
+    def set(self, hour, value):
+        """ Store energy of given hour number """
+        if not self._covers(hour):
+            self._resize(hour, hour)
+            if not self._covers(hour):
+                # Older than the limited range of hours
+                return
+        index = hour - self._base
+        previous = self._values[index]
+        if math.isnan(previous):
+            self._count += 1
+            previous = 0.0
+        self._values[index] = value
+        delta = value - previous
+        if delta == 0.0:
+            return
+        self._add_rollups(hour, delta)
+        index += 1
+        size = len(self._tree)
+        while index <= size:
+            self._tree[index - 1] += delta
+            index += index & -index
+
+    def load(self, first_hour, values):
+        """
+        Store energy of consecutive hours starting at first_hour, NaN is skipped.
+        Hours already stored are kept.
+        """
+        stored = [offset for offset, value in enumerate(values) if value == value]
+        if not stored:
+            return
+        first, last = first_hour + stored[0], first_hour + stored[-1]
+        if not (self._covers(first) and self._covers(last)):
+            self._resize(first, last)
+        for offset in stored:
+            index = first_hour + offset - self._base
+            if index < 0 or not math.isnan(self._values[index]):
+                continue
+            value = float(values[offset])
+            self._values[index] = value
+            self._count += 1
+            if value != 0.0:
+                self._add_rollups(first_hour + offset, value)
+        self._build()
+
+    def total(self, first_hour, last_hour) -> float:
+        """ Return total energy of hours first_hour up to (not including) last_hour """
+        if last_hour <= first_hour:
+            return 0.0
+        return self._prefix(last_hour) - self._prefix(first_hour)
+
+    def day_total(self, day) -> float:
+        """ Return total energy of given day number """
+        return self._days.get(day, 0.0)
+
+    def month_total(self, year, month) -> float:
+        """ Return total energy of given month """
+        return self._months.get((year, month), 0.0)
+
+    def days(self) -> dict:
+        """ Return total energy of all days by day number """
+        return dict(self._days)
+
+    def months(self) -> dict:
+        """ Return total energy of all months by (year, month) """
+        return dict(self._months)
+
+    def _covers(self, hour) -> bool:
+        return self._base <= hour < self._base + len(self._values)
+
+    def _prefix(self, hour) -> float:
+        """ Return total energy of all hours before given hour """
+        index = min(max(hour - self._base, 0), len(self._tree))
+        total = 0.0
+        while index > 0:
+            total += self._tree[index - 1]
+            index -= index & -index
+        return total
+
+    def _add_rollups(self, hour, delta):
+        """ Add energy difference of hour to day and month totals """
+        day = hour // 24
+        self._days[day] = self._days.get(day, 0.0) + delta
+        dt = hour_datetime(hour)
+        self._months[(dt.year, dt.month)] = (
+            self._months.get((dt.year, dt.month), 0.0) + delta
+        )
+
+    def _resize(self, first_hour, last_hour):
+        """
+        Extend covered hours to include given range, at least doubling its size.
+        With max_hours the most recent hours are kept within the limit.
+        """
+        needed = last_hour - last_hour % 24 + 24
+        if not self._values:
+            first = first_hour - first_hour % 24
+            last = needed
+        else:
+            first = min(self._base, first_hour - first_hour % 24)
+            last = max(self._base + len(self._values), needed)
+            if first < self._base:
+                first = min(first, last - 2 * len(self._values))
+            else:
+                last = max(last, first + 2 * len(self._values))
+        if self.max_hours and last - first > self.max_hours:
+            last = max(needed, self._base + len(self._values))
+            if self._values and last > self._base + len(self._values):
+                # Move by at least an eighth of the limit to avoid a copy every hour
+                last = max(last, self._base + len(self._values) + self.max_hours // 8)
+                last += -last % 24
+            first = last - self.max_hours
+        values = array("d", [math.nan]) * (last - first)
+        start = max(self._base, first)
+        end = min(self._base + len(self._values), last)
+        if start < end:
+            values[start - first : end - first] = self._values[
+                start - self._base : end - self._base
+            ]
+        dropped = start > self._base or end < self._base + len(self._values)
+        self._base = first
+        self._values = values
+        if dropped:
+            self._rebuild_rollups()
+        self._build()
+
+    def _rebuild_rollups(self):
+        """ Recalculate count, day and month totals of stored hours """
+        self._count = 0
+        self._days = {}
+        self._months = {}
+        for hour in self.hours():
+            self._count += 1
+            value = self._values[hour - self._base]
+            if value != 0.0:
+                self._add_rollups(hour, value)
+
+    def _build(self):
+        """ Build prefix sum tree from values in O(n) """
+        tree = array(
+            "d", (0.0 if math.isnan(value) else value for value in self._values)
+        )
+        size = len(tree)
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent - 1] += tree[index - 1]
+        self._tree = tree
+
+
+class PowerHistory(Mapping):
+    """
+    Read only mapping of log timestamp (UTC, end of the hour) to energy (kWh)
+    of all hours of an EnergyIndex numbered in local time.
+    """
+
+    def __init__(self, index, timezone_delta):
+        self._index = index
+        self._timezone_delta = timezone_delta
+
+    def __getitem__(self, dt):
+        hour = hour_number(dt + self._timezone_delta) - 1
+        value = self._index.get(hour)
+        if value is None or self._datetime(hour) != dt:
+            raise KeyError(dt)
+        return value
+
+    def __iter__(self):
+        return (self._datetime(hour) for hour in self._index.hours())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _datetime(self, hour) -> datetime:
+        """ Return log timestamp of given hour number """
+        return hour_datetime(hour + 1) - self._timezone_delta
+
+
+class EnergyIntegrator(object):
+    """
+    Monotonic cumulative energy (kWh) counter based on the running hour counter.
+
+    Within an hour the increase of the hour counter is added. At a new hour the
+    part of the previous hour after the last update is estimated using the last
+    power usage. When the log of an hour is received afterwards the total is
+    corrected with any energy which is not counted yet. The total never decreases.
+    """
+
+    def __init__(self, state=None):
+        self.total = 0.0
+        self._first_hour = None
+        self._hour = None
+        self._hour_counter = 0.0
+        self._timestamp = None
+        self._power = 0.0
+        self._counted = {}
+        if state:
+            self.total = state["total"]
+            self._first_hour = state["first_hour"]
+            self._hour = state["hour"]
+            self._hour_counter = state["counter"]
+            self._counted = {int(hour): value for hour, value in state["counted"]}
+
+    def state(self) -> dict:
+        """ Return state to restore integrator after a restart """
+        return {
+            "total": self.total,
+            "first_hour": self._first_hour,
+            "hour": self._hour,
+            "counter": self._hour_counter,
+            "counted": [[hour, value] for hour, value in self._counted.items()],
+        }
+
+    def update(self, timestamp, hour_counter, power) -> bool:
+        """
+        Add energy of running hour counter (kWh) at timestamp.
+        Power (W) is used to estimate the end of an hour without update.
+        Returns True if a new hour is started.
+        """
+        hour = hour_number(timestamp)
+        new_hour = False
+        if self._hour is None or hour > self._hour:
+            if self._hour is not None and self._timestamp is not None:
+                # Estimate rest of previous hour
+                end_of_hour = hour_datetime(self._hour + 1)
+                seconds = (end_of_hour - self._timestamp).total_seconds()
+                if 0 < seconds <= 3600:
+                    self._add(self._hour, max(self._power, 0.0) * seconds / 3600000)
+            if self._first_hour is None:
+                self._first_hour = hour
+            self._hour = hour
+            self._hour_counter = 0.0
+            new_hour = True
+            # Logs of the last 2 days can be used for corrections
+            for old_hour in [h for h in self._counted if h <= hour - 48]:
+                del self._counted[old_hour]
+        elif hour < self._hour:
+            # Update of previous hour arrived late
+            return False
+        if hour_counter > self._hour_counter:
+            self._add(hour, hour_counter - self._hour_counter)
+        self._hour_counter = hour_counter
+        self._timestamp = timestamp
+        self._power = power if power else 0.0
+        return new_hour
+
+    def hour_logged(self, hour, energy) -> bool:
+        """
+        Correct total with logged energy of given hour number.
+        Returns True if total is changed.
+        """
+        if self._hour is None or hour >= self._hour:
+            # Running hour is counted by update()
+            return False
+        if hour <= self._first_hour or hour <= self._hour - 48:
+            # Hour before start of counting or too old to correct
+            return False
+        counted = self._counted.get(hour, 0.0)
+        if energy > counted:
+            self._add(hour, energy - counted)
+            return True
+        return False
+
+    def _add(self, hour, energy):
+        """ Add energy to total and hour """
+        self.total += energy
+        self._counted[hour] = self._counted.get(hour, 0.0) + energy
@@ -0,0 +1,122 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Manage multiple Plugwise networks, each with its own stick
+"""
+import logging
+import threading
+from types import MappingProxyType
+from plugwise.constants import CALLBACK_WORKERS, CB_NODE_ADDED
+from plugwise.executor import CallbackExecutor
+from plugwise.scheduler import Scheduler
+from plugwise.stick import stick
+
+
+class StickManager(object):
+    """
+    Run multiple sticks with one scheduler thread for sending requests and
+    the timeout, update and watchdog jobs of all sticks, and one pool of
+    callback workers. Each stick keeps a reader and writer thread for the
+    blocking I/O of its own connection.
+    Nodes of all networks can be found by mac address.
+    """
+
+    def __init__(self, callback_workers=CALLBACK_WORKERS):
+        self.logger = logging.getLogger("python-plugwise")
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        self.callback_executor = None
+        if callback_workers:
+            self.callback_executor = CallbackExecutor(callback_workers)
+        self._lock = threading.Lock()
+        self._sticks = {}
+        self._index = {}
+
+    def add_stick(
+        self, port, callback=None, print_progress=False, cache_folder=None
+    ) -> stick:
+        """
+        Add stick connected to given port. When callback is given the stick is
+        connected and initialized, and callback is executed when it is finished.
+        """
+        new_stick = stick(
+            port,
+            None,
+            print_progress,
+            cache_folder,
+            0,
+            self.scheduler,
+            self.callback_executor,
+        )
+        with self._lock:
+            self._sticks[port] = new_stick
+        new_stick.subscribe_stick_callback(
+            lambda mac: self._node_added(new_stick, mac), CB_NODE_ADDED
+        )
+        if callback:
+            new_stick.auto_initialize(callback)
+        return new_stick
+
+    def remove_stick(self, port):
+        """ Disconnect and remove stick """
+        with self._lock:
+            removed = self._sticks.pop(port, None)
+            if removed:
+                for mac in [m for m, s in self._index.items() if s is removed]:
+                    del self._index[mac]
+        if removed:
+            removed.disconnect()
+
+    def sticks(self) -> dict:
+        """ Return all sticks by port """
+        return dict(self._sticks)
+
+    def nodes(self) -> list:
+        """ Return mac addresses of discovered nodes of all networks """
+        macs = []
+        for managed_stick in list(self._sticks.values()):
+            macs.extend(managed_stick.nodes())
+        return macs
+
+    def node(self, mac):
+        """ Return node of any network """
+        managed_stick = self._index.get(mac)
+        if managed_stick is None:
+            return None
+        return managed_stick.node(mac)
+
+    def snapshot(self):
+        """ Return read only mapping of mac to NodeState of all networks """
+        nodes = {}
+        for managed_stick in list(self._sticks.values()):
+            nodes.update(managed_stick.snapshot())
+        return MappingProxyType(nodes)
+
+    def metrics(self) -> dict:
+        """ Return combined counters of all sticks """
+        return {
+            "sticks": len(self._sticks),
+            "nodes": sum(len(s.nodes()) for s in list(self._sticks.values())),
+            "expected_responses": sum(
+                len(s.expected_responses) for s in list(self._sticks.values())
+            ),
+            "threads": threading.active_count(),
+            "scheduler": self.scheduler.metrics(),
+            "callbacks": self.callback_executor.metrics()
+            if self.callback_executor
+            else None,
+        }
+
+    def stop(self):
+        """ Disconnect all sticks and stop shared threads """
+        for port in list(self._sticks):
+            self.remove_stick(port)
+        self.scheduler.stop()
+        if self.callback_executor:
+            self.callback_executor.stop()
+
+    def _node_added(self, managed_stick, mac):
+        """ Add node to index when it is added to a stick """
+        with self._lock:
+            if self._sticks.get(managed_stick.port) is managed_stick:
+                self._index[mac] = managed_stick
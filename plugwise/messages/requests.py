@@ -423,7 +423,7 @@ class NodeMeasureIntervalRequest(NodeRequest):
     """
     Configure the logging interval of power measurement in minutes
 
-    Response message: TODO:
+    Response message: Ack message with ACK_POWER_LOG_INTERVAL_SET
     """
 
     ID = b"0057"
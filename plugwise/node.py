@@ -4,7 +4,12 @@ Use of this source code is governed by the MIT license found in the LICENSE file
 General node object to control associated plugwise nodes like: Circle+, Circle, Scan, Stealth
 """
 from datetime import datetime
+import threading
+import time
+from plugwise import constants
+from plugwise.aio import wait_for_callback
 from plugwise.constants import (
+    ASYNC_REQUEST_TIME_OUT,
     HA_SWITCH,
     HW_MODELS,
     SENSOR_AVAILABLE,
@@ -27,6 +32,13 @@ from plugwise.messages.requests import (
 )
 from plugwise.util import validate_mac
 
+# Name of method returning the value of each sensor
+SENSOR_STATES = {
+    getattr(constants, name)["id"]: getattr(constants, name)["state"]
+    for name in dir(constants)
+    if name.startswith("SENSOR_") or name.startswith("SWITCH_")
+}
+
 
 class PlugwiseNode(object):
     """ Base class for a Plugwise node """
@@ -45,6 +57,9 @@ class PlugwiseNode(object):
         self.switches = ()
         self._address = address
         self._callbacks = {}
+        self._callback_filters = {}
+        # Filters are used by the thread receiving messages and the scheduler thread
+        self._callback_filter_lock = threading.Lock()
         self.last_update = None
         self.last_request = None
         self._available = False
@@ -123,6 +138,10 @@ class PlugwiseNode(object):
         """Return mac address"""
         return self.mac.decode(UTF8_DECODE)
 
+    def _cache_key(self, name) -> str:
+        """Return key to store node specific value in cache"""
+        return self.get_mac() + "." + name
+
     def get_name(self) -> str:
         """Return unique name"""
         return self.get_node_type() + " (" + str(self._address) + ")"
@@ -182,6 +201,10 @@ class PlugwiseNode(object):
             callback,
         )
 
+    async def async_ping(self):
+        """ Ping node and wait for the response """
+        await wait_for_callback(self.ping, ASYNC_REQUEST_TIME_OUT)
+
     def on_message(self, message):
         """
         Process received message
@@ -215,12 +238,31 @@ class PlugwiseNode(object):
     def _on_message(self, message):
         pass
 
-    def subscribe_callback(self, callback, sensor) -> bool:
-        """ Subscribe callback to execute when state change happens """
+    def subscribe_callback(
+        self, callback, sensor, deadband=None, deadband_pct=None, min_interval=None
+    ) -> bool:
+        """
+        Subscribe callback to execute when state change happens
+
+        Optionally the callback is only executed when the sensor value has changed
+        more than deadband (absolute) or deadband_pct (percentage) since the last
+        executed callback, and at most once every min_interval seconds. An update
+        suppressed by min_interval is executed at the end of the interval.
+        """
         if sensor in self.sensors:
             if sensor not in self._callbacks:
                 self._callbacks[sensor] = []
             self._callbacks[sensor].append(callback)
+            if deadband != None or deadband_pct != None or min_interval != None:
+                with self._callback_filter_lock:
+                    self._callback_filters[(sensor, callback)] = [
+                        deadband,
+                        deadband_pct,
+                        min_interval,
+                        None,
+                        None,
+                        None,
+                    ]
             return True
         return False
 
@@ -228,18 +270,114 @@ class PlugwiseNode(object):
         """ Unsubscribe callback to execute when state change happens """
         if sensor in self._callbacks:
             self._callbacks[sensor].remove(callback)
+            with self._callback_filter_lock:
+                callback_filter = self._callback_filters.pop((sensor, callback), None)
+                if callback_filter and callback_filter[5]:
+                    callback_filter[5].cancel()
+
+    def _sensor_state(self, sensor):
+        """ Return current value of sensor or None if unknown """
+        state = getattr(self, SENSOR_STATES.get(sensor, ""), None)
+        if state:
+            return state()
+        return None
+
+    def _callback_filter_passed(self, sensor, callback, value) -> bool:
+        """ Return True if callback must be executed for new value of sensor """
+        with self._callback_filter_lock:
+            callback_filter = self._callback_filters.get((sensor, callback))
+            if callback_filter is None:
+                # Unsubscribed
+                return False
+            return self._apply_callback_filter(callback_filter, sensor, callback, value)
+
+    def _apply_callback_filter(self, callback_filter, sensor, callback, value) -> bool:
+        """ Check new value against filter and update its state, lock must be held """
+        (
+            deadband,
+            deadband_pct,
+            min_interval,
+            last_value,
+            last_time,
+            trailing_job,
+        ) = callback_filter
+        now = time.monotonic()
+        if min_interval != None and last_time != None:
+            if now - last_time < min_interval:
+                if trailing_job is None:
+                    # Pass latest value at end of interval
+                    callback_filter[5] = self.stick.call_later(
+                        last_time + min_interval - now,
+                        self._trailing_callback,
+                        sensor,
+                        callback,
+                    )
+                return False
+        if (deadband != None or deadband_pct != None) and last_time != None:
+            if (
+                isinstance(value, (int, float))
+                and isinstance(last_value, (int, float))
+                # Boolean states pass only when they change
+                and not isinstance(value, bool)
+            ):
+                change = abs(value - last_value)
+                if not (
+                    (deadband != None and change > deadband)
+                    or (
+                        deadband_pct != None
+                        and change > abs(last_value) * deadband_pct / 100
+                    )
+                ):
+                    return False
+            elif value != None and value == last_value:
+                return False
+        if trailing_job:
+            trailing_job.cancel()
+            callback_filter[5] = None
+        callback_filter[3] = value
+        callback_filter[4] = now
+        return True
+
+    def _trailing_callback(self, sensor, callback):
+        """ Execute callback for update suppressed by minimum interval """
+        with self._callback_filter_lock:
+            callback_filter = self._callback_filters.get((sensor, callback))
+            if callback_filter is None:
+                return
+            callback_filter[5] = None
+            passed = self._apply_callback_filter(
+                callback_filter, sensor, callback, self._sensor_state(sensor)
+            )
+        if passed:
+            self._execute_callback(callback)
 
     def do_callback(self, sensor):
         """ Execute callbacks registered for specified callback type """
+        self.stick._state_changed(self, sensor)
         if sensor in self._callbacks:
-            for callback in self._callbacks[sensor]:
-                try:
-                    callback(None)
-                except Exception as e:
-                    self.stick.logger.error(
-                        "Error while executing all callback : %s",
-                        e,
-                    )
+            value = None
+            value_known = False
+            for callback in list(self._callbacks[sensor]):
+                if (sensor, callback) in self._callback_filters:
+                    if not value_known:
+                        value = self._sensor_state(sensor)
+                        value_known = True
+                    if not self._callback_filter_passed(sensor, callback, value):
+                        continue
+                self._execute_callback(callback)
+
+    def _execute_callback(self, callback):
+        """ Execute callback by callback executor or directly """
+        if self.stick.callback_executor:
+            self.stick.callback_executor.submit(self.get_mac(), callback, None)
+            return
+        try:
+            callback(None)
+        except Exception as e:
+            self.stick.logger.error(
+                "Error while executing all callback : %s",
+                e,
+            )
 
     def _process_ping_response(self, message):
         """ Process ping response message"""
@@ -3,12 +3,34 @@ Use of this source code is governed by the MIT license found in the LICENSE file
 
 Plugwise Circle node object
 """
+from array import array
 import logging
 from datetime import date, datetime, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from plugwise.aio import wait_for_callback
 from plugwise.constants import (
     ACK_OFF,
     ACK_ON,
+    ACK_POWER_LOG_INTERVAL_SET,
+    ASYNC_REQUEST_TIME_OUT,
+    CACHE_ENERGY_TOTAL,
+    CACHE_LOG_INTERVAL,
+    CACHE_LOG_ADDRESS,
+    ENERGY_INDEX_HOURS,
+    LOG_INTERVAL_DEFAULT,
+    LOG_SYNC_CHUNK,
+    LOG_SYNC_INITIAL,
+    LOG_SYNC_MAX_BACKFILL,
+    LOG_SYNC_RECENT,
+    LOG_SYNC_TIMEOUT,
     MAX_TIME_DRIFT,
+    MESSAGE_RETRY,
+    MESSAGE_TIME_OUT,
     SENSOR_AVAILABLE,
     SENSOR_PING,
     SENSOR_POWER_USE,
@@ -16,6 +38,7 @@ from plugwise.constants import (
     SENSOR_POWER_CONSUMPTION_CURRENT_HOUR,
     SENSOR_POWER_CONSUMPTION_PREVIOUS_HOUR,
     SENSOR_POWER_CONSUMPTION_TODAY,
+    SENSOR_POWER_CONSUMPTION_TOTAL,
     SENSOR_POWER_CONSUMPTION_YESTERDAY,
     SENSOR_POWER_PRODUCTION_CURRENT_HOUR,
     SENSOR_POWER_PRODUCTION_PREVIOUS_HOUR,
@@ -24,8 +47,18 @@ from plugwise.constants import (
     SWITCH_RELAY,
     HA_SWITCH,
     HA_SENSOR,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_MEDIUM,
     PULSES_PER_KW_SECOND,
 )
+from plugwise.history import (
+    EnergyIndex,
+    EnergyIntegrator,
+    PowerHistory,
+    hour_datetime,
+    hour_number,
+)
 from plugwise.node import PlugwiseNode
 
 from plugwise.message import PlugwiseMessage
@@ -35,6 +68,7 @@ from plugwise.messages.requests import (
     CircleClockSetRequest,
     CirclePowerBufferRequest,
     CirclePowerUsageRequest,
+    NodeMeasureIntervalRequest,
     CircleSwitchRelayRequest,
 )
 from plugwise.messages.responses import (
@@ -63,6 +97,7 @@ class PlugwiseCircle(PlugwiseNode):
             SENSOR_POWER_CONSUMPTION_PREVIOUS_HOUR["id"],
             SENSOR_POWER_CONSUMPTION_TODAY["id"],
             SENSOR_POWER_CONSUMPTION_YESTERDAY["id"],
+            SENSOR_POWER_CONSUMPTION_TOTAL["id"],
             SENSOR_POWER_PRODUCTION_CURRENT_HOUR["id"],
             # SENSOR_POWER_PRODUCTION_PREVIOUS_HOUR["id"],
             SENSOR_RSSI_IN["id"],
@@ -74,39 +109,100 @@ class PlugwiseCircle(PlugwiseNode):
         self.pulses_consumed_1h = None
         self.pulses_produced_1h = None
         self.calibration = False
+        self._calibration_requested = None
+        self._calibration_callbacks = {}
         self._gain_a = None
         self._gain_b = None
         self._off_noise = None
         self._off_tot = None
-        self.power_history = {}
+        self.energy_index = EnergyIndex(ENERGY_INDEX_HOURS)
+        self.power_history = PowerHistory(self.energy_index, self.stick.timezone_delta)
+        self._energy_index_loaded = False
+        self._energy_integrator = EnergyIntegrator(
+            self.stick.cache.get(self._cache_key(CACHE_ENERGY_TOTAL), None)
+        )
+        self._log_address_collected = self.stick.cache.get(
+            self._cache_key(CACHE_LOG_ADDRESS), None
+        )
+        self._log_addresses_missing = set()
+        self._log_backfill = []
+        self._log_sync_activity = None
+        self._power_log_callbacks = []
+        (
+            self._log_interval_consumption,
+            self._log_interval_production,
+        ) = self.stick.cache.get(
+            self._cache_key(CACHE_LOG_INTERVAL), (LOG_INTERVAL_DEFAULT, 0)
+        )
+        self._new_log_interval = None
+        self._log_buckets = {}
+        self._power_usage_callbacks = []
         self.power_consumption_prev_hour = None
         self.power_consumption_today = None
         self.power_consumption_yesterday = None
         self._clock_offset = None
-        self.get_clock(self.sync_clock)
-        self._request_calibration()
 
-    def _request_calibration(self, callback=None):
-        """Request calibration info"""
+    def _request_calibration(self, callback=None, key=None):
+        """
+        Request calibration info
+        Multiple requests are combined while a request is still expected to be answered,
+        waiting callbacks with the same key (default the callback itself) are executed once
+        """
+        if callback:
+            self._calibration_callbacks[callback if key is None else key] = callback
+        if self._calibration_requested and self._calibration_requested > (
+            datetime.now() - timedelta(seconds=MESSAGE_TIME_OUT * (MESSAGE_RETRY + 1))
+        ):
+            return
+        self._calibration_requested = datetime.now()
         self.stick.send(
             CircleCalibrationRequest(self.mac),
-            callback,
+            self._calibration_received,
+        )
+
+    def _calibration_received(self):
+        """Execute callbacks waiting for calibration info"""
+        self._calibration_requested = None
+        callbacks = list(self._calibration_callbacks.values())
+        self._calibration_callbacks = {}
+        for callback in callbacks:
+            callback()
+
+    def _calibration_request_dropped(self):
+        """Calibration request is given up, forget callbacks waiting for it"""
+        self.stick.logger.debug(
+            "Drop %s request(s) waiting for calibration of %s",
+            str(len(self._calibration_callbacks)),
+            self.get_mac(),
         )
+        self._calibration_requested = None
+        self._calibration_callbacks = {}
 
     def _request_switch(self, state, callback=None):
         """Request to switch relay state and request state info"""
         self.stick.send(
             CircleSwitchRelayRequest(self.mac, state),
             callback,
+            priority=PRIORITY_HIGH,
         )
 
     def update_power_usage(self, callback=None):
-        """Request power usage"""
+        """Request power usage, calibration info is requested first when unknown"""
+        if not self.calibration:
+            self._request_calibration(
+                lambda: self.update_power_usage(callback),
+                ("update_power_usage", callback),
+            )
+            return
         self.stick.send(
             CirclePowerUsageRequest(self.mac),
             callback,
         )
 
+    async def async_update_power_usage(self):
+        """ Request power usage and wait until it is received """
+        await wait_for_callback(self.update_power_usage, ASYNC_REQUEST_TIME_OUT)
+
     def _on_message(self, message):
         """
         Process received message
@@ -157,6 +253,49 @@ class PlugwiseCircle(PlugwiseNode):
         """ Switch relay """
         self._request_switch(state, callback)
 
+    async def async_set_relay_state(self, state: bool):
+        """ Switch relay and wait until it is acknowledged """
+        await wait_for_callback(
+            lambda callback: self.set_relay_state(state, callback),
+            ASYNC_REQUEST_TIME_OUT,
+        )
+
+    def set_log_interval(
+        self, consumption=LOG_INTERVAL_DEFAULT, production=0, callback=None
+    ) -> bool:
+        """
+        Set interval in minutes the node logs consumed and produced power.
+        Intervals must be a divider of 60 minutes, a production interval of 0 disables it.
+        Production is logged in the same interval as consumption, so the log buffers
+        of both alternate.
+        """
+        if not 0 < consumption <= 60 or 60 % consumption != 0:
+            self.stick.logger.warning(
+                "Invalid power log interval %s for %s, must be a divider of 60 minutes",
+                str(consumption),
+                self.get_mac(),
+            )
+            return False
+        # Production interval of 0 disables production logging
+        if production not in (0, consumption):
+            self.stick.logger.warning(
+                "Invalid production log interval %s for %s, must be 0 or %s minutes",
+                str(production),
+                self.get_mac(),
+                str(consumption),
+            )
+            return False
+        self._new_log_interval = (consumption, production)
+        self.stick.send(
+            NodeMeasureIntervalRequest(self.mac, consumption, production),
+            callback,
+        )
+        return True
+
+    def get_log_interval(self) -> tuple:
+        """Returns interval in minutes of logged consumption and production"""
+        return (self._log_interval_consumption, self._log_interval_production)
+
     def get_power_usage(self):
         """
         Returns power usage during the last second in Watts
@@ -205,6 +344,53 @@ class PlugwiseCircle(PlugwiseNode):
         """Total power consumption of yesterday in kWh"""
         return self.power_consumption_yesterday
 
+    def get_power_consumption_total(self):
+        """Total power consumption since counting started in kWh"""
+        return self._energy_integrator.total
+
+    def _save_energy_total(self):
+        """Persist state of total power consumption"""
+        self.stick.cache.set(
+            self._cache_key(CACHE_ENERGY_TOTAL), self._energy_integrator.state()
+        )
+
+    def energy_between(self, start: datetime, end: datetime) -> float:
+        """
+        Returns the logged power consumption in kWh of the hours
+        from start up to end (local time).
+        Only the most recent ENERGY_INDEX_HOURS hours are kept in memory,
+        older hours can be read from the energy store.
+        """
+        self._load_energy_index()
+        return self.energy_index.total(hour_number(start), hour_number(end))
+
+    def energy_per_day(self) -> dict:
+        """Returns logged power consumption in kWh for each day (local time)"""
+        self._load_energy_index()
+        return {
+            hour_datetime(day * 24).date(): energy
+            for day, energy in self.energy_index.days().items()
+        }
+
+    def energy_per_month(self) -> dict:
+        """Returns logged power consumption in kWh by (year, month) (local time)"""
+        self._load_energy_index()
+        return self.energy_index.months()
+
+    def _load_energy_index(self):
+        """Add history of energy store to index at first use"""
+        if self._energy_index_loaded:
+            return
+        self._energy_index_loaded = True
+        if self.stick.energy_store:
+            node_file = self.stick.energy_store.node(self.get_mac())
+            last_hour = node_file.end_hour()
+            first_hour = max(last_hour - ENERGY_INDEX_HOURS, node_file.first_hour())
+            self.energy_index.load(
+                hour_number(hour_datetime(first_hour) + self.stick.timezone_delta),
+                node_file.read(first_hour, last_hour),
+            )
+
     def _node_ack_response(self, message):
         """Process switch response message"""
         if message.ack_id == ACK_ON:
@@ -223,6 +409,23 @@ class PlugwiseCircle(PlugwiseNode):
                 )
                 self._relay_state = False
                 self.do_callback(SWITCH_RELAY["id"])
+        elif message.ack_id == ACK_POWER_LOG_INTERVAL_SET:
+            if self._new_log_interval:
+                self.stick.logger.info(
+                    "Power log interval of %s set to %s (consumption) and %s (production) minutes",
+                    self.get_mac(),
+                    str(self._new_log_interval[0]),
+                    str(self._new_log_interval[1]),
+                )
+                (
+                    self._log_interval_consumption,
+                    self._log_interval_production,
+                ) = self._new_log_interval
+                self._new_log_interval = None
+                self.stick.cache.set(
+                    self._cache_key(CACHE_LOG_INTERVAL),
+                    [self._log_interval_consumption, self._log_interval_production],
+                )
         else:
             self.stick.logger.debug(
                 "Unmanaged _node_ack_response %s received for %s",
@@ -293,6 +496,55 @@ class PlugwiseCircle(PlugwiseNode):
             )
         self.pulses_produced_1h = message.pulse_hour_produced.value
         self.do_callback(SENSOR_POWER_PRODUCTION_CURRENT_HOUR["id"])
+        # Total power consumption
+        if message.timestamp != None and self.calibration:
+            total = self._energy_integrator.total
+            if self._energy_integrator.update(
+                message.timestamp,
+                self.get_power_consumption_current_hour(),
+                self.get_power_usage_8_sec(),
+            ):
+                self._save_energy_total()
+            if self._energy_integrator.total != total:
+                self.do_callback(SENSOR_POWER_CONSUMPTION_TOTAL["id"])
+        if self._power_usage_callbacks:
+            self._do_record_callbacks(
+                self._power_usage_callbacks,
+                self.get_mac(),
+                message.timestamp,
+                self.get_power_usage(),
+                self.get_power_usage_8_sec(),
+                self.get_power_consumption_current_hour(),
+                self.get_power_production_current_hour(),
+            )
+
+    def subscribe_power_usage(self, callback):
+        """
+        Subscribe callback to execute for every power usage update.
+        Callback is called with mac, timestamp, power usage of last second
+        and last 8 seconds in Watts and consumption and production of current hour in kWh
+        """
+        if callback not in self._power_usage_callbacks:
+            self._power_usage_callbacks.append(callback)
+
+    def unsubscribe_power_usage(self, callback):
+        """ Unsubscribe callback of power usage updates """
+        if callback in self._power_usage_callbacks:
+            self._power_usage_callbacks.remove(callback)
+
+    def _do_record_callbacks(self, callbacks, *args):
+        """ Execute power record callbacks with given arguments """
+        for callback in list(callbacks):
+            if self.stick.callback_executor:
+                self.stick.callback_executor.submit(self.get_mac(), callback, *args)
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                self.stick.logger.error(
+                    "Error while executing power record callback : %s",
+                    e,
+                )
 
     def _response_calibration(self, message):
         """Store calibration properties"""
@@ -321,72 +573,225 @@ class PlugwiseCircle(PlugwiseNode):
             calc_value = 0.0
         return calc_value
 
-    def _request_power_buffer(self, log_address=None, callback=None):
-        """Request power log of specified address"""
-        if log_address == None:
-            log_address = self._last_log_address
-        if log_address != None:
-            if bool(self.power_history):
-                # Only request last 2 power buffer logs
-                self.stick.send(
-                    CirclePowerBufferRequest(self.mac, log_address - 1),
-                )
-                self.stick.send(
-                    CirclePowerBufferRequest(self.mac, log_address),
-                    callback,
-                )
-            else:
-                # Collect power history info of today and yesterday
-                # Each request contains 4 hours except last request
-                for req_log_address in range(log_address - 13, log_address):
-                    self.stick.send(
-                        CirclePowerBufferRequest(self.mac, req_log_address),
+    def pulses_to_kWs_array(self, pulses, seconds=1) -> array:
+        """
+        converts a sequence of pulse counts to kWs using the calibration offsets
+        returns the same values as pulses_to_kWs() in an array of doubles
+        """
+        if not self.calibration:
+            return array("d", [0.0]) * len(pulses)
+        if numpy is None:
+            off_noise = self._off_noise
+            gain_a = self._gain_a
+            gain_b = self._gain_b
+            off_tot = self._off_tot
+            result = array("d", [0.0]) * len(pulses)
+            for i, value in enumerate(pulses):
+                if value == 0:
+                    continue
+                pulses_per_s = value / float(seconds)
+                corrected_pulses = seconds * (
+                    (
+                        (((pulses_per_s + off_noise) ** 2) * gain_b)
+                        + ((pulses_per_s + off_noise) * gain_a)
                     )
-                self.stick.send(
-                    CirclePowerBufferRequest(self.mac, log_address),
-                    callback,
+                    + off_tot
                 )
+                calc_value = corrected_pulses / PULSES_PER_KW_SECOND / seconds
+                if calc_value >= 0.001 or calc_value <= -0.001:
+                    result[i] = calc_value
+            return result
+        values = numpy.asarray(pulses, dtype=numpy.float64)
+        pulses_per_s = values / float(seconds)
+        # float_power uses pow() like the scalar path, ** 2 would multiply instead
+        corrected_pulses = seconds * (
+            (
+                (numpy.float_power(pulses_per_s + self._off_noise, 2) * self._gain_b)
+                + ((pulses_per_s + self._off_noise) * self._gain_a)
+            )
+            + self._off_tot
+        )
+        calc_values = corrected_pulses / PULSES_PER_KW_SECOND / seconds
+        # Fix minor miscalculations
+        calc_values[(values == 0) | (numpy.abs(calc_values) < 0.001)] = 0.0
+        result = array("d")
+        result.frombytes(calc_values.tobytes())
+        return result
+
+    def _request_power_buffer(
+        self, log_address=None, callback=None, priority=PRIORITY_MEDIUM
+    ):
+        """
+        Request power log of specified address
+        or collect all log addresses not collected yet
+        """
+        if not self.calibration:
+            self._request_calibration(
+                lambda: self._request_power_buffer(log_address, callback, priority),
+                ("request_power_buffer", log_address, callback, priority),
+            )
+            return
+        if log_address != None:
+            self.stick.send(
+                CirclePowerBufferRequest(self.mac, log_address),
+                callback,
+                priority=priority,
+            )
+            return
+        if self._last_log_address == None or self._log_sync_active():
+            return
+        last_address = self._last_log_address
+        # Log addresses cover less time when logging more often than once an hour,
+        # production is logged in the same interval as consumption
+        factor = 60 // self._log_interval_consumption
+        if self._log_interval_production:
+            factor *= 2
+        if (
+            self._log_address_collected == None
+            or self._log_address_collected >= last_address
+        ):
+            # Nothing collected before or log memory of node is reset
+            first_address = last_address - LOG_SYNC_INITIAL * factor + 1
+        else:
+            first_address = self._log_address_collected + 1
+        if len(self.energy_index) == 0:
+            # Collect power history info of today and yesterday
+            first_address = min(
+                first_address, last_address - LOG_SYNC_INITIAL * factor + 1
+            )
+        first_address = max(
+            first_address, last_address - LOG_SYNC_MAX_BACKFILL * factor + 1, 0
+        )
+        log_addresses = list(range(first_address, last_address + 1))
+        self._log_addresses_missing = set(log_addresses)
+        self._log_sync_activity = datetime.now()
+        # Most recent logs first, older logs in chunks at background priority
+        self._log_backfill = log_addresses[:-LOG_SYNC_RECENT]
+        for req_log_address in log_addresses[-LOG_SYNC_RECENT:-1]:
+            self.stick.send(
+                CirclePowerBufferRequest(self.mac, req_log_address),
+            )
+        self.stick.send(
+            CirclePowerBufferRequest(self.mac, last_address),
+            callback,
+        )
+        self._request_log_backfill()
+
+    def _request_log_backfill(self):
+        """Request next chunk of older log addresses at low priority"""
+        if not self._log_backfill:
+            return
+        chunk = self._log_backfill[:LOG_SYNC_CHUNK]
+        self._log_backfill = self._log_backfill[LOG_SYNC_CHUNK:]
+        self.stick.logger.debug(
+            "Collect power log addresses %s to %s of %s",
+            str(chunk[0]),
+            str(chunk[-1]),
+            self.get_mac(),
+        )
+        for req_log_address in chunk[:-1]:
+            self.stick.send(
+                CirclePowerBufferRequest(self.mac, req_log_address),
+                priority=PRIORITY_LOW,
+            )
+        self.stick.send(
+            CirclePowerBufferRequest(self.mac, chunk[-1]),
+            self._request_log_backfill,
+            priority=PRIORITY_LOW,
+        )
+
+    def _log_sync_active(self) -> bool:
+        """Return True if log addresses are still expected to be received"""
+        if not self._log_addresses_missing or self._log_sync_activity == None:
+            return False
+        return self._log_sync_activity > (
+            datetime.now() - timedelta(seconds=LOG_SYNC_TIMEOUT)
+        )
+
+    def _log_address_received(self, log_address):
+        """Keep track of highest log address collected without any gaps"""
+        self._log_sync_activity = datetime.now()
+        self._log_addresses_missing.discard(log_address)
+        if self._last_log_address == None or log_address >= self._last_log_address:
+            # Last log address is still being filled by the node
+            return
+        if self._log_addresses_missing:
+            collected = min(self._log_addresses_missing) - 1
+        else:
+            collected = self._last_log_address - 1
+        collected = min(collected, self._last_log_address - 1)
+        if (
+            self._log_address_collected == None
+            or collected > self._log_address_collected
+            # Log memory of node is reset, start collecting again
+            or self._log_address_collected >= self._last_log_address
+        ):
+            self._log_address_collected = collected
+            self.stick.cache.set(self._cache_key(CACHE_LOG_ADDRESS), collected)
+
+    def subscribe_power_log(self, callback):
+        """
+        Subscribe callback to execute for every power log address received.
+        Callback is called with mac, log address and a list of (timestamp, kWh) tuples
+        """
+        if callback not in self._power_log_callbacks:
+            self._power_log_callbacks.append(callback)
+
+    def unsubscribe_power_log(self, callback):
+        """ Unsubscribe callback of power log addresses """
+        if callback in self._power_log_callbacks:
+            self._power_log_callbacks.remove(callback)
 
     def _response_power_buffer(self, message):
         """returns information about historical power usage
-        each response contains 4 log buffers and each log buffer contains data for 1 hour
+        each response contains 4 log buffers and each log buffer contains data
+        for 1 log interval (default 1 hour)
         """
         if message.logaddr.value == self._last_log_address:
             self._last_log_collected = True
+        self._log_address_received(message.logaddr.value)
         # Collect logged power usage
+        log_records = []
+        total_corrected = False
+        seconds = self._log_interval_consumption * 60
         for i in range(1, 5):
+            if self._log_interval_production and i % 2 == 0:
+                # Produced power of the interval of the previous log buffer
+                continue
             if getattr(message, "logdate%d" % (i,)).value != None:
                 dt = getattr(message, "logdate%d" % (i,)).value
-                if getattr(message, "pulses%d" % (i,)).value == 0:
-                    self.power_history[dt] = 0.0
+                pulses = getattr(message, "pulses%d" % (i,)).value
+                if pulses == 0:
+                    energy = 0.0
                 else:
-                    self.power_history[dt] = self.pulses_to_kWs(
-                        getattr(message, "pulses%d" % (i,)).value, 3600
+                    energy = self.pulses_to_kWs(pulses, seconds) * (seconds / 3600)
+                log_records.append((dt, energy))
+                # Log is stored at end of the interval
+                (hour_start, hour_energy) = self._log_hour_energy(
+                    dt - timedelta(seconds=seconds), energy
+                )
+                hour = hour_number(hour_start + self.stick.timezone_delta)
+                self.energy_index.set(hour, hour_energy)
+                if self._energy_integrator.hour_logged(hour, hour_energy):
+                    total_corrected = True
+                if self.stick.energy_store:
+                    self.stick.energy_store.write(
+                        self.get_mac(), hour_start, hour_energy
                     )
-        # Cleanup history for more than 2 day's ago
-        if len(self.power_history.keys()) > 48:
-            for dt in list(self.power_history.keys()):
-                if (dt + self.stick.timezone_delta - timedelta(hours=1)).date() < (
-                    datetime.now().today().date() - timedelta(days=1)
-                ):
-                    del self.power_history[dt]
+        if total_corrected:
+            self._save_energy_total()
+            self.do_callback(SENSOR_POWER_CONSUMPTION_TOTAL["id"])
+        self._do_record_callbacks(
+            self._power_log_callbacks,
+            self.get_mac(),
+            message.logaddr.value,
+            log_records,
+        )
         # Recalculate power use counters
-        last_hour_usage = 0
-        today_power = 0
-        yesterday_power = 0
-        for dt in self.power_history:
-            if (dt + self.stick.timezone_delta) == datetime.now().today().replace(
-                minute=0, second=0, microsecond=0
-            ):
-                last_hour_usage = self.power_history[dt]
-            if (
-                dt + self.stick.timezone_delta - timedelta(hours=1)
-            ).date() == datetime.now().today().date():
-                today_power += self.power_history[dt]
-            if (dt + self.stick.timezone_delta - timedelta(hours=1)).date() == (
-                datetime.now().today().date() - timedelta(days=1)
-            ):
-                yesterday_power += self.power_history[dt]
+        current_hour = hour_number(datetime.now())
+        last_hour_usage = self.energy_index.get(current_hour - 1, 0)
+        today_power = self.energy_index.day_total(current_hour // 24)
+        yesterday_power = self.energy_index.day_total(current_hour // 24 - 1)
         if self.power_consumption_prev_hour != last_hour_usage:
             self.power_consumption_prev_hour = last_hour_usage
             self.do_callback(SENSOR_POWER_CONSUMPTION_PREVIOUS_HOUR["id"])
@@ -397,6 +802,29 @@ class PlugwiseCircle(PlugwiseNode):
             self.power_consumption_yesterday = yesterday_power
             self.do_callback(SENSOR_POWER_CONSUMPTION_YESTERDAY["id"])
 
+    def _log_hour_energy(self, log_start, energy) -> tuple:
+        """
+        Return start and total energy of the hour of a log interval
+        When logging more often than once an hour the intervals of an hour are combined
+        """
+        interval = self._log_interval_consumption
+        if interval >= 60:
+            return (log_start, energy)
+        self._log_buckets[log_start] = energy
+        hour_start = log_start.replace(minute=0, second=0, microsecond=0)
+        hour_energy = 0.0
+        for minutes in range(0, 60, interval):
+            hour_energy += self._log_buckets.get(
+                hour_start + timedelta(minutes=minutes), 0.0
+            )
+        # Keep intervals of last 2 days to combine
+        if len(self._log_buckets) > 4 * 24 * 60 // interval:
+            oldest = max(self._log_buckets) - timedelta(days=2)
+            for bucket_start in list(self._log_buckets):
+                if bucket_start < oldest:
+                    del self._log_buckets[bucket_start]
+        return (hour_start, hour_energy)
+
     def _response_clock(self, message):
         dt = datetime(
             datetime.now().year,
@@ -419,13 +847,18 @@ class PlugwiseCircle(PlugwiseNode):
             str(self._clock_offset),
         )
 
-    def get_clock(self, callback=None):
+    def get_clock(self, callback=None, priority=PRIORITY_MEDIUM):
         """ get current datetime of internal clock of Circle """
         self.stick.send(
             CircleClockGetRequest(self.mac),
             callback,
+            priority=priority,
         )
 
+    def validate_clock(self):
+        """Request internal clock at low priority and resync it when drifted"""
+        self.get_clock(self.sync_clock, PRIORITY_LOW)
+
     def set_clock(self, callback=None):
         """ set internal clock of CirclePlus """
         self.stick.send(
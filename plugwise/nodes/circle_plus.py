@@ -4,7 +4,14 @@ Use of this source code is governed by the MIT license found in the LICENSE file
 Plugwise Circle+ node object
 """
 from datetime import datetime
-from plugwise.constants import MAX_TIME_DRIFT, UTF8_DECODE
+from plugwise.constants import (
+    CACHE_SCAN_BITMAP,
+    CIRCLE_PLUS_ADDRESSES,
+    MAX_TIME_DRIFT,
+    PRIORITY_LOW,
+    PRIORITY_MEDIUM,
+    UTF8_DECODE,
+)
 from plugwise.message import PlugwiseMessage
 from plugwise.messages.requests import (
     CirclePlusRealTimeClockGetRequest,
@@ -24,11 +31,15 @@ class PlugwiseCirclePlus(PlugwiseCircle):
     def __init__(self, mac, address, stick):
         super().__init__(mac, address, stick)
         self._plugwise_nodes = {}
-        self._scan_response = {}
         self._scan_for_nodes_callback = None
+        self._scan_new_node_callback = None
+        self._scan_occupied = 0
+        self._scan_pending = 0
+        self._scan_verify = 0
+        self._scan_requested = 0
+        self._scan_resent = 0
         self._print_progress = False
         self._realtime_clock_offset = None
-        self.get_real_time_clock(self.sync_realtime_clock)
 
     def _circle_plus_message(self, message):
         """
@@ -45,81 +56,146 @@ class PlugwiseCirclePlus(PlugwiseCircle):
                 self.get_mac(),
             )
 
-    def scan_for_nodes(self, callback=None):
-        """ Scan for registered nodes """
+    def scan_for_nodes(self, callback=None, new_node_callback=None):
+        """
+        Scan for registered nodes
+
+        Addresses known to be in use (cached from previous scan) are requested first.
+        The callback is executed as soon as these are confirmed. The remaining
+        empty addresses are verified afterwards using low priority requests.
+        Nodes found during this verification are passed to new_node_callback.
+        """
         self._scan_for_nodes_callback = callback
-        for node_address in range(0, 64):
-            self.stick.send(CirclePlusScanRequest(self.mac, node_address))
-            self._scan_response[node_address] = False
+        self._scan_new_node_callback = new_node_callback
+        self._plugwise_nodes = {}
+        all_addresses = (1 << CIRCLE_PLUS_ADDRESSES) - 1
+        self._scan_occupied = self.stick.cache.get(
+            self._cache_key(CACHE_SCAN_BITMAP), None
+        )
+        if self._scan_occupied is None:
+            # No previous scan result, all addresses are required
+            self._scan_pending = all_addresses
+            self._scan_verify = 0
+            self._scan_occupied = 0
+        else:
+            self._scan_pending = self._scan_occupied & all_addresses
+            self._scan_verify = all_addresses & ~self._scan_pending
+        self._scan_requested = self._scan_pending | self._scan_verify
+        self._scan_resent = 0
+        for node_address in range(0, CIRCLE_PLUS_ADDRESSES):
+            if self._scan_pending & (1 << node_address):
+                self.stick.send(CirclePlusScanRequest(self.mac, node_address))
+        for node_address in range(0, CIRCLE_PLUS_ADDRESSES):
+            if self._scan_verify & (1 << node_address):
+                self.stick.send(
+                    CirclePlusScanRequest(self.mac, node_address),
+                    priority=PRIORITY_LOW,
+                )
+        if not self._scan_pending:
+            self._scan_finished()
+
+    def scan_progress(self) -> dict:
+        """ Return number of scan responses received of requested addresses """
+        requested = bin(self._scan_requested).count("1")
+        return {
+            "requested": requested,
+            "received": requested
+            - bin(self._scan_pending | self._scan_verify).count("1"),
+        }
+
+    def _scan_finished(self):
+        """ All addresses known to be in use are confirmed """
+        if self._scan_for_nodes_callback:
+            self._scan_for_nodes_callback(self._plugwise_nodes)
+            self._scan_for_nodes_callback = None
+
+    def _scan_request_dropped(self, node_address):
+        """
+        Resend scan request of address once after it is dropped,
+        give up on the address when it is dropped again
+        """
+        address_bit = 1 << node_address
+        if (self._scan_pending | self._scan_verify) & address_bit and not (
+            self._scan_resent & address_bit
+        ):
+            self._scan_resent |= address_bit
+            self.stick.logger.debug(
+                "Resend dropped scan request for address %s",
+                str(node_address),
+            )
+            self.stick.send(
+                CirclePlusScanRequest(self.mac, node_address),
+                priority=PRIORITY_MEDIUM
+                if self._scan_pending & address_bit
+                else PRIORITY_LOW,
+            )
+            return
+        if self._scan_pending & address_bit:
+            self._scan_pending &= ~address_bit
+            if not self._scan_pending:
+                self._scan_finished()
+        else:
+            self._scan_verify &= ~address_bit
+        self._scan_update_cache()
 
     def _process_scan_response(self, message):
         """ Process scan response message """
-        self.stick.logger.debug(
-            "Process scan response for address %s", message.node_address.value
-        )
+        node_address = message.node_address.value
+        self.stick.logger.debug("Process scan response for address %s", node_address)
+        if not 0 <= node_address < CIRCLE_PLUS_ADDRESSES:
+            return
+        address_bit = 1 << node_address
+        node_mac = None
         if message.node_mac.value != b"FFFFFFFFFFFFFFFF":
+            node_mac = message.node_mac.value.decode(UTF8_DECODE)
             if self.stick.print_progress:
                 print(
                     "Scan at address "
-                    + str(message.node_address.value)
+                    + str(node_address)
                     + " => node found with mac "
-                    + message.node_mac.value.decode(UTF8_DECODE)
+                    + node_mac
                 )
             self.stick.logger.debug(
                 "Linked plugwise node with mac %s found",
-                message.node_mac.value.decode(UTF8_DECODE),
+                node_mac,
             )
-            if (
-                message.node_mac.value.decode(UTF8_DECODE)
-                not in self._plugwise_nodes.keys()
-            ):
-                self._plugwise_nodes[
-                    message.node_mac.value.decode(UTF8_DECODE)
-                ] = message.node_address.value
+            self._scan_occupied |= address_bit
         else:
             if self.stick.print_progress:
-                print(
-                    "Scan at address "
-                    + str(message.node_address.value)
-                    + " => no node found"
-                )
-        if self._scan_for_nodes_callback:
-            # Check if scan is complete before execute callback
-            scan_complete = False
-            self._scan_response[message.node_address.value] = True
-            for node_address in range(0, 64):
-                if not self._scan_response[node_address]:
-                    if node_address < message.node_address.value:
-                        # Apparently missed response so send new scan request if it's not in queue yet
-                        request_not_in_queue = True
-                        for msg_request in list(self.stick.expected_responses.values()):
-                            if isinstance(msg_request[1], CirclePlusScanRequest):
-                                if msg_request[1].node_address == node_address:
-                                    request_not_in_queue = False
-                                    break
-                        if request_not_in_queue:
-                            self.stick.logger.debug(
-                                "Resend missing scan request for address %s",
-                                str(node_address),
-                            )
-                            self.stick.send(
-                                CirclePlusScanRequest(self.mac, node_address)
-                            )
-                    break
-                elif node_address == 63:
-                    scan_complete = True
-            if scan_complete and self._scan_for_nodes_callback:
-                self._scan_for_nodes_callback(self._plugwise_nodes)
-                self._scan_for_nodes_callback = None
-                self._plugwise_nodes = {}
-
-    def get_real_time_clock(self, callback=None):
+                print("Scan at address " + str(node_address) + " => no node found")
+            self._scan_occupied &= ~address_bit
+        if self._scan_pending & address_bit:
+            self._scan_pending &= ~address_bit
+            if node_mac and node_mac not in self._plugwise_nodes.keys():
+                self._plugwise_nodes[node_mac] = node_address
+            if not self._scan_pending:
+                self._scan_finished()
+        elif self._scan_verify & address_bit:
+            self._scan_verify &= ~address_bit
+            if node_mac and self._scan_new_node_callback:
+                self._scan_new_node_callback(node_mac, node_address)
+        self._scan_update_cache()
+
+    def _scan_update_cache(self):
+        """ Persist addresses in use when all addresses are scanned """
+        if not (self._scan_pending or self._scan_verify):
+            self.stick.cache.set(
+                self._cache_key(CACHE_SCAN_BITMAP), self._scan_occupied
+            )
+
+    def get_real_time_clock(self, callback=None, priority=PRIORITY_MEDIUM):
         """ get current datetime of internal clock of CirclePlus """
         self.stick.send(
             CirclePlusRealTimeClockGetRequest(self.mac),
             callback,
+            priority=priority,
         )
 
+    def validate_clock(self):
+        """Request both internal clocks at low priority and resync them when drifted"""
+        self.get_real_time_clock(self.sync_realtime_clock, PRIORITY_LOW)
+        super().validate_clock()
+
     def _response_realtime_clock(self, message):
         dt = datetime(
             datetime.now().year,
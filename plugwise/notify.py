@@ -0,0 +1,65 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Combine state changes of nodes into batched notifications
+"""
+import threading
+
+NOT_DELIVERED = object()
+
+
+class BatchNotifier(object):
+    """
+    Collect changed sensor values of all nodes during a time window
+    and deliver them in one call as a list of (mac, sensor, value) tuples.
+    Multiple changes of the same sensor within a window are combined into the last value.
+    The end of a window is scheduled with call_later, the call_later method of the stick.
+    """
+
+    def __init__(self, callback, window, call_later, executor=None):
+        self._callback = callback
+        self._window = window
+        self._call_later = call_later
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._changes = {}
+        self._delivered = {}
+        self._job = None
+
+    def add(self, mac, sensor, value):
+        """ Add sensor value to current batch when it is changed """
+        with self._lock:
+            if (mac, sensor) not in self._changes and (
+                self._delivered.get((mac, sensor), NOT_DELIVERED) == value
+            ):
+                return
+            self._changes[(mac, sensor)] = value
+            if self._job is None:
+                self._job = self._call_later(self._window, self._flush)
+
+    def cancel(self):
+        """ Stop pending notification """
+        with self._lock:
+            if self._job:
+                self._job.cancel()
+                self._job = None
+            self._changes = {}
+
+    def _flush(self):
+        """ Deliver collected changes """
+        with self._lock:
+            changes = [
+                (mac, sensor, value)
+                for ((mac, sensor), value) in self._changes.items()
+                if self._delivered.get((mac, sensor), NOT_DELIVERED) != value
+            ]
+            for (mac, sensor, value) in changes:
+                self._delivered[(mac, sensor)] = value
+            self._changes = {}
+            self._job = None
+        if not changes:
+            return
+        if self._executor:
+            self._executor.submit("batch", self._callback, changes)
+        else:
+            self._callback(changes)
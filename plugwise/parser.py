@@ -47,7 +47,7 @@ class PlugwiseParser(object):
         """
         Add new incoming data to buffer and try to process
         """
-        self.stick.logger.debug("Feed data: %s", str(data))
+        self.stick.logger.debug("Feed data: %s", data)
         self._buffer += data
         if len(self._buffer) >= 8:
             if not self._parsing:
@@ -70,37 +70,37 @@ class PlugwiseParser(object):
         """
         Process next set of packet data
         """
-        self.stick.logger.debug("Parse data: %s ", str(self._buffer))
+        self.stick.logger.debug("Parse data: %s ", self._buffer)
         if self._parsing == False:
             self._parsing = True
 
             # Lookup header of message in buffer
             self.stick.logger.debug(
                 "Lookup message header (%s) in (%s)",
-                str(MESSAGE_HEADER),
-                str(self._buffer),
+                MESSAGE_HEADER,
+                self._buffer,
             )
             header_index = self._buffer.find(MESSAGE_HEADER)
             if header_index == -1:
                 self.stick.logger.debug("No valid message header found yet")
             else:
                 self.stick.logger.debug(
-                    "Valid message header found at index %s", str(header_index)
+                    "Valid message header found at index %s", header_index
                 )
                 self._buffer = self._buffer[header_index:]
 
                 # Header available, lookup footer of message in buffer
                 self.stick.logger.debug(
                     "Lookup message footer (%s) in (%s)",
-                    str(MESSAGE_FOOTER),
-                    str(self._buffer),
+                    MESSAGE_FOOTER,
+                    self._buffer,
                 )
                 footer_index = self._buffer.find(MESSAGE_FOOTER)
                 if footer_index == -1:
                     self.stick.logger.debug("No valid message footer found yet")
                 else:
                     self.stick.logger.debug(
-                        "Valid message footer found at index %s", str(footer_index)
+                        "Valid message footer found at index %s", footer_index
                     )
                     seq_id = self._buffer[8:12]
                     # First check for known sequence ID's
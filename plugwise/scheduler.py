@@ -0,0 +1,151 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Run timed jobs from a single thread
+"""
+import heapq
+from itertools import count
+import logging
+import threading
+import time
+
+
+class ScheduledJob(object):
+    """ Job scheduled once or at a fixed interval """
+
+    def __init__(self, scheduler, interval, callback, args):
+        self.scheduler = scheduler
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.deadline = None
+        self.cancelled = False
+
+    def cancel(self):
+        """ Do not execute job anymore """
+        self.cancelled = True
+
+    def reschedule(self, delay):
+        """ Execute job after delay seconds instead of at its current deadline """
+        self.scheduler._schedule(self, time.monotonic() + delay)
+
+
+class Scheduler(object):
+    """
+    Execute jobs at their deadline from one thread.
+
+    Deadlines are kept in a heap and the thread sleeps until the first
+    deadline or until a job with an earlier deadline is added.
+    Jobs should return quickly as they delay all other jobs.
+    """
+
+    def __init__(self, name="scheduler_thread"):
+        self.logger = logging.getLogger("python-plugwise")
+        self._name = name
+        self._condition = threading.Condition()
+        self._heap = []
+        self._counter = count()
+        self._thread = None
+        self._run = False
+        self.wakeups = 0
+        self.jobs_executed = 0
+        self.max_delay = 0.0
+
+    def start(self):
+        """ Start scheduler thread """
+        if self._thread:
+            return
+        self._run = True
+        self._thread = threading.Thread(None, self._loop, self._name, (), {})
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop scheduler thread, jobs not executed yet are dropped """
+        with self._condition:
+            self._run = False
+            self._heap = []
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def call_later(self, delay, callback, *args) -> ScheduledJob:
+        """ Execute callback once after delay seconds """
+        job = ScheduledJob(self, None, callback, args)
+        self._schedule(job, time.monotonic() + delay)
+        return job
+
+    def call_every(self, interval, callback, *args, delay=None) -> ScheduledJob:
+        """
+        Execute callback every interval seconds, first after delay seconds
+        (default interval). The interval of the returned job can be changed.
+        """
+        job = ScheduledJob(self, interval, callback, args)
+        self._schedule(job, time.monotonic() + (interval if delay is None else delay))
+        return job
+
+    def pending(self) -> int:
+        """ Return number of scheduled jobs """
+        with self._condition:
+            return len(
+                [
+                    job
+                    for (deadline, _, job) in self._heap
+                    if not job.cancelled and job.deadline == deadline
+                ]
+            )
+
+    def metrics(self) -> dict:
+        """ Return scheduler counters """
+        return {
+            "jobs": self.pending(),
+            "wakeups": self.wakeups,
+            "jobs_executed": self.jobs_executed,
+            "max_delay": self.max_delay,
+        }
+
+    def _schedule(self, job, deadline):
+        """ Add job to heap and wake up thread when it is the first one """
+        with self._condition:
+            job.deadline = deadline
+            heapq.heappush(self._heap, (deadline, next(self._counter), job))
+            if self._heap[0][2] is job:
+                self._condition.notify()
+
+    def _loop(self):
+        """ Sleep until first deadline and execute due jobs """
+        while True:
+            with self._condition:
+                while self._run and (
+                    not self._heap or self._heap[0][0] > time.monotonic()
+                ):
+                    if self._heap:
+                        self._condition.wait(self._heap[0][0] - time.monotonic())
+                    else:
+                        self._condition.wait()
+                    self.wakeups += 1
+                if not self._run:
+                    return
+                (deadline, _, job) = heapq.heappop(self._heap)
+                if job.cancelled or job.deadline != deadline:
+                    # Cancelled or rescheduled job
+                    continue
+            delay = time.monotonic() - deadline
+            if delay > self.max_delay:
+                self.max_delay = delay
+            try:
+                job.callback(*job.args)
+            except Exception as e:
+                self.logger.error(
+                    "Error while executing scheduled %s : %s",
+                    getattr(job.callback, "__name__", repr(job.callback)),
+                    e,
+                )
+            self.jobs_executed += 1
+            if job.interval and not job.cancelled and job.deadline == deadline:
+                # Keep fixed rate, but skip intervals missed
+                next_deadline = deadline + job.interval
+                if next_deadline < time.monotonic():
+                    next_deadline = time.monotonic() + job.interval
+                self._schedule(job, next_deadline)
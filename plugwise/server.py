@@ -0,0 +1,322 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Share one Plugwise stick with multiple local clients
+"""
+import argparse
+import logging
+import os
+import queue
+import selectors
+import socket
+import threading
+import time
+from plugwise.constants import (
+    ACK_SUCCESS,
+    ACK_ERROR,
+    MESSAGE_FOOTER,
+    MESSAGE_HEADER,
+    SERVER_ACK_TIMEOUT,
+    SERVER_QUEUE_SIZE,
+    UTF8_DECODE,
+)
+from plugwise.connections.serial import PlugwiseUSBConnection
+from plugwise.connections.socket import SocketConnection
+from plugwise.util import crc_fun, inc_seq_id
+
+# Sequence ids from FFFC are not related to a request
+FIXED_SEQ_ID = 65532
+
+
+def split_frames(buffer):
+    """ Return list of complete messages in buffer and the remaining data """
+    frames = []
+    while True:
+        header_index = buffer.find(MESSAGE_HEADER)
+        if header_index == -1:
+            return (frames, buffer[-(len(MESSAGE_HEADER) - 1) :])
+        footer_index = buffer.find(MESSAGE_FOOTER, header_index)
+        if footer_index == -1:
+            return (frames, buffer[header_index:])
+        frames.append(buffer[header_index : footer_index + len(MESSAGE_FOOTER)])
+        buffer = buffer[footer_index + len(MESSAGE_FOOTER) :]
+
+
+def replace_seq_id(frame, seq_id):
+    """ Return message with given sequence id and recalculated checksum """
+    body = (
+        frame[len(MESSAGE_HEADER) : 8] + seq_id + frame[12 : -4 - len(MESSAGE_FOOTER)]
+    )
+    checksum = bytes("%04X" % crc_fun(body), UTF8_DECODE)
+    return MESSAGE_HEADER + body + checksum + MESSAGE_FOOTER
+
+
+class RawMessage(object):
+    """ Serialized message forwarded to the stick unchanged """
+
+    def __init__(self, frame):
+        self._frame = frame
+
+    def serialize(self):
+        return self._frame
+
+
+class StickClient(object):
+    """ Connected client with its own sequence ids """
+
+    def __init__(self, server, sock, name):
+        self.server = server
+        self.sock = sock
+        self.name = name
+        self.buffer = b""
+        self.last_seq_id = None
+        self.requests = 0
+        self.requests_waiting = 0
+        self.connected = True
+        self._lock = threading.Lock()
+
+    def next_seq_id(self) -> bytes:
+        """ Return sequence id the client expects for its next request """
+        if self.last_seq_id is None:
+            self.last_seq_id = b"0001"
+        else:
+            self.last_seq_id = inc_seq_id(self.last_seq_id)
+        return self.last_seq_id
+
+    def send(self, frame):
+        """ Send message to client """
+        with self._lock:
+            if not self.connected:
+                return
+            try:
+                self.sock.sendall(frame)
+            except OSError as e:
+                self.server.logger.info(
+                    "Failed to send to client %s : %s", self.name, e
+                )
+                self.connected = False
+
+
+class StickServer(object):
+    """
+    Owns the connection to one stick and shares it with clients connecting
+    to a TCP ("<host>:<port>") or Unix socket ("unix:<path>") address.
+
+    Requests of all clients are forwarded one at a time. The sequence id
+    acknowledged by the stick is mapped to the client, every client sees
+    its own consecutive sequence ids so it behaves like a dedicated stick.
+    Messages not related to a request (e.g. NodeAwakeResponse and
+    NodeSwitchGroupResponse) are sent to all clients.
+    """
+
+    def __init__(self, port, address):
+        self.logger = logging.getLogger("python-plugwise")
+        self.port = port
+        self.address = address
+        self.connection = None
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+        self._clients = []
+        self._requests = queue.Queue()
+        self._seq_ids = {}
+        self._buffer = b""
+        self._lock = threading.Lock()
+        self._pending = None
+        self._acknowledged = threading.Event()
+        self._run = False
+        self._threads = []
+
+    def start(self):
+        """ Connect to stick and accept clients """
+        if ":" in self.port:
+            self.connection = SocketConnection(self.port, self)
+        else:
+            self.connection = PlugwiseUSBConnection(self.port, self)
+        self.connection.connect()
+        self._listener = self._open_listener()
+        self._selector.register(self._listener, selectors.EVENT_READ, None)
+        self._run = True
+        for (target, name) in (
+            (self._socket_loop, "server_socket_thread"),
+            (self._forward_loop, "server_forward_thread"),
+        ):
+            thread = threading.Thread(None, target, name, (), {})
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """ Disconnect clients and stick """
+        self._run = False
+        self._requests.put(None)
+        # Stop waiting for acknowledge of forwarded request
+        self._acknowledged.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for client in list(self._clients):
+            self._remove_client(client)
+        self._selector.unregister(self._listener)
+        self._listener.close()
+        if self.address.startswith("unix:"):
+            os.unlink(self.address[5:])
+        self.connection.disconnect()
+
+    def clients(self) -> list:
+        """ Return name and number of forwarded requests of connected clients """
+        return [(client.name, client.requests) for client in self._clients]
+
+    def _open_listener(self):
+        """ Open listening socket """
+        if self.address.startswith("unix:"):
+            path = self.address[5:]
+            if os.path.exists(path):
+                os.unlink(path)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(path)
+        else:
+            (host, port) = self.address.rsplit(":", 1)
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((host, int(port)))
+        listener.listen()
+        listener.setblocking(False)
+        return listener
+
+    def _socket_loop(self):
+        """ Accept clients and collect their requests """
+        while self._run:
+            for (key, _) in self._selector.select(timeout=1):
+                if key.data is None:
+                    self._accept_client()
+                else:
+                    self._read_client(key.data)
+
+    def _accept_client(self):
+        """ Register new client """
+        (sock, address) = self._listener.accept()
+        client = StickClient(
+            self, sock, str(address) if address else "unix:" + str(sock.fileno())
+        )
+        self._selector.register(sock, selectors.EVENT_READ, client)
+        with self._lock:
+            self._clients.append(client)
+        self.logger.info("Client %s connected", client.name)
+
+    def _read_client(self, client):
+        """ Queue complete requests received from client """
+        try:
+            data = client.sock.recv(4096)
+        except OSError:
+            data = b""
+        if not data:
+            self._remove_client(client)
+            return
+        (frames, client.buffer) = split_frames(client.buffer + data)
+        for frame in frames:
+            with self._lock:
+                if client.requests_waiting >= SERVER_QUEUE_SIZE:
+                    self.logger.warning(
+                        "Drop request of client %s, too many requests waiting",
+                        client.name,
+                    )
+                    continue
+                client.requests_waiting += 1
+            self._requests.put((client, frame))
+
+    def _remove_client(self, client):
+        """ Close connection of client """
+        with self._lock:
+            if client not in self._clients:
+                return
+            self._clients.remove(client)
+        self._selector.unregister(client.sock)
+        client.connected = False
+        client.sock.close()
+        self.logger.info("Client %s disconnected", client.name)
+
+    def _forward_loop(self):
+        """ Forward requests to stick one at a time and wait for acknowledge """
+        while self._run:
+            request = self._requests.get()
+            if request is None:
+                return
+            (client, frame) = request
+            with self._lock:
+                client.requests_waiting -= 1
+            if not client.connected:
+                continue
+            self._acknowledged.clear()
+            with self._lock:
+                self._pending = client
+            client.requests += 1
+            self.connection.send(RawMessage(frame))
+            # The acknowledge does not identify the request, so the next request
+            # is forwarded after it is received or the stick has given up
+            if not self._acknowledged.wait(SERVER_ACK_TIMEOUT):
+                self.logger.info(
+                    "Stick did not acknowledge request of client %s", client.name
+                )
+            with self._lock:
+                self._pending = None
+
+    def feed_parser(self, data):
+        """ Route messages received from stick """
+        (frames, self._buffer) = split_frames(self._buffer + data)
+        for frame in frames:
+            self._route(frame)
+
+    def _route(self, frame):
+        """ Send message to client of request or to all clients """
+        seq_id = frame[8:12]
+        try:
+            fixed = int(seq_id, 16) >= FIXED_SEQ_ID
+        except ValueError:
+            return
+        if fixed:
+            for client in list(self._clients):
+                client.send(frame)
+            return
+        if (
+            len(frame) == 22
+            and frame[4:8] == b"0000"
+            and frame[12:16] in (ACK_SUCCESS, ACK_ERROR)
+        ):
+            # Stick acknowledges the request just forwarded
+            with self._lock:
+                (client, self._pending) = (self._pending, None)
+            if client is None:
+                self.logger.debug(
+                    "Drop acknowledge of seq_id %s without forwarded request",
+                    str(seq_id),
+                )
+                return
+            self._seq_ids[seq_id] = (client, client.next_seq_id())
+            self._acknowledged.set()
+        if seq_id in self._seq_ids:
+            (client, client_seq_id) = self._seq_ids[seq_id]
+            client.send(replace_seq_id(frame, client_seq_id))
+        else:
+            self.logger.debug("Drop message for unknown seq_id %s", str(seq_id))
+
+
+def main():
+    """ Run stick sharing server until interrupted """
+    parser = argparse.ArgumentParser(description="Share a Plugwise USB-stick")
+    parser.add_argument("port", help="serial port or <host>:<port> of stick")
+    parser.add_argument(
+        "address", help="listen at <host>:<port> or unix:<path> for clients"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = StickServer(args.port, args.address)
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
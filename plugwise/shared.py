@@ -0,0 +1,281 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Export of node state to shared memory for other processes
+"""
+from collections import namedtuple
+import math
+import os
+import struct
+import threading
+import time
+from plugwise.constants import (
+    SENSOR_POWER_CONSUMPTION_CURRENT_HOUR,
+    SENSOR_POWER_CONSUMPTION_TOTAL,
+    SENSOR_POWER_USE,
+    SENSOR_POWER_USE_LAST_8_SEC,
+    SHARED_STATE_READ_TIME_OUT,
+    SWITCH_RELAY,
+)
+from plugwise.exceptions import SharedStateError
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+# Layout of segment: header followed by fixed size records, all little endian.
+# Header: magic, layout version, record size, max nodes, nodes in use, writer pid
+HEADER = struct.Struct("<4sHHIII4x")
+MAGIC = b"PWSS"
+VERSION = 2
+# Record: sequence, mac, available, relay (-1 unknown), power 1s (W), power 8s (W),
+# consumption current hour (kWh), consumption total (kWh), update time (unix time)
+SEQUENCE = struct.Struct("<I")
+RECORD = struct.Struct("<I16s?b2xddddd")
+VALUES = struct.Struct("<16s?b2xddddd")
+
+NodeRecord = namedtuple(
+    "NodeRecord",
+    [
+        "mac",
+        "available",
+        "relay",
+        "power_1s",
+        "power_8s",
+        "power_consumption_hour",
+        "power_consumption_total",
+        "timestamp",
+    ],
+)
+
+
+def _record_offset(slot) -> int:
+    return HEADER.size + slot * RECORD.size
+
+
+def _float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _process_alive(pid) -> bool:
+    """ Return True if process with given pid is running """
+    if os.name != "posix":
+        # Segment is removed by the system when no process uses it anymore
+        return True
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Process of other user
+        return True
+    return True
+
+
+def _untrack(shm):
+    """ Stop resource tracker of this process from removing segment at exit """
+    if os.name == "posix":
+        # Segments are tracked by their POSIX name, which starts with a slash
+        resource_tracker.unregister("/" + shm.name, "shared_memory")
+
+
+class SharedStateWriter(object):
+    """
+    Publish state of nodes in a shared memory segment with one record per node.
+
+    Every record starts with a sequence number (seqlock) which is odd while
+    the record is written, so readers never see a partly updated record.
+    A slot is assigned to a node once and is not moved afterwards.
+    """
+
+    def __init__(self, name, max_nodes):
+        if shared_memory is None:
+            raise SharedStateError("Shared memory requires python 3.8 or newer")
+        self.name = name
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._max_nodes = max_nodes
+        try:
+            self._shm = shared_memory.SharedMemory(
+                name, create=True, size=_record_offset(max_nodes)
+            )
+        except FileExistsError:
+            self._remove_stale_segment(name)
+            self._shm = shared_memory.SharedMemory(
+                name, create=True, size=_record_offset(max_nodes)
+            )
+        self._write_header()
+
+    def _remove_stale_segment(self, name):
+        """
+        Remove segment left behind by a writer which did not close it,
+        raises SharedStateError when the segment is still in use
+        """
+        existing = shared_memory.SharedMemory(name)
+        magic, version, pid = None, None, 0
+        if existing.size >= HEADER.size:
+            magic, version, _, _, _, pid = HEADER.unpack_from(existing.buf, 0)
+        if magic != MAGIC or version != VERSION or _process_alive(pid):
+            existing.close()
+            # Not created by this process, prevent removal when this process exits
+            _untrack(existing)
+            raise SharedStateError(
+                "Shared memory segment '" + name + "' is in use by another process"
+            )
+        existing.close()
+        existing.unlink()
+
+    def _write_header(self):
+        """ Write header with number of nodes in use and pid of this process """
+        HEADER.pack_into(
+            self._shm.buf,
+            0,
+            MAGIC,
+            VERSION,
+            RECORD.size,
+            self._max_nodes,
+            len(self._slots),
+            os.getpid(),
+        )
+
+    def update(self, mac, state):
+        """ Write NodeState of node to its record """
+        sensors = state.sensors
+        relay = self._value(sensors, SWITCH_RELAY["id"])
+        with self._lock:
+            if self._shm is None:
+                return
+            slot = self._slots.get(mac)
+            if slot is None:
+                if len(self._slots) >= self._max_nodes:
+                    return
+                slot = len(self._slots)
+                self._slots[mac] = slot
+                self._write_header()
+            offset = _record_offset(slot)
+            (sequence,) = SEQUENCE.unpack_from(self._shm.buf, offset)
+            SEQUENCE.pack_into(self._shm.buf, offset, (sequence + 1) & 0xFFFFFFFF)
+            VALUES.pack_into(
+                self._shm.buf,
+                offset + SEQUENCE.size,
+                mac.encode("ascii"),
+                bool(state.available),
+                -1 if relay is None else int(relay),
+                _float(self._value(sensors, SENSOR_POWER_USE["id"])),
+                _float(self._value(sensors, SENSOR_POWER_USE_LAST_8_SEC["id"])),
+                _float(
+                    self._value(sensors, SENSOR_POWER_CONSUMPTION_CURRENT_HOUR["id"])
+                ),
+                _float(self._value(sensors, SENSOR_POWER_CONSUMPTION_TOTAL["id"])),
+                time.time(),
+            )
+            SEQUENCE.pack_into(self._shm.buf, offset, (sequence + 2) & 0xFFFFFFFF)
+
+    def remove(self, mac):
+        """ Clear record of removed node, its slot is not reused """
+        with self._lock:
+            if self._shm is None or mac not in self._slots:
+                return
+            offset = _record_offset(self._slots[mac])
+            (sequence,) = SEQUENCE.unpack_from(self._shm.buf, offset)
+            SEQUENCE.pack_into(self._shm.buf, offset, (sequence + 1) & 0xFFFFFFFF)
+            VALUES.pack_into(
+                self._shm.buf,
+                offset + SEQUENCE.size,
+                b"",
+                False,
+                -1,
+                math.nan,
+                math.nan,
+                math.nan,
+                math.nan,
+                time.time(),
+            )
+            SEQUENCE.pack_into(self._shm.buf, offset, (sequence + 2) & 0xFFFFFFFF)
+
+    def close(self):
+        """ Close and remove shared memory segment """
+        with self._lock:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = None
+
+    def _value(self, sensors, sensor):
+        """ Return value of sensor or None when unknown """
+        if sensor in sensors:
+            return sensors[sensor].value
+        return None
+
+
+class SharedStateReader(object):
+    """
+    Read node state published by a SharedStateWriter in another process.
+    Unknown values are returned as NaN, an unknown relay state as -1.
+    """
+
+    def __init__(self, name):
+        if shared_memory is None:
+            raise SharedStateError("Shared memory requires python 3.8 or newer")
+        try:
+            self._shm = shared_memory.SharedMemory(name)
+        except FileNotFoundError:
+            raise SharedStateError("Shared memory segment '" + name + "' not found")
+        # Segment is owned by the writer, prevent removal when this process exits
+        _untrack(self._shm)
+        magic, version, record_size, _, _, _ = HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise SharedStateError("Unknown layout of shared memory segment " + name)
+        self._slots = {}
+
+    def nodes(self) -> dict:
+        """ Return NodeRecord of all published nodes by mac """
+        (_, _, _, _, count, _) = HEADER.unpack_from(self._shm.buf, 0)
+        records = {}
+        for slot in range(count):
+            record = self._read(slot)
+            if record.mac:
+                self._slots[record.mac] = slot
+                records[record.mac] = record
+        return records
+
+    def node(self, mac):
+        """ Return NodeRecord of node or None when not published """
+        if mac not in self._slots:
+            self.nodes()
+        if mac in self._slots:
+            return self._read(self._slots[mac])
+        return None
+
+    def close(self):
+        """ Detach from shared memory segment """
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def _read(self, slot):
+        """
+        Return consistent copy of record, raises SharedStateError when
+        the record is still being written after SHARED_STATE_READ_TIME_OUT
+        """
+        offset = _record_offset(slot)
+        buf = self._shm.buf
+        end = time.monotonic() + SHARED_STATE_READ_TIME_OUT
+        while True:
+            (sequence,) = SEQUENCE.unpack_from(buf, offset)
+            if not sequence & 1:
+                record = RECORD.unpack_from(buf, offset)
+                (sequence_after,) = SEQUENCE.unpack_from(buf, offset)
+                if sequence_after == sequence:
+                    break
+            if time.monotonic() > end:
+                # Writer stopped while writing record
+                raise SharedStateError(
+                    "Record " + str(slot) + " of shared memory segment is not written"
+                )
+            time.sleep(0)
+        return NodeRecord(record[1].rstrip(b"\0").decode("ascii"), *record[2:])
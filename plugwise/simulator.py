@@ -0,0 +1,674 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Simulated stick and Plugwise network for tests and benchmarks
+"""
+import argparse
+from datetime import datetime
+import math
+import os
+import random
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+from plugwise.constants import (
+    ACK_CLOCK_SET,
+    ACK_OFF,
+    ACK_ON,
+    ACK_POWER_LOG_INTERVAL_SET,
+    ACK_REAL_TIME_CLOCK_SET,
+    ACK_SCAN_PARAMETERS_SET,
+    ACK_SENSE_INTERVAL_SET,
+    ACK_SLEEP_SET,
+    ACK_SUCCESS,
+    ACK_TIMEOUT,
+    LOGADDR_OFFSET,
+    MESSAGE_FOOTER,
+    MESSAGE_HEADER,
+    NODE_TYPE_CIRCLE,
+    NODE_TYPE_CIRCLE_PLUS,
+    NODE_TYPE_SCAN,
+    NODE_TYPE_SENSE,
+    PLUGWISE_EPOCH,
+    PULSES_PER_KW_SECOND,
+    SED_STAY_ACTIVE,
+    SENSE_HUMIDITY_MULTIPLIER,
+    SENSE_HUMIDITY_OFFSET,
+    SENSE_TEMPERATURE_MULTIPLIER,
+    SENSE_TEMPERATURE_OFFSET,
+    SIMULATOR_ACK_DELAY,
+    SIMULATOR_LATENCY,
+    SIMULATOR_LOG_HOURS,
+    SIMULATOR_NODE_TIME_OUT,
+    SIMULATOR_SED_INTERVAL,
+    UTF8_DECODE,
+)
+from plugwise.scheduler import Scheduler
+from plugwise.server import split_frames
+from plugwise.util import crc_fun, inc_seq_id
+
+STICK_MAC = "000D6F0000000000"
+NO_NODE_MAC = b"FFFFFFFFFFFFFFFF"
+NO_LOG = b"00000000"
+HOUR_SECONDS = 3600
+
+
+def build_frame(msg_id, seq_id, payload) -> bytes:
+    """ Return serialized message with checksum """
+    body = msg_id + seq_id + payload
+    return (
+        MESSAGE_HEADER
+        + body
+        + bytes("%04X" % crc_fun(body), UTF8_DECODE)
+        + MESSAGE_FOOTER
+    )
+
+
+def encode_datetime(dt) -> bytes:
+    """ Encode datetime as year, month and minutes since start of month """
+    minutes = (dt.day - 1) * 24 * 60 + dt.hour * 60 + dt.minute
+    return bytes(
+        "%02X%02X%04X" % (dt.year - PLUGWISE_EPOCH, dt.month, minutes), UTF8_DECODE
+    )
+
+
+def encode_log_address(log_address) -> bytes:
+    return bytes("%08X" % (log_address * 32 + LOGADDR_OFFSET), UTF8_DECODE)
+
+
+def encode_signed(value, length) -> bytes:
+    """ Encode integer as two's complement hex string """
+    return bytes("%0*X" % (length, value & ((1 << (length * 4)) - 1)), UTF8_DECODE)
+
+
+def encode_float(value) -> bytes:
+    return struct.pack("!f", value).hex().upper().encode(UTF8_DECODE)
+
+
+class SimulatedNode(object):
+    """ Node responding to requests after a random latency, with message loss """
+
+    NODE_TYPE = None
+    HW_MODEL = None
+
+    def __init__(self, network, mac, latency, loss):
+        self.network = network
+        self.mac = mac
+        self.latency = latency
+        self.loss = loss
+        self.rssi_in = network.random.randint(-80, -40)
+        self.rssi_out = network.random.randint(-80, -40)
+        self.requests = 0
+
+    def reachable(self) -> bool:
+        """ Return False when node does not receive the request """
+        return self.network.random.random() >= self.loss
+
+    def response_delay(self) -> float:
+        """ Return random delay before response """
+        return self.network.random.expovariate(1 / self.latency) if self.latency else 0
+
+    def handle(self, msg_id, args) -> list:
+        """
+        Return list of (msg_id, payload) responses to request,
+        payload of an acknowledge starts with the ack id followed by the mac.
+        """
+        mac = bytes(self.mac, UTF8_DECODE)
+        if msg_id == b"0023":
+            return [(b"0024", mac + self._info())]
+        if msg_id == b"000D":
+            return [
+                (
+                    b"000E",
+                    mac
+                    + encode_signed(self.rssi_in, 2)
+                    + encode_signed(self.rssi_out, 2)
+                    + bytes("%04X" % int(self.latency * 1000), UTF8_DECODE),
+                )
+            ]
+        if msg_id == b"005F":
+            return [(b"0060", mac + b"0" * 16)]
+        return []
+
+    def _info(self) -> bytes:
+        """ Return parameters of info response """
+        return (
+            encode_datetime(datetime.utcnow())
+            + encode_log_address(0)
+            + b"00"
+            + b"85"
+            + bytes("0000" + self.HW_MODEL + "00", UTF8_DECODE)
+            + b"%08X" % 1262304000
+            + bytes("%02X" % self.NODE_TYPE, UTF8_DECODE)
+        )
+
+
+class SimulatedCircle(SimulatedNode):
+    """
+    Circle with a relay and a power usage following a sine curve.
+    The power log contains the energy of every hour since log_hours ago.
+    """
+
+    NODE_TYPE = NODE_TYPE_CIRCLE
+    HW_MODEL = "070140"
+
+    def __init__(self, network, mac, latency, loss, log_hours):
+        super().__init__(network, mac, latency, loss)
+        self.base_power = network.random.uniform(5.0, 200.0)
+        self.amplitude = self.base_power * network.random.uniform(0.0, 0.5)
+        self.period = network.random.uniform(300.0, 3600.0)
+        self.relay_state = True
+        # Moments (unix time) the relay is switched off and on again
+        self._off_periods = []
+        self._log_start = (int(time.time()) // HOUR_SECONDS - log_hours) * HOUR_SECONDS
+
+    def power(self, timestamp) -> float:
+        """ Return power usage (W) at unix timestamp """
+        if not self._relay_on(timestamp):
+            return 0.0
+        return self.base_power + self.amplitude * math.sin(
+            2 * math.pi * timestamp / self.period
+        )
+
+    def energy(self, start, end) -> float:
+        """ Return energy (Ws) used between unix timestamps """
+        total = self._curve_energy(start, end)
+        for (off, on) in self._off_periods:
+            off_start = max(start, off)
+            off_end = min(end, on if on else end)
+            if off_start < off_end:
+                total -= self._curve_energy(off_start, off_end)
+        return total
+
+    def set_relay(self, state):
+        """ Switch relay """
+        now = time.time()
+        if state and not self.relay_state:
+            self._off_periods[-1] = (self._off_periods[-1][0], now)
+        elif not state and self.relay_state:
+            self._off_periods.append((now, None))
+        self.relay_state = state
+
+    def handle(self, msg_id, args) -> list:
+        mac = bytes(self.mac, UTF8_DECODE)
+        now = time.time()
+        if msg_id == b"0026":
+            return [
+                (
+                    b"0027",
+                    mac
+                    + encode_float(1.0)
+                    + encode_float(0.0)
+                    + encode_float(0.0)
+                    + encode_float(0.0),
+                )
+            ]
+        if msg_id == b"0012":
+            hour_start = now // HOUR_SECONDS * HOUR_SECONDS
+            return [
+                (
+                    b"0013",
+                    mac
+                    + b"%04X" % self._pulses(self.energy(now - 1, now))
+                    + b"%04X" % self._pulses(self.energy(now - 8, now))
+                    + b"%08X" % self._pulses(self.energy(hour_start, now))
+                    + b"00000000"
+                    + b"0000",
+                )
+            ]
+        if msg_id == b"0017":
+            self.set_relay(args[:2] == b"01")
+            return [(b"0000", (ACK_ON if self.relay_state else ACK_OFF) + mac)]
+        if msg_id == b"0016":
+            return [(b"0000", ACK_CLOCK_SET + mac)]
+        if msg_id == b"0057":
+            return [(b"0000", ACK_POWER_LOG_INTERVAL_SET + mac)]
+        if msg_id == b"003E":
+            utc = datetime.utcnow()
+            return [
+                (
+                    b"003F",
+                    mac
+                    + b"%02X%02X%02X" % (utc.hour, utc.minute, utc.second)
+                    + b"%02X" % utc.weekday()
+                    + b"00"
+                    + b"0000",
+                )
+            ]
+        if msg_id == b"0048":
+            log_address = (int(args[:8], 16) - LOGADDR_OFFSET) // 32
+            return [(b"0049", mac + self._power_log(log_address))]
+        return super().handle(msg_id, args)
+
+    def _curve_energy(self, start, end) -> float:
+        """ Return integral of power curve (Ws) between unix timestamps """
+        omega = 2 * math.pi / self.period
+        return self.base_power * (end - start) - self.amplitude / omega * (
+            math.cos(omega * end) - math.cos(omega * start)
+        )
+
+    def _relay_on(self, timestamp) -> bool:
+        for (off, on) in self._off_periods:
+            if off <= timestamp and (on is None or timestamp < on):
+                return False
+        return True
+
+    def _pulses(self, energy) -> int:
+        """ Return pulses for energy (Ws) """
+        return int(round(energy / 1000 * PULSES_PER_KW_SECOND))
+
+    def _last_log_address(self) -> int:
+        """ Return log address of last completed hour """
+        hours = (int(time.time()) - self._log_start) // HOUR_SECONDS
+        return max(hours - 1, 0) // 4
+
+    def _power_log(self, log_address) -> bytes:
+        """ Return 4 logged hours of log address, logs are dated at end of the hour """
+        now = time.time()
+        payload = b""
+        for slot in range(4):
+            start = self._log_start + (log_address * 4 + slot) * HOUR_SECONDS
+            end = start + HOUR_SECONDS
+            if log_address < 0 or end > now:
+                payload += NO_LOG + NO_LOG
+            else:
+                payload += encode_datetime(datetime.utcfromtimestamp(end))
+                payload += b"%08X" % self._pulses(self.energy(start, end))
+        return payload + encode_log_address(log_address)
+
+    def _info(self) -> bytes:
+        return (
+            encode_datetime(datetime.utcnow())
+            + encode_log_address(self._last_log_address())
+            + (b"01" if self.relay_state else b"00")
+            + b"85"
+            + bytes("0000" + self.HW_MODEL + "00", UTF8_DECODE)
+            + b"%08X" % 1262304000
+            + bytes("%02X" % self.NODE_TYPE, UTF8_DECODE)
+        )
+
+
+class SimulatedCirclePlus(SimulatedCircle):
+    """ Circle+ with the registered nodes of the network and a real time clock """
+
+    NODE_TYPE = NODE_TYPE_CIRCLE_PLUS
+    HW_MODEL = "070073"
+
+    def handle(self, msg_id, args) -> list:
+        mac = bytes(self.mac, UTF8_DECODE)
+        if msg_id == b"0018":
+            node_address = int(args[:2], 16)
+            registered = self.network.registered
+            node_mac = (
+                bytes(registered[node_address], UTF8_DECODE)
+                if node_address < len(registered)
+                else NO_NODE_MAC
+            )
+            return [(b"0019", mac + node_mac + b"%02X" % node_address)]
+        if msg_id == b"0029":
+            utc = datetime.utcnow()
+            return [
+                (
+                    b"003A",
+                    mac
+                    + b"%02d%02d%02d" % (utc.second, utc.minute, utc.hour)
+                    + b"%02X" % utc.weekday()
+                    + b"%02d%02d%02d" % (utc.day, utc.month, utc.year - PLUGWISE_EPOCH),
+                )
+            ]
+        if msg_id == b"0028":
+            return [(b"0000", ACK_REAL_TIME_CLOCK_SET + mac)]
+        return super().handle(msg_id, args)
+
+
+class SimulatedSED(SimulatedNode):
+    """
+    Sleeping end device, sends an awake message every interval seconds
+    and only responds to requests within SED_STAY_ACTIVE seconds after it.
+    """
+
+    def __init__(self, network, mac, latency, loss, interval):
+        super().__init__(network, mac, latency, loss)
+        self.interval = interval
+        self.awake_until = 0.0
+
+    def reachable(self) -> bool:
+        return time.time() < self.awake_until and super().reachable()
+
+    def start(self):
+        """ Schedule awake messages, first one within a few seconds """
+        self.network.scheduler.call_every(
+            self.interval, self.awake, delay=self.network.random.uniform(0.5, 3.0)
+        )
+
+    def awake(self):
+        """ Announce node is awake for maintenance """
+        self.awake_until = time.time() + SED_STAY_ACTIVE
+        self.network.send_frame(
+            build_frame(b"004F", b"FFFE", bytes(self.mac, UTF8_DECODE) + b"00")
+        )
+
+    def handle(self, msg_id, args) -> list:
+        mac = bytes(self.mac, UTF8_DECODE)
+        if msg_id == b"0050":
+            return [(b"0000", ACK_SLEEP_SET + mac)]
+        return super().handle(msg_id, args)
+
+
+class SimulatedScan(SimulatedSED):
+    """ Scan reporting motion at random moments """
+
+    NODE_TYPE = NODE_TYPE_SCAN
+    HW_MODEL = "080007"
+
+    def start(self):
+        super().start()
+        self.network.scheduler.call_every(
+            self.network.random.uniform(30.0, 120.0), self.motion
+        )
+
+    def motion(self):
+        """ Report motion followed by no motion """
+        mac = bytes(self.mac, UTF8_DECODE)
+        self.network.send_frame(build_frame(b"0056", b"FFFF", mac + b"00" + b"01"))
+        self.network.scheduler.call_later(
+            10,
+            self.network.send_frame,
+            build_frame(b"0056", b"FFFF", mac + b"00" + b"00"),
+        )
+
+    def handle(self, msg_id, args) -> list:
+        if msg_id == b"0101":
+            return [(b"0000", ACK_SCAN_PARAMETERS_SET + bytes(self.mac, UTF8_DECODE))]
+        return super().handle(msg_id, args)
+
+
+class SimulatedSense(SimulatedSED):
+    """ Sense reporting temperature and humidity every minute """
+
+    NODE_TYPE = NODE_TYPE_SENSE
+    HW_MODEL = "070030"
+
+    def start(self):
+        super().start()
+        self.network.scheduler.call_every(60, self.report)
+
+    def report(self):
+        """ Send temperature and humidity report """
+        temperature = 20.0 + 2.0 * math.sin(time.time() / 3600)
+        humidity = 50.0 + 10.0 * math.sin(time.time() / 7200)
+        raw_humidity = int(
+            (humidity + SENSE_HUMIDITY_OFFSET) * 65536 / SENSE_HUMIDITY_MULTIPLIER
+        )
+        raw_temperature = int(
+            (temperature + SENSE_TEMPERATURE_OFFSET)
+            * 65536
+            / SENSE_TEMPERATURE_MULTIPLIER
+        )
+        self.network.send_frame(
+            build_frame(
+                b"0105",
+                self.network.last_seq_id,
+                bytes(self.mac, UTF8_DECODE)
+                + b"%04X%04X" % (raw_humidity, raw_temperature),
+            )
+        )
+
+    def handle(self, msg_id, args) -> list:
+        if msg_id == b"0102":
+            return [(b"0000", ACK_SENSE_INTERVAL_SET + bytes(self.mac, UTF8_DECODE))]
+        return super().handle(msg_id, args)
+
+
+class SimulatedStick(object):
+    """
+    Stick with a simulated Plugwise network (a Circle+ with up to 63 other nodes)
+    available at a pty (use the returned device as serial port) or TCP socket.
+
+    Like the real stick, every request is acknowledged with a new sequence id,
+    which is used by the response of the node. When a node does not respond
+    (message loss or a sleeping SED) a timeout acknowledge is sent after
+    node_time_out seconds.
+    """
+
+    def __init__(
+        self,
+        circles=8,
+        scans=0,
+        senses=0,
+        latency=SIMULATOR_LATENCY,
+        loss=0.0,
+        ack_delay=SIMULATOR_ACK_DELAY,
+        node_time_out=SIMULATOR_NODE_TIME_OUT,
+        log_hours=SIMULATOR_LOG_HOURS,
+        sed_interval=SIMULATOR_SED_INTERVAL,
+        seed=None,
+    ):
+        if 1 + circles + scans + senses > 64:
+            raise ValueError("A Plugwise network has max 64 nodes")
+        self.random = random.Random(seed)
+        self.ack_delay = ack_delay
+        self.node_time_out = node_time_out
+        self.scheduler = Scheduler("simulator_thread")
+        self.nodes = {}
+        self.registered = []
+        self.last_seq_id = b"0000"
+        self.requests = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+        self._write = None
+        self._run = False
+        self._thread = None
+        self._master = None
+        self._wakeup = None
+        self._listener = None
+        self._client = None
+        self.circle_plus = SimulatedCirclePlus(
+            self, self._mac(0), latency, loss, log_hours
+        )
+        self.nodes[self.circle_plus.mac] = self.circle_plus
+        for i in range(circles + scans + senses):
+            mac = self._mac(i + 1)
+            if i < circles:
+                node = SimulatedCircle(self, mac, latency, loss, log_hours)
+            elif i < circles + scans:
+                node = SimulatedScan(self, mac, latency, loss, sed_interval)
+            else:
+                node = SimulatedSense(self, mac, latency, loss, sed_interval)
+            self.nodes[mac] = node
+            self.registered.append(mac)
+
+    def open_pty(self) -> str:
+        """ Start simulator at a new pty, returns device to use as serial port """
+        (self._master, slave) = os.openpty()
+        self._wakeup = os.pipe()
+        tty.setraw(slave)
+        self._write = lambda data: os.write(self._master, data)
+        self._start(self._pty_loop)
+        return os.ttyname(slave)
+
+    def open_tcp(self, address="127.0.0.1:0") -> str:
+        """ Start simulator at a TCP socket, returns <host>:<port> to use as port """
+        (host, port) = address.rsplit(":", 1)
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, int(port)))
+        self._listener.listen(1)
+        self._write = self._write_client
+        self._start(self._tcp_loop)
+        return "%s:%d" % self._listener.getsockname()
+
+    def stop(self):
+        """ Stop simulator """
+        self._run = False
+        self.scheduler.stop()
+        for item in (self._client, self._listener):
+            if item:
+                try:
+                    item.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                item.close()
+        if self._wakeup:
+            os.write(self._wakeup[1], b"\0")
+        if self._thread:
+            self._thread.join()
+        if self._master is not None:
+            os.close(self._master)
+            for fd in self._wakeup:
+                os.close(fd)
+
+    def stick_info(self) -> bytes:
+        """ Return parameters of stick init response """
+        return (
+            bytes(STICK_MAC, UTF8_DECODE)
+            + b"00"
+            + b"01"
+            + bytes(self.circle_plus.mac, UTF8_DECODE)
+            + b"1234"
+            + b"FF"
+        )
+
+    def send_frame(self, frame):
+        """ Send message to client """
+        with self._lock:
+            try:
+                self._write(frame)
+            except OSError:
+                # No client connected
+                pass
+
+    def _mac(self, index) -> str:
+        return "000D6F%010X" % (self.random.randrange(1 << 32) * 64 + index)
+
+    def _start(self, target):
+        self._run = True
+        self.scheduler.start()
+        for node in self.nodes.values():
+            if isinstance(node, SimulatedSED):
+                node.start()
+        self._thread = threading.Thread(None, target, "simulator_io_thread", (), {})
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _pty_loop(self):
+        buffer = b""
+        while self._run:
+            (readable, _, _) = select.select([self._master, self._wakeup[0]], [], [])
+            if self._wakeup[0] in readable:
+                return
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            (frames, buffer) = split_frames(buffer + data)
+            for frame in frames:
+                self._request(frame)
+
+    def _tcp_loop(self):
+        while self._run:
+            try:
+                (self._client, _) = self._listener.accept()
+            except OSError:
+                return
+            buffer = b""
+            while self._run:
+                try:
+                    data = self._client.recv(4096)
+                except OSError:
+                    data = b""
+                if not data:
+                    break
+                (frames, buffer) = split_frames(buffer + data)
+                for frame in frames:
+                    self._request(frame)
+            self._client.close()
+            self._client = None
+
+    def _write_client(self, data):
+        if self._client is None:
+            raise OSError("No client")
+        self._client.sendall(data)
+
+    def _request(self, frame):
+        """ Acknowledge request and schedule response of node """
+        body = frame[len(MESSAGE_HEADER) : -4 - len(MESSAGE_FOOTER)]
+        if frame[-4 - len(MESSAGE_FOOTER) : -len(MESSAGE_FOOTER)] != bytes(
+            "%04X" % crc_fun(body), UTF8_DECODE
+        ):
+            # Invalid checksum, ignored by stick
+            return
+        self.requests += 1
+        msg_id = body[:4]
+        self.last_seq_id = inc_seq_id(self.last_seq_id)
+        seq_id = self.last_seq_id
+        self.scheduler.call_later(
+            self.ack_delay, self.send_frame, build_frame(b"0000", seq_id, ACK_SUCCESS)
+        )
+        if msg_id == b"000A":
+            self.scheduler.call_later(
+                self.ack_delay,
+                self.send_frame,
+                build_frame(b"0011", seq_id, self.stick_info()),
+            )
+            return
+        if msg_id in (b"0007", b"0008"):
+            # Join requests are not simulated
+            return
+        node = self.nodes.get(body[4:20].decode(UTF8_DECODE))
+        if node is None or not node.reachable():
+            self.timeouts += 1
+            self.scheduler.call_later(
+                self.node_time_out,
+                self.send_frame,
+                build_frame(b"0000", seq_id, ACK_TIMEOUT),
+            )
+            return
+        node.requests += 1
+        for (response_id, payload) in node.handle(msg_id, body[20:]):
+            self.scheduler.call_later(
+                self.ack_delay + node.response_delay(),
+                self.send_frame,
+                build_frame(response_id, seq_id, payload),
+            )
+
+
+def main():
+    """ Run simulator until interrupted """
+    parser = argparse.ArgumentParser(description="Simulated Plugwise USB-stick")
+    parser.add_argument("--circles", type=int, default=8)
+    parser.add_argument("--scans", type=int, default=0)
+    parser.add_argument("--senses", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=SIMULATOR_LATENCY)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--ack-delay", type=float, default=SIMULATOR_ACK_DELAY)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--tcp", help="listen at <host>:<port> instead of a pty")
+    args = parser.parse_args()
+    simulator = SimulatedStick(
+        args.circles,
+        args.scans,
+        args.senses,
+        args.latency,
+        args.loss,
+        args.ack_delay,
+        seed=args.seed,
+    )
+    if args.tcp:
+        port = simulator.open_tcp(args.tcp)
+    else:
+        port = simulator.open_pty()
+    # Flush to make port available when output is piped
+    print("Simulated stick at " + port, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
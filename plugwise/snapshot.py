@@ -0,0 +1,85 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Read only snapshot of the latest state of all nodes
+"""
+from collections import namedtuple
+from datetime import datetime
+import threading
+from types import MappingProxyType
+
+NodeState = namedtuple(
+    "NodeState", ["mac", "node_type", "available", "last_update", "sensors"]
+)
+SensorState = namedtuple("SensorState", ["value", "timestamp"])
+
+EMPTY = MappingProxyType({})
+
+
+class NetworkSnapshot(object):
+    """
+    Latest state of all nodes, updated for every sensor change.
+
+    Updates never change a published mapping. An update copies the sensors
+    and NodeState of the changed node only, and replaces the published mapping
+    by a new one with the new NodeState. Readers get the current mapping
+    without locking, a mapping returned by get() never changes.
+    The copy of the mapping itself is a shallow copy of one entry per node.
+    """
+
+    def __init__(self):
+        # Serializes writers, readers only read self._view
+        self._lock = threading.Lock()
+        self._nodes = {}
+        self._sensors = {}
+        self._view = EMPTY
+
+    def get(self):
+        """ Return read only mapping of mac to NodeState """
+        return self._view
+
+    def node(self, mac):
+        """ Return NodeState of node or None if unknown """
+        return self._view.get(mac)
+
+    def add_node(self, node):
+        """ Add node with its current state """
+        mac = node.get_mac()
+        with self._lock:
+            self._nodes[mac] = node
+            self._sensors.setdefault(mac, EMPTY)
+            self._publish(mac)
+
+    def remove_node(self, mac):
+        """ Remove node from snapshot """
+        with self._lock:
+            if mac in self._nodes:
+                del self._nodes[mac]
+                del self._sensors[mac]
+                states = dict(self._view)
+                states.pop(mac, None)
+                self._view = MappingProxyType(states)
+
+    def update(self, node, sensor, value):
+        """ Store new value of sensor of node """
+        mac = node.get_mac()
+        with self._lock:
+            self._nodes[mac] = node
+            sensors = dict(self._sensors.get(mac, EMPTY))
+            sensors[sensor] = SensorState(value, datetime.now())
+            self._sensors[mac] = MappingProxyType(sensors)
+            self._publish(mac)
+
+    def _publish(self, mac):
+        """ Replace published mapping by one with new NodeState of node """
+        node = self._nodes[mac]
+        states = dict(self._view)
+        states[mac] = NodeState(
+            mac,
+            node.get_node_type(),
+            node.get_available(),
+            node.get_last_update(),
+            self._sensors[mac],
+        )
+        # Assignment of a reference is atomic, readers see old or new mapping
+        self._view = MappingProxyType(states)
@@ -4,25 +4,35 @@ Use of this source code is governed by the MIT license found in the LICENSE file
 Main stick object to control associated plugwise plugs
 """
 import logging
+import os
 import time
 import serial
-import sys
 import threading
 from datetime import datetime, timedelta
+from itertools import count
 from plugwise.constants import (
     ACCEPT_JOIN_REQUESTS,
+    ASYNC_SCAN_TIME_OUT,
     ACK_CLOCK_SET,
     ACK_ERROR,
     ACK_ACCEPT_JOINING_REQUEST,
     ACK_ON,
     ACK_OFF,
+    ACK_POWER_LOG_INTERVAL_SET,
     ACK_SLEEP_SET,
     ACK_SUCCESS,
     ACK_REAL_TIME_CLOCK_SET,
     ACK_SCAN_PARAMETERS_SET,
     ACK_TIMEOUT,
+    BATCH_WINDOW,
+    CALLBACK_WORKERS,
     CB_JOIN_REQUEST,
     CB_NEW_NODE,
+    CB_NODE_ADDED,
+    DISCOVERY_INFO_CONCURRENCY,
+    ENERGY_STORE_FOLDER,
+    EVENT_BUFFER_SIZE,
+    EVENT_OVERFLOW_DROP_OLDEST,
     MAX_TIME_DRIFT,
     MESSAGE_TIME_OUT,
     MESSAGE_RETRY,
@@ -39,12 +49,26 @@ from plugwise.constants import (
     NODE_TYPE_SENSE,
     NODE_TYPE_SCAN,
     NODE_TYPE_STEALTH,
+    PRIORITY_HIGH,
+    PRIORITY_MEDIUM,
+    REPLAY_SPEED,
+    SHARED_STATE_NAME,
+    SHARED_STATE_NODES,
     SLEEP_TIME,
     WATCHDOG_DEAMON,
     UTF8_DECODE,
 )
+from plugwise.aio import AsyncStateStream, wait_for_callback
+from plugwise.cache import PlugwiseCache
+from plugwise.connections.capture import RecordingConnection, ReplayConnection
 from plugwise.connections.socket import SocketConnection
 from plugwise.connections.serial import PlugwiseUSBConnection
+from plugwise.discovery import DiscoveryPipeline
+from plugwise.download import PowerLogDownload
+from plugwise.events import EventStream, JoinRequestEvent, NewNodeEvent, state_event
+from plugwise.executor import CallbackExecutor
+from plugwise.notify import BatchNotifier
+from plugwise.snapshot import NetworkSnapshot
 from plugwise.exceptions import (
     CirclePlusError,
     NetworkDown,
@@ -89,6 +113,9 @@ from plugwise.messages.responses import (
     StickInitResponse,
 )
 from plugwise.parser import PlugwiseParser
+from plugwise.scheduler import Scheduler
+from plugwise.shared import SharedStateWriter
+from plugwise.store import EnergyStore
 from plugwise.node import PlugwiseNode
 from plugwise.nodes.circle import PlugwiseCircle
 from plugwise.nodes.circle_plus import PlugwiseCirclePlus
@@ -106,35 +133,76 @@ class stick(object):
     Plugwise connection stick
     """
 
-    def __init__(self, port, callback=None, print_progress=False):
+    def __init__(
+        self,
+        port,
+        callback=None,
+        print_progress=False,
+        cache_folder=None,
+        callback_workers=CALLBACK_WORKERS,
+        scheduler=None,
+        callback_executor=None,
+        capture_file=None,
+        replay_speed=REPLAY_SPEED,
+    ):
         self.logger = logging.getLogger("python-plugwise")
+        self.callback_executor = callback_executor
+        self._own_callback_executor = callback_executor is None and callback_workers > 0
+        if self._own_callback_executor:
+            self.callback_executor = CallbackExecutor(callback_workers)
+        # Scheduler executing timeout, update and watchdog jobs
+        self._own_scheduler = scheduler is None
+        self._scheduler = (
+            Scheduler("stick_scheduler_thread") if scheduler is None else scheduler
+        )
+        self._receive_timeout_job = None
+        self._update_job = None
+        self._watchdog_job = None
+        self.cache = PlugwiseCache(cache_folder)
+        self.energy_store = None
+        if cache_folder:
+            self.energy_store = EnergyStore(
+                os.path.join(cache_folder, ENERGY_STORE_FOLDER)
+            )
         self._mac_stick = None
         self.port = port
+        self.capture_file = capture_file
+        self.replay_speed = replay_speed
         self.network_online = False
         self.circle_plus_mac = None
         self._circle_plus_discovered = False
         self._circle_plus_retries = 0
+        self._circle_plus_retry_counter = 0
         self.network_id = None
         self.parser = PlugwiseParser(self)
         self._plugwise_nodes = {}
         self._nodes_registered = 0
         self._nodes_to_discover = {}
         self._nodes_not_discovered = {}
-        self._nodes_off_line = 0
+        self._discovery = None
         self._discovery_finished = False
+        self._clock_validated = None
         self._messages_for_undiscovered_nodes = []
         self._accept_join_requests = ACCEPT_JOIN_REQUESTS
         self._stick_initialized = False
         self._stick_callbacks = {}
+        self._batch_notifiers = {}
+        self._event_streams = []
+        self._snapshot = NetworkSnapshot()
+        self._shared_state = None
         self.last_ack_seq_id = None
         self.expected_responses = {}
         self.print_progress = print_progress
         self.timezone_delta = datetime.now().replace(
             minute=0, second=0, microsecond=0
         ) - datetime.utcnow().replace(minute=0, second=0, microsecond=0)
-        self._run_receive_timeout_thread = False
-        self._run_send_message_thread = False
-        self._run_update_thread = False
+        self._run_send_messages = False
+        self._send_lock = threading.Lock()
+        self._send_busy = False
+        self._send_job = None
+        self._send_activity = None
+        self._auto_update_timer = 0
+        self._auto_update_first_run = False
 
         if callback:
             self.auto_initialize(callback)
@@ -172,55 +240,113 @@ class stick(object):
         """ Connect to stick and raise error if it fails"""
         self.init_callback = callback
         # Open connection to USB Stick
-        if ":" in self.port:
+        if self.port.startswith("replay:"):
+            self.logger.debug("Replay captured traffic of Plugwise Zigbee stick")
+            self.connection = ReplayConnection(self.port[7:], self, self.replay_speed)
+        elif ":" in self.port:
             self.logger.debug("Open socket connection to Plugwise Zigbee stick")
             self.connection = SocketConnection(self.port, self)
         else:
             self.logger.debug("Open USB serial connection to Plugwise Zigbee stick")
             self.connection = PlugwiseUSBConnection(self.port, self)
+        if self.capture_file:
+            self.logger.debug("Capture traffic to %s", self.capture_file)
+            self.connection = RecordingConnection(self.connection, self.capture_file)
         self.connection.connect()
 
         self.logger.debug("Starting threads...")
-        # receive timeout deamon
-        self._run_receive_timeout_thread = True
-        self._receive_timeout_thread = threading.Thread(
-            None, self._receive_timeout_loop, "receive_timeout_thread", (), {}
-        )
-        self._receive_timeout_thread.daemon = True
-        self._receive_timeout_thread.start()
-        # send deamon
-        self._send_message_queue = queue.Queue()
-        self._run_send_message_thread = True
-        self._send_message_thread = threading.Thread(
-            None, self._send_message_loop, "send_messages_thread", (), {}
-        )
-        self._send_message_thread.daemon = True
-        self._send_message_thread.start()
-        # update deamon
-        self._run_update_thread = False
-        self._auto_update_timer = 0
-        self._update_thread = threading.Thread(
-            None, self._update_loop, "update_thread", (), {}
+        if self._own_scheduler:
+            self._scheduler.start()
+        if self._own_callback_executor:
+            self.callback_executor.start()
+        # receive timeouts
+        self._receive_timeout_job = self._scheduler.call_every(
+            MESSAGE_TIME_OUT, self._check_receive_timeouts
         )
-        self._update_thread.daemon = True
+        # Requests are sent by the scheduler
+        self._send_message_queue = queue.PriorityQueue()
+        self._send_message_counter = count()
+        self._send_busy = False
+        self._run_send_messages = True
         self.logger.debug("All threads started")
 
     def initialize_stick(self, callback=None, timeout=MESSAGE_TIME_OUT):
         # Initialize USBstick
         if not self.connection.is_connected():
             raise StickInitError
+        self._send_init_request(callback)
+        time_counter = 0
+        while not self._stick_initialized and (time_counter < timeout):
+            time_counter += 0.1
+            time.sleep(0.1)
+        if not self._stick_initialized:
+            raise StickInitError
+        if not self.network_online:
+            raise NetworkDown
+
+    async def async_connect(self, timeout=MESSAGE_TIME_OUT):
+        """ Connect to and initialize stick without blocking the asyncio event loop """
+        self.connect()
+        if not self.connection.is_connected():
+            raise StickInitError
+        try:
+            await wait_for_callback(self._send_init_request, timeout)
+        except TimeoutException:
+            raise StickInitError
+        if not self.network_online:
+            raise NetworkDown
+
+    async def async_scan(self, timeout=ASYNC_SCAN_TIME_OUT):
+        """
+        Scan for connected plugwise nodes and wait until discovery is finished,
+        raises TimeoutException when discovery is not finished within timeout
+        """
+        await wait_for_callback(self.scan, timeout)
+
+    def events(
+        self,
+        filter=None,
+        buffer_size=EVENT_BUFFER_SIZE,
+        overflow=EVENT_OVERFLOW_DROP_OLDEST,
+    ) -> EventStream:
+        """
+        Return stream of sensor, availability, join request and new node events.
+        Only events for which filter(event) returns True are included.
+        """
+        stream = EventStream(self, filter, buffer_size, overflow)
+        self._event_streams.append(stream)
+        return stream
+
+    def _remove_event_stream(self, stream):
+        """ Stop publishing events to stream """
+        if stream in self._event_streams:
+            self._event_streams.remove(stream)
+
+    def _publish_event(self, event):
+        """ Add event to all event streams """
+        for stream in list(self._event_streams):
+            stream.add(event)
+
+    def async_state_changes(self) -> AsyncStateStream:
+        """
+        Return stream of (mac, sensor, value) tuples of all state changes
+        to be used with 'async for'
+        """
+        stream = AsyncStateStream(self)
+        self._event_streams.append(stream)
+        return stream
+
+    def _send_init_request(self, callback=None):
+        """ Send init request, callback is executed when stick is initialized """
 
         def cb_stick_initialized():
             """ Callback when initialization of Plugwise USBstick is finished """
             self._stick_initialized = True
 
-            # Start watchdog deamon
-            self._run_watchdog = True
-            self._watchdog_thread = threading.Thread(
-                None, self._watchdog_loop, "watchdog_thread", (), {}
+            # Start watchdog
+            self._watchdog_job = self._scheduler.call_every(
+                WATCHDOG_DEAMON, self._watchdog, delay=5
             )
-            self._watchdog_thread.daemon = True
-            self._watchdog_thread.start()
 
             # Try to discover Circle+
             if self.circle_plus_mac:
@@ -230,14 +356,6 @@ class stick(object):
 
         self.logger.debug("Send init request to Plugwise Zigbee stick")
         self.send(StickInitRequest(), cb_stick_initialized)
-        time_counter = 0
-        while not self._stick_initialized and (time_counter < timeout):
-            time_counter += 0.1
-            time.sleep(0.1)
-        if not self._stick_initialized:
-            raise StickInitError
-        if not self.network_online:
-            raise NetworkDown
 
     def initialize_circle_plus(self, callback=None, timeout=MESSAGE_TIME_OUT):
         # Initialize Circle+
@@ -259,12 +377,39 @@ class stick(object):
 
     def disconnect(self):
         """ Disconnect from stick and raise error if it fails"""
-        self._run_watchdog = False
-        self._run_update_thread = False
         self._auto_update_timer = 0
-        self._run_send_message_thread = False
-        self._run_receive_timeout_thread = False
+        with self._send_lock:
+            self._run_send_messages = False
+        for job in (
+            self._send_job,
+            self._receive_timeout_job,
+            self._update_job,
+            self._watchdog_job,
+        ):
+            if job:
+                job.cancel()
+        self._send_job = None
+        self._receive_timeout_job = None
+        self._update_job = None
+        self._watchdog_job = None
+        for notifier in list(self._batch_notifiers.values()):
+            notifier.cancel()
+        if self._own_scheduler:
+            self._scheduler.stop()
         self.connection.disconnect()
+        if self.energy_store:
+            self.energy_store.flush()
+        self.stop_shared_state()
+        if self._own_callback_executor:
+            # Callbacks queued before disconnect are executed first
+            self.callback_executor.stop()
+
+    def call_later(self, delay, callback, *args):
+        """
+        Execute callback once after delay seconds from the scheduler thread.
+        Returns the scheduled job which can be cancelled.
+        """
+        return self._scheduler.call_later(delay, callback, *args)
 
     def subscribe_stick_callback(self, callback, callback_type):
         """ Subscribe callback to execute """
@@ -277,18 +422,83 @@ class stick(object):
         if callback_type in self._stick_callbacks:
             self._stick_callbacks[callback_type].remove(callback)
 
-    def do_callback(self, callback_type, callback_arg=None):
-        """ Execute callbacks registered for specified callback type """
+    def do_callback(self, callback_type, callback_arg=None, direct=False):
+        """
+        Execute callbacks registered for specified callback type,
+        by the callback executor unless direct is True
+        """
         if callback_type in self._stick_callbacks:
-            for callback in self._stick_callbacks[callback_type]:
+            args = () if callback_arg is None else (callback_arg,)
+            for callback in list(self._stick_callbacks[callback_type]):
+                if self.callback_executor and not direct:
+                    self.callback_executor.submit("stick", callback, *args)
+                    continue
                 try:
-                    if callback_arg is None:
-                        callback()
-                    else:
-                        callback(callback_arg)
+                    callback(*args)
                 except Exception as e:
                     self.logger.error("Error while executing callback : %s", e)
 
+    def subscribe_batch_callback(self, callback, window=BATCH_WINDOW):
+        """
+        Subscribe callback to execute with a list of (mac, sensor, value) tuples
+        of all sensors of all nodes which changed during the window (seconds)
+        """
+        self._batch_notifiers[callback] = BatchNotifier(
+            callback, window, self.call_later, self.callback_executor
+        )
+
+    def unsubscribe_batch_callback(self, callback):
+        """ Unsubscribe batch callback """
+        notifier = self._batch_notifiers.pop(callback, None)
+        if notifier:
+            notifier.cancel()
+
+    def _state_changed(self, node, sensor):
+        """ Update snapshot and batch notifications with state change of node """
+        value = node._sensor_state(sensor)
+        self._snapshot.update(node, sensor, value)
+        if self._shared_state:
+            self._shared_state.update(
+                node.get_mac(), self._snapshot.node(node.get_mac())
+            )
+        for notifier in list(self._batch_notifiers.values()):
+            notifier.add(node.get_mac(), sensor, value)
+        if self._event_streams:
+            self._publish_event(state_event(node.get_mac(), sensor, value))
+
+    def snapshot(self):
+        """
+        Return read only mapping of mac to NodeState with the latest state
+        of all discovered nodes. The returned mapping does not change anymore.
+        """
+        return self._snapshot.get()
+
+    def export_shared_state(self, name=SHARED_STATE_NAME, max_nodes=SHARED_STATE_NODES):
+        """
+        Publish state of all nodes in shared memory segment with given name
+        to be read by other processes using plugwise.shared.SharedStateReader.
+        """
+        self.stop_shared_state()
+        self._shared_state = SharedStateWriter(name, max_nodes)
+        for mac, state in self._snapshot.get().items():
+            self._shared_state.update(mac, state)
+
+    def stop_shared_state(self):
+        """ Stop publishing state and remove shared memory segment """
+        if self._shared_state:
+            self._shared_state.close()
+            self._shared_state = None
+
+    def scheduler_metrics(self) -> dict:
+        """ Return wakeups and executed jobs of the scheduler """
+        return self._scheduler.metrics()
+
+    def callback_metrics(self) -> dict:
+        """ Return queue depth and execution time of callbacks """
+        if self.callback_executor:
+            return self.callback_executor.metrics()
+        return None
+
     def _discover_after_scan(self):
         """ Helper to do callback for new node """
         node_discovered = None
@@ -298,6 +508,8 @@ class stick(object):
                 break
         if node_discovered:
             del self._nodes_not_discovered[node_discovered]
+            if isinstance(self._plugwise_nodes[node_discovered], PlugwiseCircle):
+                self._plugwise_nodes[node_discovered].validate_clock()
             self.do_callback(CB_NEW_NODE, node_discovered)
 
     def registered_nodes(self) -> int:
@@ -307,11 +519,7 @@ class stick(object):
 
     def nodes(self) -> list:
         """ Return list of mac addresses of discovered and supported plugwise nodes """
-        return list(
-            dict(
-                filter(lambda item: item[1] is not None, self._plugwise_nodes.items())
-            ).keys()
-        )
+        return list(self._snapshot.get())
 
     def node(self, mac: str) -> PlugwiseNode:
         """ Return specific Plugwise node object"""
@@ -353,67 +561,46 @@ class stick(object):
 
         def scan_finished(nodes_to_discover):
             """ Callback when scan is finished """
-            time.sleep(1)
             self.logger.debug("Scan plugwise network finished")
-            self._nodes_discovered = 0
             self._nodes_to_discover = nodes_to_discover
             self._nodes_registered = len(nodes_to_discover)
             self._discovery_finished = False
 
-            def node_discovered(nodes_off_line=False):
-                if nodes_off_line:
-                    self._nodes_off_line += 1
-                self._nodes_discovered += 1
+            def discovery_finished():
+                """ Callback when discovery of all nodes is finished """
+                nodes_off_line = False
+                for mac in self._nodes_to_discover:
+                    if mac not in self._plugwise_nodes.keys():
+                        nodes_off_line = True
+                        self.logger.info(
+                            "Failed to discover node type for registered MAC '%s'. This is expected for battery powered nodes, they will be discovered at their first awake",
+                            str(mac),
+                        )
+                    elif mac in self._nodes_not_discovered:
+                        del self._nodes_not_discovered[mac]
+                if not nodes_off_line:
+                    self._nodes_to_discover = {}
+                    self._nodes_not_discovered = {}
+                self._discovery_finished = True
                 self.logger.debug(
-                    "Discovered Plugwise node %s (%s off-line) of %s",
-                    str(len(self._plugwise_nodes)),
-                    str(self._nodes_off_line),
-                    str(len(self._nodes_to_discover)),
+                    "Discovery of %s nodes finished in %.1f seconds",
+                    str(len(nodes_to_discover)),
+                    self._discovery.progress()["elapsed"],
                 )
-                if (len(self._plugwise_nodes) - 1 + self._nodes_off_line) >= len(
-                    self._nodes_to_discover
-                ):
-                    if self._nodes_off_line == 0:
-                        self._nodes_to_discover = {}
-                        self._nodes_not_discovered = {}
-                    else:
-                        for mac in self._nodes_to_discover:
-                            if mac not in self._plugwise_nodes.keys():
-                                self.logger.info(
-                                    "Failed to discover node type for registered MAC '%s'. This is expected for battery powered nodes, they will be discovered at their first awake",
-                                    str(mac),
-                                )
-                            else:
-                                if mac in self._nodes_not_discovered:
-                                    del self._nodes_not_discovered[mac]
-                    self._discovery_finished = True
-                    if callback:
-                        callback()
-
-            def timeout_expired():
-                if not self._discovery_finished:
-                    for mac in self._nodes_to_discover:
-                        if mac not in self._plugwise_nodes.keys():
-                            self.logger.info(
-                                "Failed to discover node type for registered MAC '%s'. This is expected for battery powered nodes, they will be discovered at their first awake",
-                                str(mac),
-                            )
-                        else:
-                            if mac in self._nodes_not_discovered:
-                                del self._nodes_not_discovered[mac]
-                    if callback:
-                        callback()
-
-            # setup timeout for loading nodes
-            discover_timeout = (
-                10 + (len(nodes_to_discover) * 2) + (MESSAGE_TIME_OUT * MESSAGE_RETRY)
-            )
-            self.discover_timeout = threading.Timer(
-                discover_timeout, timeout_expired
-            ).start()
+                if callback:
+                    callback()
+                self._validate_clocks()
+
             self.logger.debug("Start discovery of linked node types...")
+            self._discovery = DiscoveryPipeline(
+                self._discover_info,
+                DISCOVERY_INFO_CONCURRENCY,
+                discovery_finished,
+            )
+            self._discovery.add(self.circle_plus_mac)
             for mac in nodes_to_discover:
-                self.discover_node(mac, node_discovered)
+                self._discovery.add(mac)
+            self._discovery.start()
 
         def scan_circle_plus():
             """Callback when Circle+ is discovered"""
@@ -421,7 +608,9 @@ class stick(object):
                 if self.print_progress:
                     print("Scan Circle+ for linked nodes")
                 self.logger.debug("Scan Circle+ for linked nodes...")
-                self._plugwise_nodes[self.circle_plus_mac].scan_for_nodes(scan_finished)
+                self._plugwise_nodes[self.circle_plus_mac].scan_for_nodes(
+                    scan_finished, self._node_registered
+                )
             else:
                 self.logger.error(
                     "Circle+ is not discovered in %s", self._plugwise_nodes
@@ -441,6 +630,89 @@ class stick(object):
                 "Plugwise stick not properly initialized, Circle+ MAC is missing."
             )
 
+    def _node_registered(self, mac, address):
+        """ Callback for linked node found by Circle+ after scan is finished """
+        if mac in self._nodes_to_discover or self._plugwise_nodes.get(mac):
+            return
+        self.logger.info("Linked node %s found at address %s", mac, str(address))
+        self._nodes_to_discover[mac] = address
+        self._nodes_registered += 1
+        if self._discovery and not self._discovery.is_finished():
+            self._discovery.add(mac)
+        else:
+            self.discover_node(mac, self._discover_after_scan)
+
+    def discovery_progress(self) -> dict:
+        """ Return progress of the scan and discovery of linked nodes """
+        progress = {"scan": None, "discovery": None}
+        if self._plugwise_nodes.get(self.circle_plus_mac):
+            progress["scan"] = self._plugwise_nodes[
+                self.circle_plus_mac
+            ].scan_progress()
+        if self._discovery:
+            progress["discovery"] = self._discovery.progress()
+        return progress
+
+    def _discover_info(self, mac, done):
+        """ Request node type of node to discover """
+        if self._plugwise_nodes.get(mac):
+            done(True)
+        # Force request, discover_node does not send it for a node which
+        # failed discovery before and done would never be called
+        elif not self.discover_node(mac, done, force_discover=True):
+            done(False)
+
+    def download_power_log(self, macs=None, checkpoint=None) -> PowerLogDownload:
+        """
+        Return iterator streaming the complete power log of Circle nodes
+        as (mac, timestamp, kWh) tuples. All available Circles are used by default.
+        """
+        if macs is None:
+            macs = [
+                mac
+                for mac in self.nodes()
+                if isinstance(self._plugwise_nodes[mac], PlugwiseCircle)
+                and self._plugwise_nodes[mac].get_available()
+            ]
+        return PowerLogDownload(self, macs, checkpoint)
+
+    def energy_between(self, macs, start: datetime, end: datetime) -> dict:
+        """
+        Return logged power consumption in kWh of the hours from start
+        up to end (local time) for each given Circle
+        """
+        return {
+            mac: self._plugwise_nodes[mac].energy_between(start, end)
+            for mac in macs
+            if isinstance(self._plugwise_nodes.get(mac), PlugwiseCircle)
+        }
+
+    def _validate_clocks(self):
+        """ Validate internal clocks of all available powered nodes at low priority """
+        self._clock_validated = datetime.now().date()
+        for mac in list(self._plugwise_nodes):
+            if (
+                isinstance(self._plugwise_nodes[mac], PlugwiseCircle)
+                and self._plugwise_nodes[mac].get_available()
+            ):
+                self._plugwise_nodes[mac].validate_clock()
+
+    def _request_dropped(self, request_set):
+        """ Inform scan, discovery or node a request is given up after max retries """
+        if isinstance(request_set[1], CirclePlusScanRequest):
+            if self._plugwise_nodes.get(self.circle_plus_mac):
+                self._plugwise_nodes[self.circle_plus_mac]._scan_request_dropped(
+                    request_set[1].node_address
+                )
+            return
+        if isinstance(request_set[1], CircleCalibrationRequest):
+            mac = request_set[1].mac.decode(UTF8_DECODE)
+            if isinstance(self._plugwise_nodes.get(mac), PlugwiseCircle):
+                self._plugwise_nodes[mac]._calibration_request_dropped()
+            return
+        if self._discovery and isinstance(request_set[1], NodeInfoRequest):
+            self._discovery.request_failed(request_set[1].mac.decode(UTF8_DECODE))
+
     def get_mac_stick(self) -> str:
         """Return mac address of USB-Stick"""
         if self._mac_stick:
@@ -525,6 +797,13 @@ class stick(object):
         else:
             self.logger.warning("Unsupported node type '%s'", str(node_type))
             self._plugwise_nodes[mac] = None
+        if self._plugwise_nodes[mac]:
+            self._snapshot.add_node(self._plugwise_nodes[mac])
+            if self._shared_state:
+                self._shared_state.update(mac, self._snapshot.node(mac))
+            self._publish_event(NewNodeEvent(mac, datetime.now()))
+            # Executed before the node can be used, so it is always registered
+            self.do_callback(CB_NODE_ADDED, mac, direct=True)
 
         # process previous missed messages
         msg_to_process = self._messages_for_undiscovered_nodes[:]
@@ -540,15 +819,19 @@ class stick(object):
         """
         if mac in self._plugwise_nodes:
             del self._plugwise_nodes[mac]
+        self._snapshot.remove_node(mac)
+        if self._shared_state:
+            self._shared_state.remove(mac)
 
     def feed_parser(self, data):
         """ Feed parser with new data """
         assert isinstance(data, bytes)
         self.parser.feed(data)
 
-    def send(self, request, callback=None, retry_counter=0):
+    def send(self, request, callback=None, retry_counter=0, priority=PRIORITY_MEDIUM):
         """
-        Submit request message into Plugwise Zigbee network and queue expected response
+        Submit request message into Plugwise Zigbee network and queue expected response.
+        Requests with a lower priority value are sent first.
         """
         assert isinstance(request, NodeRequest)
         if isinstance(request, CirclePowerUsageRequest):
@@ -571,168 +854,178 @@ class stick(object):
             response_message = StickInitResponse()
         else:
             response_message = None
-        self._send_message_queue.put(
-            [
-                response_message,
-                request,
-                callback,
-                retry_counter,
-                None,
-            ]
-        )
+        with self._send_lock:
+            self._send_message_queue.put(
+                (
+                    priority,
+                    next(self._send_message_counter),
+                    [
+                        response_message,
+                        request,
+                        callback,
+                        retry_counter,
+                        None,
+                        priority,
+                    ],
+                )
+            )
+            if self._send_busy or not self._run_send_messages:
+                return
+            self._send_busy = True
+        self._scheduler.call_later(0, self._send_next_message)
 
-    def _send_message_loop(self):
-        """ deamon to send messages waiting in queue """
-        while self._run_send_message_thread:
+    def _send_next_message(self):
+        """
+        Send first request waiting in queue, executed by the scheduler.
+        Requests are sent one at a time, the next one when the stick
+        acknowledged the request or did not acknowledge it within 1 second.
+        """
+        with self._send_lock:
+            if not self._run_send_messages:
+                self._send_busy = False
+                return
             try:
-                request_set = self._send_message_queue.get(block=True, timeout=1)
+                (_, _, request_set) = self._send_message_queue.get_nowait()
             except queue.Empty:
-                time.sleep(SLEEP_TIME)
+                self._send_busy = False
+                return
+        self._send_activity = time.monotonic()
+        if self.last_ack_seq_id:
+            # Calc new seq_id based last received ack messsage
+            seq_id = inc_seq_id(self.last_ack_seq_id)
+        else:
+            # first message, so use a fake seq_id
+            seq_id = b"0000"
+        self.expected_responses[seq_id] = request_set
+        if (
+            not isinstance(request_set[1], StickInitRequest)
+            and not isinstance(request_set[1], NodeAllowJoiningRequest)
+            and not isinstance(request_set[1], NodeAddRequest)
+        ):
+            mac = request_set[1].mac.decode(UTF8_DECODE)
+            self.logger.info(
+                "send %s to %s using seq_id %s",
+                request_set[1].__class__.__name__,
+                mac,
+                str(seq_id),
+            )
+            if self._plugwise_nodes.get(mac):
+                self._plugwise_nodes[mac].last_request = datetime.now()
+            if self.expected_responses[seq_id][3] > 0:
+                self.logger.debug(
+                    "Retry %s for message %s to %s",
+                    str(self.expected_responses[seq_id][3]),
+                    str(self.expected_responses[seq_id][1].__class__.__name__),
+                    self.expected_responses[seq_id][1].mac.decode(UTF8_DECODE),
+                )
+        else:
+            mac = ""
+            self.logger.info(
+                "send %s using seq_id %s",
+                request_set[1].__class__.__name__,
+                str(seq_id),
+            )
+        self.expected_responses[seq_id][4] = datetime.now()
+        self.connection.send(request_set[1])
+        self._send_job = self._scheduler.call_later(
+            SLEEP_TIME, self._wait_for_ack, seq_id, mac, 0
+        )
+
+    def _wait_for_ack(self, seq_id, mac, timeout_counter):
+        """ Check every 0.1 second, max 1 second, if stick acknowledged request """
+        if not self._run_send_messages:
+            with self._send_lock:
+                self._send_busy = False
+            return
+        self._send_activity = time.monotonic()
+        if (
+            self.last_ack_seq_id != seq_id
+            and timeout_counter <= 10
+            and seq_id != b"0000"
+            and self.last_ack_seq_id != None
+        ):
+            self._send_job = self._scheduler.call_later(
+                0.1, self._wait_for_ack, seq_id, mac, timeout_counter + 1
+            )
+            return
+        if timeout_counter > 10 and seq_id in self.expected_responses:
+            if self.expected_responses[seq_id][3] <= MESSAGE_RETRY:
+                self.logger.info(
+                    "Resend %s for %s because stick did not acknowledge request (%s), last seq_id=%s",
+                    str(self.expected_responses[seq_id][1].__class__.__name__),
+                    mac,
+                    str(seq_id),
+                    str(self.last_ack_seq_id),
+                )
+                self.send(
+                    self.expected_responses[seq_id][1],
+                    self.expected_responses[seq_id][2],
+                    self.expected_responses[seq_id][3] + 1,
+                    self.expected_responses[seq_id][5],
+                )
             else:
-                if self.last_ack_seq_id:
-                    # Calc new seq_id based last received ack messsage
-                    seq_id = inc_seq_id(self.last_ack_seq_id)
-                else:
-                    # first message, so use a fake seq_id
-                    seq_id = b"0000"
-                self.expected_responses[seq_id] = request_set
-                if (
-                    not isinstance(request_set[1], StickInitRequest)
-                    and not isinstance(request_set[1], NodeAllowJoiningRequest)
-                    and not isinstance(request_set[1], NodeAddRequest)
+                self.logger.info(
+                    "Drop %s request with seq_id %s for mac %s because max (%s) retries reached, last seq_id=%s",
+                    self.expected_responses[seq_id][1].__class__.__name__,
+                    str(seq_id),
+                    mac,
+                    str(MESSAGE_RETRY),
+                    str(self.last_ack_seq_id),
+                )
+                self._request_dropped(self.expected_responses[seq_id])
+            del self.expected_responses[seq_id]
+        self._send_next_message()
+
+    def _check_receive_timeouts(self):
+        """ Resend or drop requests without any (n)ack response message """
+        for seq_id in list(self.expected_responses.keys()):
+            if self.expected_responses[seq_id][4] != None:
+                if self.expected_responses[seq_id][4] < (
+                    datetime.now() - timedelta(seconds=MESSAGE_TIME_OUT)
                 ):
-                    mac = request_set[1].mac.decode(UTF8_DECODE)
-                    self.logger.info(
-                        "send %s to %s using seq_id %s",
-                        request_set[1].__class__.__name__,
-                        mac,
+                    self.logger.debug(
+                        "Timeout expired for message with sequence ID %s",
                         str(seq_id),
                     )
-                    if self._plugwise_nodes.get(mac):
-                        self._plugwise_nodes[mac].last_request = datetime.now()
-                    if self.expected_responses[seq_id][3] > 0:
+                    if self.expected_responses[seq_id][3] <= MESSAGE_RETRY:
                         self.logger.debug(
-                            "Retry %s for message %s to %s",
-                            str(self.expected_responses[seq_id][3]),
+                            "Resend request %s",
                             str(self.expected_responses[seq_id][1].__class__.__name__),
-                            self.expected_responses[seq_id][1].mac.decode(UTF8_DECODE),
                         )
-                else:
-                    mac = ""
-                    self.logger.info(
-                        "send %s using seq_id %s",
-                        request_set[1].__class__.__name__,
-                        str(seq_id),
-                    )
-                self.expected_responses[seq_id][4] = datetime.now()
-                self.connection.send(request_set[1])
-                time.sleep(SLEEP_TIME)
-                timeout_counter = 0
-                # Wait max 1 second for acknowledge response
-                while (
-                    self.last_ack_seq_id != seq_id
-                    and timeout_counter <= 10
-                    and seq_id != b"0000"
-                    and self.last_ack_seq_id != None
-                ):
-                    time.sleep(0.1)
-                    timeout_counter += 1
-                if timeout_counter > 10 and self._run_send_message_thread:
-                    if seq_id in self.expected_responses:
-                        if self.expected_responses[seq_id][3] <= MESSAGE_RETRY:
+                        self.send(
+                            self.expected_responses[seq_id][1],
+                            self.expected_responses[seq_id][2],
+                            self.expected_responses[seq_id][3] + 1,
+                            self.expected_responses[seq_id][5],
+                        )
+                    else:
+                        if isinstance(
+                            self.expected_responses[seq_id][1], NodeAddRequest
+                        ) or isinstance(
+                            self.expected_responses[seq_id][1], StickInitRequest
+                        ):
                             self.logger.info(
-                                "Resend %s for %s because stick did not acknowledge request (%s), last seq_id=%s",
-                                str(
-                                    self.expected_responses[seq_id][
-                                        1
-                                    ].__class__.__name__
-                                ),
-                                mac,
+                                "Drop %s request because max (%s) retries reached for seq id %s",
+                                self.expected_responses[seq_id][1].__class__.__name__,
+                                str(MESSAGE_RETRY),
                                 str(seq_id),
-                                str(self.last_ack_seq_id),
-                            )
-                            self.send(
-                                self.expected_responses[seq_id][1],
-                                self.expected_responses[seq_id][2],
-                                self.expected_responses[seq_id][3] + 1,
                             )
                         else:
+                            if self.expected_responses[seq_id][1].mac == "":
+                                mac = "<empty>"
+                            else:
+                                mac = self.expected_responses[seq_id][1].mac.decode(
+                                    UTF8_DECODE
+                                )
                             self.logger.info(
-                                "Drop %s request with seq_id %s for mac %s because max (%s) retries reached, last seq_id=%s",
+                                "Drop %s request for mac %s because max (%s) retries reached for seq id %s",
                                 self.expected_responses[seq_id][1].__class__.__name__,
-                                str(seq_id),
                                 mac,
                                 str(MESSAGE_RETRY),
-                                str(self.last_ack_seq_id),
-                            )
-                        del self.expected_responses[seq_id]
-        self.logger.debug("Send message loop stopped")
-
-    def _receive_timeout_loop(self):
-        """ deamon to time out requests without any (n)ack response message """
-        while self._run_receive_timeout_thread:
-            for seq_id in list(self.expected_responses.keys()):
-                if self.expected_responses[seq_id][4] != None:
-                    if self.expected_responses[seq_id][4] < (
-                        datetime.now() - timedelta(seconds=MESSAGE_TIME_OUT)
-                    ):
-                        self.logger.debug(
-                            "Timeout expired for message with sequence ID %s",
-                            str(seq_id),
-                        )
-                        if self.expected_responses[seq_id][3] <= MESSAGE_RETRY:
-                            self.logger.debug(
-                                "Resend request %s",
-                                str(
-                                    self.expected_responses[seq_id][
-                                        1
-                                    ].__class__.__name__
-                                ),
-                            )
-                            self.send(
-                                self.expected_responses[seq_id][1],
-                                self.expected_responses[seq_id][2],
-                                self.expected_responses[seq_id][3] + 1,
+                                str(seq_id),
                             )
-                        else:
-                            if isinstance(
-                                self.expected_responses[seq_id][1], NodeAddRequest
-                            ) or isinstance(
-                                self.expected_responses[seq_id][1], StickInitRequest
-                            ):
-                                self.logger.info(
-                                    "Drop %s request because max (%s) retries reached for seq id %s",
-                                    self.expected_responses[seq_id][
-                                        1
-                                    ].__class__.__name__,
-                                    str(MESSAGE_RETRY),
-                                    str(seq_id),
-                                )
-                            else:
-                                if self.expected_responses[seq_id][1].mac == "":
-                                    mac = "<empty>"
-                                else:
-                                    mac = self.expected_responses[seq_id][1].mac.decode(
-                                        UTF8_DECODE
-                                    )
-                                self.logger.info(
-                                    "Drop %s request for mac %s because max (%s) retries reached for seq id %s",
-                                    self.expected_responses[seq_id][
-                                        1
-                                    ].__class__.__name__,
-                                    mac,
-                                    str(MESSAGE_RETRY),
-                                    str(seq_id),
-                                )
-                        del self.expected_responses[seq_id]
-            receive_timeout_checker = 0
-            while (
-                receive_timeout_checker < MESSAGE_TIME_OUT
-                and self._run_receive_timeout_thread
-            ):
-                time.sleep(1)
-                receive_timeout_checker += 1
-        self.logger.debug("Receive timeout loop stopped")
+                            self._request_dropped(self.expected_responses[seq_id])
+                    del self.expected_responses[seq_id]
 
     def new_message(self, message: NodeResponse):
         """ Received message from Plugwise Zigbee network """
@@ -832,6 +1125,14 @@ class stick(object):
                     )
                     self._plugwise_nodes[mac].on_message(message)
                     self.message_processed(message.seq_id, message.ack_id)
+                elif message.ack_id == ACK_POWER_LOG_INTERVAL_SET:
+                    self.logger.info(
+                        "Received success power log interval response for NodeMeasureIntervalRequest from %s with sequence id %s",
+                        mac,
+                        str(message.seq_id),
+                    )
+                    self._plugwise_nodes[mac].on_message(message)
+                    self.message_processed(message.seq_id, message.ack_id)
                 elif message.ack_id == ACK_ACCEPT_JOINING_REQUEST:
                     self.logger.info(
                         "Received success response for NodeAllowJoiningRequest from (circle+) %s with sequence id %s",
@@ -955,8 +1256,10 @@ class stick(object):
                                 self._nodes_to_discover[mac_to_discover],
                                 message.node_type.value,
                             )
-            if self._plugwise_nodes.get(mac):
-                self._plugwise_nodes[mac].on_message(message)
+            if mac in self._plugwise_nodes:
+                # Unsupported node types are stored as None
+                if self._plugwise_nodes[mac]:
+                    self._plugwise_nodes[mac].on_message(message)
                 self.message_processed(message.seq_id)
         elif isinstance(message, NodeAwakeResponse):
             # Message from SED node notifying it is currently awake.
@@ -983,6 +1286,7 @@ class stick(object):
                 mac,
             )
             if not self._plugwise_nodes.get(mac):
+                self._publish_event(JoinRequestEvent(mac, datetime.now()))
                 if self._accept_join_requests:
                     # Send accept join request
                     self.logger.info(
@@ -1121,6 +1425,13 @@ class stick(object):
                     str(seq_id),
                 )
                 do_callback = True
+            elif ack_response == ACK_POWER_LOG_INTERVAL_SET:
+                self.logger.debug(
+                    "Process ACK_POWER_LOG_INTERVAL_SET for %s with seq_id %s",
+                    str(self.expected_responses[seq_id][1].__class__.__name__),
+                    str(seq_id),
+                )
+                do_callback = True
             elif ack_response == ACK_CLOCK_SET:
                 self.logger.debug(
                     "Process ACK_CLOCK_SET for %s with seq_id %s",
@@ -1175,10 +1486,8 @@ class stick(object):
                 if self.expected_responses[seq_id][3] <= MESSAGE_RETRY:
                     if (
                         isinstance(self.expected_responses[seq_id][1], NodeInfoRequest)
-                        and not self._discovery_finished
-                        and mac in self._nodes_not_discovered
-                        and self.expected_responses[seq_id][2].__name__
-                        == "node_discovered"
+                        and self._discovery
+                        and self._discovery.is_active(mac)
                     ):
                         # Time out for node which is not discovered yet
                         # to speedup the initial discover phase skip retries and mark node as not discovered.
@@ -1186,7 +1495,7 @@ class stick(object):
                             "Skip retries for %s to speedup discover process",
                             mac,
                         )
-                        self.expected_responses[seq_id][2](True)
+                        self._request_dropped(self.expected_responses[seq_id])
                     elif isinstance(
                         self.expected_responses[seq_id][1], NodeInfoRequest
                     ) or isinstance(
@@ -1203,6 +1512,7 @@ class stick(object):
                             self.expected_responses[seq_id][1],
                             self.expected_responses[seq_id][2],
                             self.expected_responses[seq_id][3] + 1,
+                            self.expected_responses[seq_id][5],
                         )
                     else:
                         if (
@@ -1224,6 +1534,7 @@ class stick(object):
                                 self.expected_responses[seq_id][1],
                                 self.expected_responses[seq_id][2],
                                 self.expected_responses[seq_id][3] + 1,
+                                self.expected_responses[seq_id][5],
                             )
                         else:
                             self.logger.debug(
@@ -1235,6 +1546,7 @@ class stick(object):
                                 ),
                                 mac,
                             )
+                            self._request_dropped(self.expected_responses[seq_id])
                 else:
                     self.logger.info(
                         "Drop request for %s for %s because max retries %s reached",
@@ -1242,6 +1554,7 @@ class stick(object):
                         mac,
                         str(MESSAGE_RETRY + 1),
                     )
+                    self._request_dropped(self.expected_responses[seq_id])
                     if isinstance(
                         self.expected_responses[seq_id][1], NodeInfoRequest
                     ) or isinstance(
@@ -1290,92 +1603,62 @@ class stick(object):
                     str(seq_id),
                 )
 
-    def _watchdog_loop(self):
-        """
-        Main worker loop to watch all other worker threads
-        """
-        time.sleep(5)
-        circle_plus_retry_counter = 0
-        while self._run_watchdog:
-            # Connection
-            if self.connection.is_connected():
-                # Connection reader daemon
-                if not self.connection.read_thread_alive():
-                    self.logger.warning("Unexpected halt of connection reader thread")
-                # Connection writer daemon
-                if not self.connection.write_thread_alive():
-                    self.logger.warning("Unexpected halt of connection writer thread")
-            # receive timeout daemon
-            if self._run_receive_timeout_thread:
-                if not self._receive_timeout_thread.isAlive():
-                    self.logger.warning(
-                        "Unexpected halt of receive thread, restart thread",
-                    )
-                    self._receive_timeout_thread = threading.Thread(
-                        None,
-                        self._receive_timeout_loop,
-                        "receive_timeout_thread",
-                        (),
-                        {},
-                    )
-                    self._receive_timeout_thread.daemon = True
-                    self._receive_timeout_thread.start()
-            # send message deamon
-            if self._run_send_message_thread:
-                if not self._send_message_thread.isAlive():
-                    self.logger.warning(
-                        "Unexpected halt of send thread, restart thread",
-                    )
-                    self._send_message_thread = threading.Thread(
-                        None, self._send_message_loop, "send_messages_thread", (), {}
-                    )
-                    self._send_message_thread.daemon = True
-                    self._send_message_thread.start()
-            # Update daemon
-            if self._run_update_thread:
-                if not self._update_thread.isAlive():
-                    self.logger.warning(
-                        "Unexpected halt of update thread, restart thread",
-                    )
-                    self._run_update_thread = True
-                    self._update_thread = threading.Thread(
-                        None, self._update_loop, "update_thread", (), {}
-                    )
-                    self._update_thread.daemon = True
-                    self._update_thread.start()
-            # Circle+ discovery
-            if self._circle_plus_discovered == False:
-                # First hour every once an hour
-                if self._circle_plus_retries < 60 or circle_plus_retry_counter > 60:
-                    self.logger.info(
-                        "Circle+ not yet discovered, resubmit discovery request",
-                    )
-                    self.discover_node(self.circle_plus_mac, self.scan)
-                    self._circle_plus_retries += 1
-                    circle_plus_retry_counter = 0
-                circle_plus_retry_counter += 1
-            watchdog_loop_checker = 0
-            while watchdog_loop_checker < WATCHDOG_DEAMON and self._run_watchdog:
-                time.sleep(1)
-                watchdog_loop_checker += 1
-        self.logger.debug("watchdog loop stopped")
-
-    def _update_loop(self):
+    def _watchdog(self):
+        """ Restart halted sending of requests and retry discovery of Circle+ """
+        # Connection
+        if self.connection.is_connected():
+            # Connection reader daemon
+            if not self.connection.read_thread_alive():
+                self.logger.warning("Unexpected halt of connection reader thread")
+            # Connection writer daemon
+            if not self.connection.write_thread_alive():
+                self.logger.warning("Unexpected halt of connection writer thread")
+        # Sending of requests by the scheduler
+        if (
+            self._run_send_messages
+            and self._send_busy
+            and self._send_activity is not None
+            and time.monotonic() - self._send_activity > MESSAGE_TIME_OUT
+        ):
+            self.logger.warning("Unexpected halt of sending requests, restart sending")
+            self._send_activity = time.monotonic()
+            self._send_job = self._scheduler.call_later(0, self._send_next_message)
+        # Circle+ discovery
+        if self._circle_plus_discovered == False:
+            # First hour every once an hour
+            if self._circle_plus_retries < 60 or self._circle_plus_retry_counter > 60:
+                self.logger.info(
+                    "Circle+ not yet discovered, resubmit discovery request",
+                )
+                self.discover_node(self.circle_plus_mac, self.scan)
+                self._circle_plus_retries += 1
+                self._circle_plus_retry_counter = 0
+            self._circle_plus_retry_counter += 1
+
+    def _update_nodes(self):
         """
-        When node has not received any message during
-        last 2 update polls, reset availability
+        Request power usage of all nodes, when node has not received
+        any message during last 2 update polls, reset availability
         """
-        self._run_update_thread = True
-        self._auto_update_first_run = True
-        day_of_month = datetime.now().day
-        try:
-            while self._run_update_thread:
-                for mac in self._plugwise_nodes:
-                    if self._plugwise_nodes[mac]:
-                        # Check availability state of SED's
-                        if self._plugwise_nodes[mac].is_sed():
-                            if self._plugwise_nodes[mac].get_available():
-                                if self._plugwise_nodes[mac].last_update < (
+        for mac in self._plugwise_nodes:
+            if self._plugwise_nodes[mac]:
+                # Check availability state of SED's
+                if self._plugwise_nodes[mac].is_sed():
+                    if self._plugwise_nodes[mac].get_available():
+                        if self._plugwise_nodes[mac].last_update < (
+                            datetime.now()
+                            - timedelta(
+                                minutes=(
+                                    self._plugwise_nodes[mac]._maintenance_interval + 1
+                                )
+                            )
+                        ):
+                            self.logger.info(
+                                "No messages received within (%s minutes) of expected maintenance interval from node %s, mark as unavailable [%s > %s]",
+                                str(self._plugwise_nodes[mac]._maintenance_interval),
+                                mac,
+                                str(self._plugwise_nodes[mac].last_update),
+                                str(
                                     datetime.now()
                                     - timedelta(
                                         minutes=(
@@ -1385,160 +1668,121 @@ class stick(object):
                                             + 1
                                         )
                                     )
-                                ):
-                                    self.logger.info(
-                                        "No messages received within (%s minutes) of expected maintenance interval from node %s, mark as unavailable [%s > %s]",
-                                        str(
-                                            self._plugwise_nodes[
-                                                mac
-                                            ]._maintenance_interval
-                                        ),
-                                        mac,
-                                        str(self._plugwise_nodes[mac].last_update),
-                                        str(
-                                            datetime.now()
-                                            - timedelta(
-                                                minutes=(
-                                                    self._plugwise_nodes[
-                                                        mac
-                                                    ]._maintenance_interval
-                                                    + 1
-                                                )
-                                            )
-                                        ),
-                                    )
-                                    self._plugwise_nodes[mac].set_available(False)
-                        else:
-                            # Do ping request
-                            self.logger.debug(
-                                "Send ping to node %s",
-                                mac,
+                                ),
                             )
-                            self._plugwise_nodes[mac].ping()
+                            self._plugwise_nodes[mac].set_available(False)
+                else:
+                    # Do ping request
+                    self.logger.debug(
+                        "Send ping to node %s",
+                        mac,
+                    )
+                    self._plugwise_nodes[mac].ping()
 
-                    # Only power use updates for supported nodes
-                    if (
-                        isinstance(self._plugwise_nodes[mac], PlugwiseCircle)
-                        or isinstance(self._plugwise_nodes[mac], PlugwiseCirclePlus)
-                        or isinstance(self._plugwise_nodes[mac], PlugwiseStealth)
-                    ):
-                        # Don't check at first time
+            # Only power use updates for supported nodes
+            if (
+                isinstance(self._plugwise_nodes[mac], PlugwiseCircle)
+                or isinstance(self._plugwise_nodes[mac], PlugwiseCirclePlus)
+                or isinstance(self._plugwise_nodes[mac], PlugwiseStealth)
+            ):
+                # Don't check at first time
+                self.logger.debug("Request current power usage for node %s", mac)
+                if not self._auto_update_first_run and self._update_job:
+                    # Only request update if node is available
+                    if self._plugwise_nodes[mac].get_available():
                         self.logger.debug(
-                            "Request current power usage for node %s", mac
+                            "Node '%s' is available for update request, last update (%s)",
+                            mac,
+                            str(self._plugwise_nodes[mac].get_last_update()),
                         )
-                        if not self._auto_update_first_run and self._run_update_thread:
-                            # Only request update if node is available
-                            if self._plugwise_nodes[mac].get_available():
-                                self.logger.debug(
-                                    "Node '%s' is available for update request, last update (%s)",
-                                    mac,
-                                    str(self._plugwise_nodes[mac].get_last_update()),
-                                )
-                                # Skip update request if there is still an request expected to be received
-                                open_requests_found = False
-                                for seq_id in list(self.expected_responses.keys()):
-                                    if isinstance(
-                                        self.expected_responses[seq_id][1],
-                                        CirclePowerUsageRequest,
-                                    ):
-                                        if mac == self.expected_responses[seq_id][
-                                            1
-                                        ].mac.decode(UTF8_DECODE):
-                                            open_requests_found = True
-                                            break
-                                if not open_requests_found:
-                                    self._plugwise_nodes[mac].update_power_usage()
-                                # Refresh node info once per hour and request power use afterwards
-                                if self._plugwise_nodes[mac]._last_info_message != None:
-                                    if self._plugwise_nodes[mac]._last_info_message < (
-                                        datetime.now().replace(
-                                            minute=0,
-                                            second=0,
-                                            microsecond=0,
-                                        )
-                                    ):
-                                        self._plugwise_nodes[mac]._request_info(
-                                            self._plugwise_nodes[
-                                                mac
-                                            ]._request_power_buffer
-                                        )
-                                if not self._plugwise_nodes[mac]._last_log_collected:
-                                    self._plugwise_nodes[mac]._request_power_buffer()
-                        else:
-                            if self._run_update_thread:
-                                self.logger.debug(
-                                    "First request for current power usage for node %s",
-                                    mac,
-                                )
-                                self._plugwise_nodes[mac].update_power_usage()
-                        self._auto_update_first_run = False
-
-                        # Sync internal clock of all available Circle and Circle+ nodes once a day
-                        if datetime.now().day != day_of_month:
-                            day_of_month = datetime.now().day
-                            if self._plugwise_nodes[mac].get_available():
-                                self._plugwise_nodes[mac].sync_clock()
-
-                # Try to rediscover node(s) which where not available at initial scan
-                # Do this the first hour at every update, there after only once an hour
-                for mac in self._nodes_not_discovered:
-                    (firstrequest, lastrequest) = self._nodes_not_discovered[mac]
-                    if firstrequest and lastrequest:
-                        if (firstrequest + timedelta(hours=1)) > datetime.now():
-                            # first hour, so do every update a request
-                            self.logger.debug(
-                                "Try rediscovery of node %s",
-                                mac,
-                            )
-                            self.discover_node(mac, self._discover_after_scan, True)
-                            self._nodes_not_discovered[mac] = (
-                                firstrequest,
-                                datetime.now(),
-                            )
-                        else:
-                            if (lastrequest + timedelta(hours=1)) < datetime.now():
-                                self.logger.debug(
-                                    "Try rediscovery of node %s",
-                                    mac,
+                        # Skip update request if there is still an request expected to be received
+                        open_requests_found = False
+                        for seq_id in list(self.expected_responses.keys()):
+                            if isinstance(
+                                self.expected_responses[seq_id][1],
+                                CirclePowerUsageRequest,
+                            ):
+                                if mac == self.expected_responses[seq_id][1].mac.decode(
+                                    UTF8_DECODE
+                                ):
+                                    open_requests_found = True
+                                    break
+                        if not open_requests_found:
+                            self._plugwise_nodes[mac].update_power_usage()
+                        # Refresh node info once per hour and request power use afterwards
+                        if self._plugwise_nodes[mac]._last_info_message != None:
+                            if self._plugwise_nodes[mac]._last_info_message < (
+                                datetime.now().replace(
+                                    minute=0,
+                                    second=0,
+                                    microsecond=0,
                                 )
-                                self.discover_node(mac, self._discover_after_scan, True)
-                                self._nodes_not_discovered[mac] = (
-                                    firstrequest,
-                                    datetime.now(),
+                            ):
+                                self._plugwise_nodes[mac]._request_info(
+                                    self._plugwise_nodes[mac]._request_power_buffer
                                 )
-                    else:
+                        if not self._plugwise_nodes[mac]._last_log_collected:
+                            self._plugwise_nodes[mac]._request_power_buffer()
+                else:
+                    if self._update_job:
+                        self.logger.debug(
+                            "First request for current power usage for node %s",
+                            mac,
+                        )
+                        self._plugwise_nodes[mac].update_power_usage()
+                self._auto_update_first_run = False
+
+        # Validate internal clock of all available Circle and Circle+ nodes once a day
+        if self._clock_validated != datetime.now().date():
+            self._validate_clocks()
+
+        # Try to rediscover node(s) which where not available at initial scan
+        # Do this the first hour at every update, there after only once an hour
+        for mac in self._nodes_not_discovered:
+            (firstrequest, lastrequest) = self._nodes_not_discovered[mac]
+            if firstrequest and lastrequest:
+                if (firstrequest + timedelta(hours=1)) > datetime.now():
+                    # first hour, so do every update a request
+                    self.logger.debug(
+                        "Try rediscovery of node %s",
+                        mac,
+                    )
+                    self.discover_node(mac, self._discover_after_scan, True)
+                    self._nodes_not_discovered[mac] = (
+                        firstrequest,
+                        datetime.now(),
+                    )
+                else:
+                    if (lastrequest + timedelta(hours=1)) < datetime.now():
                         self.logger.debug(
                             "Try rediscovery of node %s",
                             mac,
                         )
                         self.discover_node(mac, self._discover_after_scan, True)
                         self._nodes_not_discovered[mac] = (
-                            datetime.now(),
+                            firstrequest,
                             datetime.now(),
                         )
-                if self._auto_update_timer and self._run_update_thread:
-                    update_loop_checker = 0
-                    while (
-                        update_loop_checker < self._auto_update_timer
-                        and self._run_update_thread
-                    ):
-                        time.sleep(1)
-                        update_loop_checker += 1
-
-        except Exception as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            self.logger.error(
-                "Error at line %s of _update_loop : %s", exc_tb.tb_lineno, e
-            )
-        self.logger.debug("Update loop stopped")
+            else:
+                self.logger.debug(
+                    "Try rediscovery of node %s",
+                    mac,
+                )
+                self.discover_node(mac, self._discover_after_scan, True)
+                self._nodes_not_discovered[mac] = (
+                    datetime.now(),
+                    datetime.now(),
+                )
 
     def auto_update(self, timer=None):
         """
         setup auto update polling for power usage.
         """
         if timer == 0:
-            self._run_update_thread = False
             self._auto_update_timer = 0
+            if self._update_job:
+                self._update_job.cancel()
+                self._update_job = None
         else:
             self._auto_update_timer = 5
             if timer == None:
@@ -1546,5 +1790,10 @@ class stick(object):
                 self._auto_update_timer = len(self._plugwise_nodes) * 3
             elif timer > 5:
                 self._auto_update_timer = timer
-            if not self._run_update_thread:
-                self._update_thread.start()
+            if self._update_job:
+                self._update_job.interval = self._auto_update_timer
+            else:
+                self._auto_update_first_run = True
+                self._update_job = self._scheduler.call_every(
+                    self._auto_update_timer, self._update_nodes, delay=0
+                )
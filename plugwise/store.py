@@ -0,0 +1,225 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Long term hourly energy history stored in memory mapped files
+"""
+import math
+import mmap
+import os
+import struct
+import threading
+from plugwise.constants import STORE_GROW_HOURS
+from plugwise.exceptions import EnergyStoreError
+from plugwise.history import hour_number
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Layout of file: header followed by one record for every hour from the first hour.
+# Header: magic, layout version, reserved, first hour number
+HEADER = struct.Struct("<4sHHq")
+MAGIC = b"PWEH"
+VERSION = 1
+RECORD = struct.Struct("<d")
+NO_DATA = RECORD.pack(math.nan)
+
+
+class NodeEnergyFile(object):
+    """
+    File with one little endian double (kWh) for every hour starting at the
+    first hour in the header, which is the day of the oldest hour written.
+    Hours without data contain NaN. The file grows in blocks of STORE_GROW_HOURS,
+    writing an hour before the first hour rewrites the file.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._stale_maps = []
+        self._first_hour = 0
+        self._hours = 0
+        self._open_file()
+        size = os.fstat(self._file.fileno()).st_size
+        if size >= HEADER.size:
+            magic, version, _, first_hour = HEADER.unpack(self._file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                self._file.close()
+                raise EnergyStoreError("Unknown format of energy file " + path)
+            self._first_hour = first_hour
+            hours = (size - HEADER.size) // RECORD.size
+            if hours:
+                self._open_map(hours)
+
+    def _open_file(self):
+        """ Open existing or new file for update """
+        # Append mode ignores seeks when writing
+        self._file = os.fdopen(
+            os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644), "r+b"
+        )
+
+    def _open_map(self, hours):
+        """ Map file for given number of hours """
+        if self._map is not None:
+            self._stale_maps.append(self._map)
+        self._map = mmap.mmap(self._file.fileno(), HEADER.size + hours * RECORD.size)
+        self._hours = hours
+        self._close_stale_maps()
+
+    def _close_stale_maps(self):
+        """ Close replaced maps, a map stays open while views of it are in use """
+        for stale_map in list(self._stale_maps):
+            try:
+                stale_map.close()
+            except BufferError:
+                continue
+            self._stale_maps.remove(stale_map)
+
+    def _grow(self, hour):
+        """ Extend file with empty hours so it contains given hour """
+        if self._map is None:
+            self._first_hour = hour - hour % 24
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, VERSION, 0, self._first_hour))
+        elif hour < self._first_hour:
+            self._prepend(hour)
+            return
+        hours = ((hour - self._first_hour) // STORE_GROW_HOURS + 1) * STORE_GROW_HOURS
+        self._file.seek(HEADER.size + self._hours * RECORD.size)
+        self._file.write(NO_DATA * (hours - self._hours))
+        self._file.flush()
+        self._open_map(hours)
+
+    def _prepend(self, hour):
+        """
+        Replace file by a copy starting with empty hours so it contains given hour.
+        Maps of the replaced file stay valid while views of them are in use.
+        """
+        blocks = -((hour - self._first_hour) // STORE_GROW_HOURS)
+        first_hour = self._first_hour - blocks * STORE_GROW_HOURS
+        temp_path = self._path + ".tmp"
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(HEADER.pack(MAGIC, VERSION, 0, first_hour))
+            temp_file.write(NO_DATA * (self._first_hour - first_hour))
+            temp_file.write(self._map[HEADER.size :])
+        os.replace(temp_path, self._path)
+        self._file.close()
+        self._open_file()
+        self._first_hour = first_hour
+        self._open_map(self._hours + blocks * STORE_GROW_HOURS)
+
+    def first_hour(self) -> int:
+        """ Return number of first hour in file """
+        return self._first_hour
+
+    def end_hour(self) -> int:
+        """ Return number of the hour after the last hour in file """
+        return self._first_hour + self._hours
+
+    def write(self, hour, value):
+        """ Store energy of given hour number """
+        if hour < 0:
+            return
+        with self._lock:
+            if self._map is None or not (
+                self._first_hour <= hour < self._first_hour + self._hours
+            ):
+                self._grow(hour)
+            RECORD.pack_into(self._map, self._offset(hour), value)
+
+    def read(self, first_hour, last_hour):
+        """
+        Return read only view of energy of hours first_hour up to
+        (not including) last_hour without copying.
+        Hours outside the file are not included.
+        """
+        with self._lock:
+            end_hour = self._first_hour + self._hours
+            first_hour = max(self._first_hour, min(first_hour, end_hour))
+            last_hour = max(first_hour, min(last_hour, end_hour))
+            if self._map is None:
+                return numpy.empty(0) if numpy else memoryview(b"").cast("d")
+            if numpy:
+                values = numpy.frombuffer(
+                    self._map,
+                    dtype="<f8",
+                    count=last_hour - first_hour,
+                    offset=self._offset(first_hour),
+                )
+                values.flags.writeable = False
+                return values
+            return (
+                memoryview(self._map)[
+                    self._offset(first_hour) : self._offset(last_hour)
+                ]
+                .toreadonly()
+                .cast("d")
+            )
+
+    def _offset(self, hour) -> int:
+        return HEADER.size + (hour - self._first_hour) * RECORD.size
+
+    def flush(self):
+        """ Write changed pages to disk """
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        """ Flush and close file and maps which are not in use anymore """
+        self.flush()
+        with self._lock:
+            if self._map is not None:
+                self._stale_maps.append(self._map)
+                self._map = None
+                self._hours = 0
+            self._close_stale_maps()
+            self._file.close()
+
+
+class EnergyStore(object):
+    """
+    Hourly energy history of all nodes, one file per node in given folder.
+    Hours are numbered in UTC since start of the plugwise epoch.
+    """
+
+    def __init__(self, folder):
+        self._folder = folder
+        self._lock = threading.Lock()
+        self._files = {}
+        os.makedirs(folder, exist_ok=True)
+
+    def node(self, mac) -> NodeEnergyFile:
+        """ Return energy file of node, opened on first use """
+        with self._lock:
+            if mac not in self._files:
+                self._files[mac] = NodeEnergyFile(
+                    os.path.join(self._folder, mac + ".energy")
+                )
+            return self._files[mac]
+
+    def write(self, mac, dt, value):
+        """ Store energy of the hour starting at given (UTC) datetime """
+        self.node(mac).write(hour_number(dt), value)
+
+    def read(self, mac, start, end):
+        """
+        Return energy per hour between start and end (UTC datetimes) of node
+        as read only numpy array, or memoryview of doubles when numpy is not available.
+        """
+        return self.node(mac).read(hour_number(start), hour_number(end))
+
+    def flush(self):
+        """ Write changes of all nodes to disk """
+        for node_file in list(self._files.values()):
+            node_file.flush()
+
+    def close(self):
+        """ Close files of all nodes """
+        with self._lock:
+            for node_file in self._files.values():
+                node_file.close()
+            self._files = {}
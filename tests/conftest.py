@@ -0,0 +1,97 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Shared fixtures of the tests
+"""
+from datetime import timedelta
+import logging
+import threading
+import pytest
+from plugwise.cache import PlugwiseCache
+from plugwise.messages.responses import CirclePowerBufferResponse
+from plugwise.nodes.circle import PlugwiseCircle
+from plugwise.scheduler import Scheduler
+from plugwise.simulator import SimulatedStick
+
+SCAN_TIME_OUT = 60
+MAC = "000D6F0000000001"
+
+
+class StubStick(object):
+    """ Stick without connection, collecting the requests sent by nodes """
+
+    def __init__(self):
+        self.logger = logging.getLogger("python-plugwise")
+        self.cache = PlugwiseCache(None)
+        self.timezone_delta = timedelta(0)
+        self.energy_store = None
+        self.callback_executor = None
+        self.print_progress = False
+        self.expected_responses = {}
+        self.sent = []
+        self.nodes = {}
+        self._scheduler = Scheduler("test_scheduler_thread")
+
+    def send(self, request, callback=None, retry_counter=0, priority=None):
+        self.sent.append((request, callback, priority))
+
+    def node(self, mac):
+        return self.nodes.get(mac)
+
+    def call_later(self, delay, callback, *args):
+        return self._scheduler.call_later(delay, callback, *args)
+
+    def _state_changed(self, node, sensor):
+        pass
+
+
+def calibrated_circle(stub_stick):
+    """ Return circle with calibration of a real device """
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    node._gain_a = 0.9903475046157837
+    node._gain_b = -1.8853e-07
+    node._off_noise = 0.0
+    node._off_tot = 0.002396
+    node.calibration = True
+    return node
+
+
+def power_buffer(log_address, records):
+    """ Return power buffer response with (log date, pulses) of 4 log buffers """
+    message = CirclePowerBufferResponse()
+    message.logaddr.value = log_address
+    for i, (log_date, pulses) in enumerate(records, 1):
+        getattr(message, "logdate%d" % (i,)).value = log_date
+        getattr(message, "pulses%d" % (i,)).value = pulses
+    return message
+
+
+@pytest.fixture
+def stub_stick():
+    """ Return stick stub with running scheduler """
+    stick = StubStick()
+    stick._scheduler.start()
+    yield stick
+    stick._scheduler.stop()
+
+
+@pytest.fixture
+def simulator():
+    """ Return simulated stick with a small network """
+    simulator = SimulatedStick(circles=4, scans=1, latency=0.01, seed=1)
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def scan():
+    """ Return function to initialize a stick and wait until discovery is finished """
+
+    def scan(plugwise):
+        plugwise.connect()
+        plugwise.initialize_stick()
+        finished = threading.Event()
+        plugwise.scan(finished.set)
+        assert finished.wait(SCAN_TIME_OUT)
+
+    return scan
@@ -0,0 +1,104 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of deadband and minimum interval filters of sensor callbacks
+"""
+import threading
+import time
+from plugwise.constants import SENSOR_AVAILABLE, SENSOR_PING
+from plugwise.nodes.circle import PlugwiseCircle
+
+MAC = "000D6F0000000001"
+
+
+def ping(node, values):
+    """ Update ping sensor of node with all values """
+    for value in values:
+        node.ping_ms = value
+        node.do_callback(SENSOR_PING["id"])
+
+
+def test_unfiltered_callback_for_every_update(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    calls = []
+    node.subscribe_callback(calls.append, SENSOR_PING["id"])
+    ping(node, [10, 10, 11])
+    assert len(calls) == 3
+
+
+def test_absolute_deadband(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    values = []
+    node.subscribe_callback(
+        lambda _: values.append(node.get_ping()), SENSOR_PING["id"], deadband=5
+    )
+    ping(node, [100, 103, 105, 106, 110, 112])
+    assert values == [100, 106, 112]
+
+
+def test_percentage_deadband(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    values = []
+    node.subscribe_callback(
+        lambda _: values.append(node.get_ping()), SENSOR_PING["id"], deadband_pct=10
+    )
+    ping(node, [100, 109, 111, 120, 123])
+    assert values == [100, 111, 123]
+
+
+def test_non_numeric_value_passes_when_changed(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    values = []
+    node.subscribe_callback(
+        lambda _: values.append(node.get_available()),
+        SENSOR_AVAILABLE["id"],
+        deadband=1,
+    )
+    node.set_available(True)
+    node.do_callback(SENSOR_AVAILABLE["id"])
+    node.set_available(False)
+    assert values == [True, False]
+
+
+def test_min_interval_passes_last_value_at_end_of_interval(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    values = []
+    node.subscribe_callback(
+        lambda _: values.append(node.get_ping()), SENSOR_PING["id"], min_interval=0.2
+    )
+    ping(node, [1, 2, 3])
+    assert values == [1]
+    time.sleep(0.4)
+    assert values == [1, 3]
+
+
+def test_unsubscribe_cancels_pending_update(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    values = []
+    callback = lambda _: values.append(node.get_ping())
+    node.subscribe_callback(callback, SENSOR_PING["id"], min_interval=0.2)
+    ping(node, [1, 2])
+    node.unsubscribe_callback(callback, SENSOR_PING["id"])
+    time.sleep(0.4)
+    assert values == [1]
+
+
+def test_min_interval_with_concurrent_updates(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    calls = []
+    node.subscribe_callback(calls.append, SENSOR_PING["id"], min_interval=0.05)
+
+    def update():
+        for value in range(2000):
+            ping(node, [value])
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=update) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(0.1)
+    elapsed = time.monotonic() - start
+    # At most one callback per interval, including the trailing one
+    assert 1 <= len(calls) <= elapsed / 0.05 + 2
@@ -0,0 +1,28 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of capture and replay of stick traffic
+"""
+import pytest
+from plugwise.connections.capture import DIRECTION_IN, DIRECTION_OUT, read_capture
+from plugwise.stick import stick
+
+
+@pytest.mark.parametrize("replay_speed", [0, 4])
+def test_replay_of_captured_scan(simulator, scan, tmp_path, replay_speed):
+    capture_file = str(tmp_path / "plugwise.capture")
+    plugwise = stick(simulator.open_tcp(), capture_file=capture_file)
+    try:
+        scan(plugwise)
+        nodes = sorted(plugwise.nodes())
+    finally:
+        plugwise.disconnect()
+    (_, records) = read_capture(capture_file)
+    directions = {record.direction for record in records}
+    assert directions == {DIRECTION_IN, DIRECTION_OUT}
+    replay = stick("replay:" + capture_file, replay_speed=replay_speed)
+    try:
+        scan(replay)
+        assert sorted(replay.nodes()) == nodes
+    finally:
+        replay.disconnect()
@@ -0,0 +1,87 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of power calculations and power logs of circles
+"""
+from datetime import datetime, timedelta
+import pytest
+from plugwise.history import hour_number
+from plugwise.nodes import circle
+from plugwise.nodes.circle import PlugwiseCircle
+from conftest import calibrated_circle, power_buffer
+
+MAC = "000D6F0000000001"
+PULSES = [0, 1, 2, 17, 250, 4096, 65535, -1, -300, 123456]
+
+
+@pytest.mark.parametrize("seconds", [1, 8, 3600])
+def test_pulses_to_kws_array_fallback_matches_scalar(stub_stick, monkeypatch, seconds):
+    monkeypatch.setattr(circle, "numpy", None)
+    node = calibrated_circle(stub_stick)
+    expected = [node.pulses_to_kWs(pulses, seconds) for pulses in PULSES]
+    assert list(node.pulses_to_kWs_array(PULSES, seconds)) == expected
+
+
+@pytest.mark.parametrize("seconds", [1, 8, 3600])
+def test_pulses_to_kws_array_numpy_matches_scalar(stub_stick, seconds):
+    pytest.importorskip("numpy")
+    node = calibrated_circle(stub_stick)
+    expected = [node.pulses_to_kWs(pulses, seconds) for pulses in PULSES]
+    assert list(node.pulses_to_kWs_array(PULSES, seconds)) == expected
+
+
+def test_pulses_to_kws_array_without_calibration(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    assert list(node.pulses_to_kWs_array(PULSES)) == [0.0] * len(PULSES)
+
+
+def test_zero_production_is_not_logged_as_consumption(stub_stick):
+    node = calibrated_circle(stub_stick)
+    node._log_interval_production = 60
+    hour = datetime(2021, 6, 1, 10)
+    # Consumption and production buffers alternate, production of 0 pulses
+    node._response_power_buffer(
+        power_buffer(
+            5,
+            [
+                (hour + timedelta(hours=1), 3600),
+                (hour + timedelta(hours=1), 0),
+                (hour + timedelta(hours=2), 7200),
+                (hour + timedelta(hours=2), 0),
+            ],
+        )
+    )
+    expected = [node.pulses_to_kWs(pulses, 3600) for pulses in (3600, 7200)]
+    assert expected[0] > 0.0 and expected[1] > 0.0
+    assert node.energy_index.get(hour_number(hour)) == expected[0]
+    assert node.energy_index.get(hour_number(hour) + 1) == expected[1]
+
+
+def test_zero_production_of_sub_hour_intervals(stub_stick):
+    node = calibrated_circle(stub_stick)
+    node._log_interval_consumption = 30
+    node._log_interval_production = 30
+    hour = datetime(2021, 6, 1, 10)
+    node._response_power_buffer(
+        power_buffer(
+            5,
+            [
+                (hour + timedelta(minutes=30), 1800),
+                (hour + timedelta(minutes=30), 0),
+                (hour + timedelta(minutes=60), 1800),
+                (hour + timedelta(minutes=60), 0),
+            ],
+        )
+    )
+    half_hour = node.pulses_to_kWs(1800, 1800) / 2
+    assert node.energy_index.get(hour_number(hour)) == 2 * half_hour
+
+
+def test_production_interval_must_match_consumption(stub_stick):
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    assert not node.set_log_interval(15, 60)
+    assert not node.set_log_interval(7, 0)
+    assert stub_stick.sent == []
+    assert node.set_log_interval(15, 15)
+    assert node.set_log_interval(60, 0)
+    assert len(stub_stick.sent) == 2
@@ -0,0 +1,89 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of the scan for linked nodes by the Circle+
+"""
+from types import SimpleNamespace
+from plugwise.constants import CACHE_SCAN_BITMAP, CIRCLE_PLUS_ADDRESSES, PRIORITY_LOW
+from plugwise.messages.requests import CirclePlusScanRequest
+from plugwise.nodes.circle_plus import PlugwiseCirclePlus
+
+MAC = "000D6F0000000001"
+EMPTY = b"FFFFFFFFFFFFFFFF"
+LINKED = {3: "000D6F0000000003", 10: "000D6F000000000A"}
+
+
+def scan_response(node_address):
+    """ Return scan response of address of the linked network """
+    node_mac = LINKED[node_address].encode() if node_address in LINKED else EMPTY
+    return SimpleNamespace(
+        node_address=SimpleNamespace(value=node_address),
+        node_mac=SimpleNamespace(value=node_mac),
+    )
+
+
+def scanned_addresses(stick):
+    """ Return (address, priority) of sent scan requests and clear them """
+    addresses = [
+        (request.node_address, priority)
+        for (request, _, priority) in stick.sent
+        if isinstance(request, CirclePlusScanRequest)
+    ]
+    stick.sent = []
+    return addresses
+
+
+def test_first_scan_requests_all_addresses_and_caches_bitmap(stub_stick):
+    circle_plus = PlugwiseCirclePlus(MAC, 0, stub_stick)
+    found = []
+    circle_plus.scan_for_nodes(found.append)
+    addresses = scanned_addresses(stub_stick)
+    assert [address for (address, _) in addresses] == list(range(CIRCLE_PLUS_ADDRESSES))
+    # Responses out of order do not resend requests still in flight
+    for node_address in reversed(range(CIRCLE_PLUS_ADDRESSES)):
+        circle_plus._process_scan_response(scan_response(node_address))
+    assert scanned_addresses(stub_stick) == []
+    assert found == [{mac: address for (address, mac) in LINKED.items()}]
+    assert circle_plus.scan_progress() == {
+        "requested": CIRCLE_PLUS_ADDRESSES,
+        "received": CIRCLE_PLUS_ADDRESSES,
+    }
+    assert stub_stick.cache.get(circle_plus._cache_key(CACHE_SCAN_BITMAP)) == (
+        1 << 3
+    ) | (1 << 10)
+
+
+def test_cached_bitmap_confirms_used_addresses_first(stub_stick):
+    circle_plus = PlugwiseCirclePlus(MAC, 0, stub_stick)
+    stub_stick.cache.set(circle_plus._cache_key(CACHE_SCAN_BITMAP), 1 << 3)
+    found = []
+    new_nodes = []
+    circle_plus.scan_for_nodes(found.append, lambda *args: new_nodes.append(args))
+    addresses = scanned_addresses(stub_stick)
+    assert addresses[0][0] == 3 and addresses[0][1] != PRIORITY_LOW
+    assert len(addresses) == CIRCLE_PLUS_ADDRESSES
+    assert all(priority == PRIORITY_LOW for (_, priority) in addresses[1:])
+    circle_plus._process_scan_response(scan_response(3))
+    assert found == [{LINKED[3]: 3}]
+    circle_plus._process_scan_response(scan_response(10))
+    assert new_nodes == [(LINKED[10], 10)]
+    for node_address in range(CIRCLE_PLUS_ADDRESSES):
+        if node_address not in LINKED:
+            circle_plus._process_scan_response(scan_response(node_address))
+    assert stub_stick.cache.get(circle_plus._cache_key(CACHE_SCAN_BITMAP)) == (
+        1 << 3
+    ) | (1 << 10)
+
+
+def test_dropped_request_is_resent_once(stub_stick):
+    circle_plus = PlugwiseCirclePlus(MAC, 0, stub_stick)
+    stub_stick.cache.set(circle_plus._cache_key(CACHE_SCAN_BITMAP), 1 << 3)
+    found = []
+    circle_plus.scan_for_nodes(found.append)
+    scanned_addresses(stub_stick)
+    circle_plus._scan_request_dropped(3)
+    assert [address for (address, _) in scanned_addresses(stub_stick)] == [3]
+    assert found == []
+    circle_plus._scan_request_dropped(3)
+    assert scanned_addresses(stub_stick) == []
+    assert found == [{}]
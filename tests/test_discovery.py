@@ -0,0 +1,75 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of the discovery of node types
+"""
+from plugwise.discovery import DiscoveryPipeline
+
+
+class ManualAction(object):
+    """ Discovery action keeping the done callbacks to complete them from the test """
+
+    def __init__(self):
+        self.started = []
+        self.callbacks = {}
+
+    def __call__(self, mac, done):
+        self.started.append(mac)
+        self.callbacks[mac] = done
+
+
+def test_discovery_finishes_when_all_nodes_are_done():
+    finished = []
+    action = ManualAction()
+    pipeline = DiscoveryPipeline(action, 2, lambda: finished.append(True))
+    pipeline.add("A")
+    pipeline.add("B")
+    pipeline.start()
+    assert action.started == ["A", "B"]
+    assert pipeline.progress()["first_node_ready"] is None
+    action.callbacks["B"](True)
+    assert pipeline.progress()["first_node_ready"] is not None
+    assert not pipeline.is_finished()
+    action.callbacks["A"](False)
+    assert pipeline.is_finished()
+    assert finished == [True]
+    progress = pipeline.progress()
+    assert (progress["nodes"], progress["done"], progress["failed"]) == (2, 1, 1)
+
+
+def test_concurrency_is_limited():
+    action = ManualAction()
+    pipeline = DiscoveryPipeline(action, 2)
+    for mac in "ABCDE":
+        pipeline.add(mac)
+    pipeline.start()
+    assert action.started == ["A", "B"]
+    action.callbacks["A"](True)
+    assert action.started == ["A", "B", "C"]
+    progress = pipeline.progress()
+    assert (progress["pending"], progress["active"], progress["done"]) == (2, 2, 1)
+
+
+def test_failed_request_and_repeated_done_are_counted_once():
+    action = ManualAction()
+    pipeline = DiscoveryPipeline(action)
+    pipeline.add("A")
+    pipeline.start()
+    assert pipeline.is_active("A")
+    pipeline.request_failed("A")
+    action.callbacks["A"](True)
+    pipeline.request_failed("A")
+    assert not pipeline.is_active("A")
+    progress = pipeline.progress()
+    assert (progress["done"], progress["failed"]) == (0, 1)
+    assert pipeline.is_finished()
+
+
+def test_node_added_while_running_is_started():
+    action = ManualAction()
+    pipeline = DiscoveryPipeline(action)
+    pipeline.start()
+    assert pipeline.is_finished()
+    pipeline.add("A")
+    pipeline.add("A")
+    assert action.started == ["A"]
@@ -0,0 +1,81 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of the download of the complete power log memory
+"""
+from datetime import datetime, timedelta
+import pytest
+from plugwise import download
+from plugwise.download import PowerLogDownload
+from plugwise.nodes.circle import PlugwiseCircle
+
+MAC = "000D6F0000000001"
+START = datetime(2021, 1, 1)
+
+
+@pytest.fixture
+def circle(stub_stick):
+    """ Return Circle with 6 log addresses answering all but the lost ones """
+    circle = PlugwiseCircle(MAC, 1, stub_stick)
+    circle._last_log_address = 5
+    circle.lost = set()
+    circle.requested = []
+
+    def request_power_buffer(log_address=None, callback=None, priority=None):
+        circle.requested.append(log_address)
+        if log_address in circle.lost:
+            return
+        records = [
+            (START + timedelta(hours=4 * log_address + slot), 0.1) for slot in range(4)
+        ]
+        for power_log_callback in list(circle._power_log_callbacks):
+            power_log_callback(MAC, log_address, records)
+
+    circle._request_power_buffer = request_power_buffer
+    stub_stick.nodes[MAC] = circle
+    return circle
+
+
+def test_download_all_log_addresses(stub_stick, circle):
+    power_log = PowerLogDownload(stub_stick, [MAC])
+    records = list(power_log)
+    assert len(records) == 6 * 4
+    assert records[0] == (MAC, START, 0.1)
+    assert power_log.checkpoint() == {MAC: 6}
+    assert power_log.failed == []
+
+
+def test_checkpoint_stays_at_failed_address(stub_stick, circle, monkeypatch):
+    monkeypatch.setattr(download, "DOWNLOAD_TIMEOUT", 0.05)
+    monkeypatch.setattr(download, "DOWNLOAD_CHECK_INTERVAL", 0.02)
+    monkeypatch.setattr(download, "DOWNLOAD_RETRY", 1)
+    circle.lost = {2}
+    power_log = PowerLogDownload(stub_stick, [MAC])
+    records = list(power_log)
+    assert len(records) == 5 * 4
+    assert power_log.failed == [(MAC, 2)]
+    assert circle.requested.count(2) == 2
+    assert power_log.checkpoint() == {MAC: 2}
+    # Resumed download requests the failed address again
+    circle.lost = set()
+    circle.requested = []
+    resumed = PowerLogDownload(stub_stick, [MAC], power_log.checkpoint())
+    records = list(resumed)
+    assert circle.requested == [2, 3, 4, 5]
+    assert resumed.checkpoint() == {MAC: 6}
+
+
+def test_expired_requests_are_resent_while_responses_arrive(
+    stub_stick, circle, monkeypatch
+):
+    monkeypatch.setattr(download, "DOWNLOAD_TIMEOUT", 0.05)
+    monkeypatch.setattr(download, "DOWNLOAD_CHECK_INTERVAL", 0.02)
+    circle._last_log_address = 2000
+    circle.lost = {0}
+    power_log = PowerLogDownload(stub_stick, [MAC], window=2)
+    for (_, dt, _) in power_log:
+        if circle.requested.count(0) > 1:
+            break
+    # Address 0 is requested again before the other addresses are downloaded
+    assert circle.requested.count(0) == 2
+    assert len(circle.requested) < 2000
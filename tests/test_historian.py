@@ -0,0 +1,47 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of the SQLite historian
+"""
+from datetime import datetime, timedelta
+from plugwise.historian import PlugwiseHistorian
+from plugwise.nodes.circle import PlugwiseCircle
+from plugwise.stick import stick
+from conftest import calibrated_circle, power_buffer
+
+
+def test_subscribes_to_circles_found_by_scan(simulator, scan, tmp_path):
+    plugwise = stick(simulator.open_tcp())
+    historian = PlugwiseHistorian(plugwise, str(tmp_path / "history.db"))
+    try:
+        historian.start()
+        scan(plugwise)
+        circles = [
+            plugwise.node(mac)
+            for mac in plugwise.nodes()
+            if isinstance(plugwise.node(mac), PlugwiseCircle)
+        ]
+        # Circle+ and circles
+        assert len(circles) == 5
+        assert sorted(historian._nodes, key=id) == sorted(circles, key=id)
+    finally:
+        historian.stop()
+        plugwise.disconnect()
+
+
+def test_power_log_of_sub_hour_intervals_is_stored_by_hour(stub_stick, tmp_path):
+    node = calibrated_circle(stub_stick)
+    node._log_interval_consumption = 15
+    stub_stick.nodes[node.get_mac()] = node
+    historian = PlugwiseHistorian(stub_stick, str(tmp_path / "history.db"))
+    historian._subscribe_node(node.get_mac())
+    hour = datetime(2021, 6, 1, 10)
+    node._response_power_buffer(
+        power_buffer(
+            5,
+            [(hour + timedelta(minutes=15 * i), 900 * i) for i in range(1, 5)],
+        )
+    )
+    # Intervals are logged at their end, all 4 intervals are part of the same hour
+    hour_energy = sum(node.pulses_to_kWs(900 * i, 900) / 4 for i in range(1, 5))
+    assert historian._log_rows == [(node.get_mac(), hour.isoformat(), hour_energy)]
@@ -0,0 +1,121 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of the hourly energy history
+"""
+from datetime import datetime, timedelta
+import math
+from plugwise.history import (
+    EnergyIndex,
+    EnergyIntegrator,
+    PowerHistory,
+    hour_datetime,
+    hour_number,
+)
+
+
+def test_hour_number_round_trip():
+    dt = datetime(2021, 3, 28, 14)
+    assert hour_datetime(hour_number(dt)) == dt
+    assert hour_number(dt + timedelta(minutes=59)) == hour_number(dt)
+
+
+def test_power_history_is_mapping_by_log_timestamp():
+    index = EnergyIndex()
+    delta = timedelta(hours=2)
+    history = PowerHistory(index, delta)
+    hour_start = datetime(2021, 6, 1, 10)
+    index.set(hour_number(hour_start), 0.25)
+    # Log timestamp is end of the hour in UTC, hours are numbered in local time
+    log_date = hour_start + timedelta(hours=1) - delta
+    assert dict(history) == {log_date: 0.25}
+    assert history[log_date] == 0.25
+    assert log_date + timedelta(minutes=5) not in history
+    assert history.get(log_date - timedelta(hours=1)) is None
+
+
+def test_index_get_and_contains():
+    index = EnergyIndex()
+    index.set(1000, 0.0)
+    index.set(1001, 1.5)
+    assert len(index) == 2
+    assert 1000 in index and 1002 not in index and 10 ** 9 not in index
+    assert index.get(1000) == 0.0
+    assert index.get(1002, 7) == 7
+    assert list(index.hours()) == [1000, 1001]
+
+
+def test_index_totals_and_rollups():
+    index = EnergyIndex()
+    first = hour_number(datetime(2021, 1, 31))
+    for hour in range(first, first + 48):
+        index.set(hour, 1.0)
+    index.set(first + 1, 3.0)
+    assert index.total(first, first + 48) == 50.0
+    assert index.total(first + 1, first + 2) == 3.0
+    assert index.total(first + 10, first + 10) == 0.0
+    assert index.day_total(first // 24) == 26.0
+    assert index.month_total(2021, 1) == 26.0
+    assert index.month_total(2021, 2) == 24.0
+    assert index.months() == {(2021, 1): 26.0, (2021, 2): 24.0}
+
+
+def test_index_grows_in_both_directions():
+    index = EnergyIndex()
+    index.set(5000, 1.0)
+    index.set(100, 2.0)
+    index.set(90000, 4.0)
+    assert index.total(0, 100000) == 7.0
+    assert index.total(101, 90000) == 1.0
+    assert len(index) == 3
+
+
+def test_index_load_keeps_stored_hours_and_skips_nan():
+    index = EnergyIndex()
+    index.set(12, 5.0)
+    index.load(10, [1.0, math.nan, 1.0, 1.0])
+    assert index.get(11) is None
+    assert index.get(12) == 5.0
+    assert index.total(10, 14) == 7.0
+    assert len(index) == 3
+
+
+def test_index_is_limited_to_most_recent_hours():
+    index = EnergyIndex(24 * 8)
+    first = hour_number(datetime(2021, 1, 1))
+    for hour in range(first, first + 24 * 20):
+        index.set(hour, 1.0)
+    assert len(index._values) <= 24 * 8
+    assert len(index) <= 24 * 8
+    assert first + 24 * 20 - 1 in index
+    assert first not in index
+    assert index.day_total(first // 24) == 0.0
+    assert index.day_total(first // 24 + 19) == 24.0
+    assert sum(index.days().values()) == len(index)
+    # Hours before the covered range are ignored
+    index.set(first, 1.0)
+    index.load(first, [1.0] * 24)
+    assert first not in index
+    assert index.total(0, first + 24 * 20) == len(index)
+
+
+def test_integrator_never_decreases_and_corrects_with_logs():
+    integrator = EnergyIntegrator()
+    start = datetime(2021, 1, 1, 10, 30)
+    integrator.update(start, 0.1, 100.0)
+    integrator.update(start + timedelta(minutes=15), 0.2, 100.0)
+    assert math.isclose(integrator.total, 0.2)
+    # New hour, the last 15 minutes of the previous hour are estimated
+    assert integrator.update(start + timedelta(minutes=40), 0.05, 100.0)
+    assert math.isclose(integrator.total, 0.275)
+    integrator.update(start + timedelta(minutes=80), 0.15, 100.0)
+    integrator.update(start + timedelta(minutes=95), 0.01, 100.0)
+    assert math.isclose(integrator.total, 0.385 + 0.1 / 6)
+    # Log of complete hour 11 reports more than counted
+    assert integrator.hour_logged(hour_number(start) + 1, 0.2)
+    assert not integrator.hour_logged(hour_number(start) + 1, 0.1)
+    # First hour is not counted completely and not corrected
+    assert not integrator.hour_logged(hour_number(start), 1.0)
+    assert math.isclose(integrator.total, 0.435)
+    restored = EnergyIntegrator(integrator.state())
+    assert restored.total == integrator.total
@@ -0,0 +1,53 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of multiple sticks run by a manager
+"""
+import socket
+import threading
+from plugwise.manager import StickManager
+from plugwise.simulator import SimulatedStick
+from conftest import SCAN_TIME_OUT
+
+
+def test_nodes_of_all_networks_are_found():
+    simulators = [SimulatedStick(circles=2, latency=0.01, seed=seed) for seed in (1, 2)]
+    manager = StickManager()
+    try:
+        sticks = []
+        for simulator in simulators:
+            finished = threading.Event()
+            sticks.append(
+                (manager.add_stick(simulator.open_tcp(), finished.set), finished)
+            )
+        for (managed_stick, finished) in sticks:
+            assert finished.wait(SCAN_TIME_OUT)
+        for (simulator, (managed_stick, _)) in zip(simulators, sticks):
+            for mac in simulator.nodes:
+                assert manager.node(mac) is managed_stick.node(mac)
+                assert manager.node(mac) is not None
+        assert manager.node("000D6F0000000000") is None
+    finally:
+        manager.stop()
+        for simulator in simulators:
+            simulator.stop()
+
+
+def test_sticks_share_scheduler_for_sending():
+    listeners = []
+    for _ in range(3):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        listeners.append(listener)
+    manager = StickManager()
+    try:
+        threads = threading.active_count()
+        for listener in listeners:
+            manager.add_stick("127.0.0.1:%d" % (listener.getsockname()[1],)).connect()
+        # Only connection reader and writer threads are started for each stick
+        assert threading.active_count() - threads == 2 * len(listeners)
+    finally:
+        manager.stop()
+        for listener in listeners:
+            listener.close()
@@ -0,0 +1,93 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of batched notifications of state changes
+"""
+import threading
+import time
+import pytest
+from plugwise.notify import BatchNotifier
+from plugwise.scheduler import Scheduler
+
+MAC = "000D6F0000000001"
+WINDOW = 0.1
+
+
+@pytest.fixture
+def scheduler():
+    """ Return running scheduler """
+    scheduler = Scheduler("test_scheduler_thread")
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+class Batches(object):
+    """ Collect delivered batches """
+
+    def __init__(self):
+        self.batches = []
+        self.delivered = threading.Event()
+
+    def __call__(self, changes):
+        self.batches.append(changes)
+        self.delivered.set()
+
+    def wait(self):
+        assert self.delivered.wait(5)
+        self.delivered.clear()
+
+
+def test_changes_in_window_are_delivered_once(scheduler):
+    batches = Batches()
+    notifier = BatchNotifier(batches, WINDOW, scheduler.call_later)
+    notifier.add(MAC, "power_1s", 10)
+    notifier.add(MAC, "power_1s", 12)
+    notifier.add(MAC, "relay", True)
+    assert scheduler.pending() == 1
+    batches.wait()
+    # Last value of a sensor within the window
+    assert batches.batches == [[(MAC, "power_1s", 12), (MAC, "relay", True)]]
+    time.sleep(2 * WINDOW)
+    assert len(batches.batches) == 1
+
+
+def test_unchanged_values_are_not_delivered(scheduler):
+    batches = Batches()
+    notifier = BatchNotifier(batches, WINDOW, scheduler.call_later)
+    notifier.add(MAC, "power_1s", 10)
+    batches.wait()
+    # Same value as delivered does not start a window
+    notifier.add(MAC, "power_1s", 10)
+    assert scheduler.pending() == 0
+    # Changed and back to the delivered value within a window
+    notifier.add(MAC, "power_1s", 11)
+    notifier.add(MAC, "power_1s", 10)
+    notifier.add(MAC, "relay", False)
+    batches.wait()
+    assert batches.batches == [[(MAC, "power_1s", 10)], [(MAC, "relay", False)]]
+
+
+def test_next_window_starts_after_delivery(scheduler):
+    batches = Batches()
+    notifier = BatchNotifier(batches, WINDOW, scheduler.call_later)
+    start = time.monotonic()
+    notifier.add(MAC, "power_1s", 1)
+    batches.wait()
+    assert time.monotonic() - start >= WINDOW
+    notifier.add(MAC, "power_1s", 2)
+    batches.wait()
+    assert batches.batches == [[(MAC, "power_1s", 1)], [(MAC, "power_1s", 2)]]
+
+
+def test_cancel_drops_pending_changes(scheduler):
+    batches = Batches()
+    notifier = BatchNotifier(batches, WINDOW, scheduler.call_later)
+    notifier.add(MAC, "power_1s", 1)
+    notifier.cancel()
+    assert scheduler.pending() == 0
+    time.sleep(2 * WINDOW)
+    assert batches.batches == []
+    notifier.add(MAC, "power_1s", 2)
+    batches.wait()
+    assert batches.batches == [[(MAC, "power_1s", 2)]]
@@ -0,0 +1,109 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of sharing one stick with multiple clients
+"""
+import socket
+import threading
+import time
+import pytest
+from plugwise.constants import MESSAGE_FOOTER, MESSAGE_HEADER
+from plugwise.server import StickServer, split_frames
+from plugwise.util import crc_fun
+
+ACK_DELAY = 1.5  # Longer than the acknowledge timeout used before
+
+
+def frame(body):
+    """ Return message with checksum """
+    return MESSAGE_HEADER + body + b"%04X" % crc_fun(body) + MESSAGE_FOOTER
+
+
+class FakeStick(object):
+    """
+    Stick acknowledging requests one at a time, the first acknowledge is delayed.
+    Sends an acknowledge without request before the first request.
+    """
+
+    def __init__(self):
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen()
+        self.port = "127.0.0.1:%d" % (self._listener.getsockname()[1],)
+        self._sock = None
+        self._connected = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def unsolicited_ack(self):
+        assert self._connected.wait(5)
+        self._sock.sendall(frame(b"0000" + b"0050" + b"00C1"))
+
+    def _run(self):
+        (self._sock, _) = self._listener.accept()
+        self._connected.set()
+        buffer = b""
+        seq_id = 0x100
+        while True:
+            data = self._sock.recv(4096)
+            if not data:
+                return
+            (frames, buffer) = split_frames(buffer + data)
+            for request in frames:
+                seq_id += 1
+                seq = b"%04X" % seq_id
+                if seq_id == 0x101:
+                    time.sleep(ACK_DELAY)
+                self._sock.sendall(frame(b"0000" + seq + b"00C1"))
+                # Response with mac of request
+                self._sock.sendall(frame(b"0013" + seq + request[8:24]))
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+        self._listener.close()
+
+
+def receive(sock, count):
+    """ Return (message id, seq_id, mac) of count messages received by client """
+    sock.settimeout(ACK_DELAY + 5)
+    buffer = b""
+    messages = []
+    while len(messages) < count:
+        (frames, buffer) = split_frames(buffer + sock.recv(4096))
+        messages.extend((f[4:8], f[8:12], f[12:28]) for f in frames)
+    return messages
+
+
+@pytest.fixture
+def server(tmp_path):
+    """ Return server sharing fake stick with two clients """
+    stick = FakeStick()
+    server = StickServer(stick.port, "unix:" + str(tmp_path / "stick.sock"))
+    server.start()
+    clients = []
+    for _ in range(2):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(str(tmp_path / "stick.sock"))
+        clients.append(client)
+    deadline = time.monotonic() + 5
+    while len(server.clients()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield (stick, server, clients)
+    for client in clients:
+        client.close()
+    server.stop()
+    stick.close()
+
+
+def test_late_acknowledge_is_mapped_to_its_client(server):
+    (stick, _, clients) = server
+    stick.unsolicited_ack()
+    macs = [b"000D6F0000000001", b"000D6F0000000002"]
+    clients[0].sendall(frame(b"0012" + macs[0]))
+    time.sleep(0.1)
+    clients[1].sendall(frame(b"0012" + macs[1]))
+    for (client, mac) in zip(clients, macs):
+        (ack, response) = receive(client, 2)
+        # Unsolicited acknowledge is dropped, every client sees its own seq_id
+        assert ack[:2] == (b"0000", b"0001")
+        assert response == (b"0013", b"0001", mac)
@@ -0,0 +1,89 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of node state published in shared memory
+"""
+from multiprocessing import shared_memory
+import os
+import subprocess
+import sys
+from types import MappingProxyType
+import pytest
+from plugwise.exceptions import SharedStateError
+from plugwise.shared import (
+    HEADER,
+    MAGIC,
+    RECORD,
+    VERSION,
+    SharedStateReader,
+    SharedStateWriter,
+    _record_offset,
+    _untrack,
+)
+from plugwise.snapshot import NodeState, SensorState
+
+MAC = "000D6F0000000001"
+
+
+@pytest.fixture
+def name():
+    """ Return unique name of shared memory segment """
+    return "pw_test_%d" % (os.getpid(),)
+
+
+def left_behind_segment(name, pid):
+    """ Create segment as left behind by a writer with given pid """
+    segment = shared_memory.SharedMemory(name, create=True, size=_record_offset(4))
+    HEADER.pack_into(segment.buf, 0, MAGIC, VERSION, RECORD.size, 4, 0, pid)
+    segment.close()
+    _untrack(segment)
+
+
+def test_reader_gets_published_state(name):
+    writer = SharedStateWriter(name, 4)
+    try:
+        writer.update(
+            MAC,
+            NodeState(
+                MAC,
+                "Circle",
+                True,
+                None,
+                MappingProxyType({"power_1s": SensorState(12.5, None)}),
+            ),
+        )
+        reader = SharedStateReader(name)
+        record = reader.node(MAC)
+        assert record.available and record.power_1s == 12.5 and record.relay == -1
+        reader.close()
+    finally:
+        writer.close()
+
+
+def test_segment_of_stopped_writer_is_replaced(name):
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    left_behind_segment(name, process.pid)
+    writer = SharedStateWriter(name, 4)
+    writer.close()
+
+
+def test_segment_of_running_writer_is_kept(name):
+    writer = SharedStateWriter(name, 4)
+    try:
+        with pytest.raises(SharedStateError):
+            SharedStateWriter(name, 4)
+        # Segment still published
+        SharedStateReader(name).close()
+    finally:
+        writer.close()
+
+
+def test_unknown_segment_is_kept(name):
+    segment = shared_memory.SharedMemory(name, create=True, size=64)
+    try:
+        with pytest.raises(SharedStateError):
+            SharedStateWriter(name, 4)
+    finally:
+        segment.close()
+        segment.unlink()
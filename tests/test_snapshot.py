@@ -0,0 +1,53 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of the read only snapshot of node states
+"""
+import threading
+import pytest
+from plugwise.constants import SENSOR_PING, SWITCH_RELAY
+from plugwise.nodes.circle import PlugwiseCircle
+from plugwise.snapshot import NetworkSnapshot
+
+MAC = "000D6F0000000001"
+
+
+def test_published_mapping_never_changes(stub_stick):
+    snapshot = NetworkSnapshot()
+    node = PlugwiseCircle(MAC, 1, stub_stick)
+    snapshot.add_node(node)
+    first = snapshot.get()
+    assert first[MAC].sensors == {}
+    snapshot.update(node, SWITCH_RELAY["id"], True)
+    second = snapshot.get()
+    assert first[MAC].sensors == {}
+    assert second[MAC].sensors[SWITCH_RELAY["id"]].value is True
+    assert snapshot.node(MAC) is second[MAC]
+    # Reading twice without update returns the same mapping
+    assert snapshot.get() is second
+    with pytest.raises(TypeError):
+        second["x"] = None
+    snapshot.remove_node(MAC)
+    assert MAC not in snapshot.get() and MAC in second
+    assert snapshot.node(MAC) is None
+
+
+def test_concurrent_updates_are_not_lost(stub_stick):
+    snapshot = NetworkSnapshot()
+    nodes = [
+        PlugwiseCircle("000D6F00000000%02d" % (i,), i, stub_stick) for i in range(4)
+    ]
+
+    def update(node):
+        for value in range(1000):
+            snapshot.update(node, SENSOR_PING["id"], value)
+
+    threads = [threading.Thread(target=update, args=(node,)) for node in nodes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    states = snapshot.get()
+    assert len(states) == 4
+    for node in nodes:
+        assert states[node.get_mac()].sensors[SENSOR_PING["id"]].value == 999
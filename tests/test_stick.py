@@ -0,0 +1,46 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of a stick connected to the simulated stick and network
+"""
+import threading
+from plugwise.stick import stick
+from conftest import SCAN_TIME_OUT
+
+
+def test_discovery_of_all_nodes(simulator, scan):
+    plugwise = stick(simulator.open_tcp())
+    try:
+        scan(plugwise)
+        assert sorted(plugwise.nodes()) == sorted(simulator.nodes)
+        progress = plugwise.discovery_progress()["discovery"]
+        assert progress["finished"]
+        assert progress["first_node_ready"] is not None
+        for mac in plugwise.nodes():
+            assert plugwise.node(mac).get_available()
+    finally:
+        plugwise.disconnect()
+
+
+def test_rescan_finishes(simulator, scan):
+    plugwise = stick(simulator.open_tcp())
+    try:
+        scan(plugwise)
+        finished = threading.Event()
+        plugwise.scan(finished.set)
+        assert finished.wait(SCAN_TIME_OUT)
+    finally:
+        plugwise.disconnect()
+
+
+def test_disconnect_stops_callback_workers(simulator):
+    plugwise = stick(simulator.open_tcp())
+    for _ in range(2):
+        plugwise.connect()
+        plugwise.initialize_stick()
+        plugwise.disconnect()
+    assert not [
+        thread
+        for thread in threading.enumerate()
+        if thread.name.startswith("callback_thread")
+    ]
@@ -0,0 +1,105 @@
+"""
+Use of this source code is governed by the MIT license found in the LICENSE file.
+
+Tests of the memory mapped energy store
+"""
+from datetime import datetime, timedelta
+import gc
+import math
+import os
+import pytest
+from plugwise.constants import STORE_GROW_HOURS
+from plugwise.exceptions import EnergyStoreError
+from plugwise.history import hour_number
+from plugwise.store import HEADER, EnergyStore, NodeEnergyFile
+
+MAC = "000D6F0000000001"
+START = datetime(2021, 1, 1)
+
+
+def test_store_round_trip(tmp_path):
+    store = EnergyStore(str(tmp_path))
+    for hour in range(48):
+        store.write(MAC, START + timedelta(hours=hour), hour / 10)
+    store.close()
+    store = EnergyStore(str(tmp_path))
+    values = store.read(MAC, START, START + timedelta(hours=48))
+    assert list(values) == [hour / 10 for hour in range(48)]
+    store.close()
+
+
+def test_hours_without_data_are_nan(tmp_path):
+    store = EnergyStore(str(tmp_path))
+    store.write(MAC, START + timedelta(hours=2), 1.0)
+    values = store.read(MAC, START, START + timedelta(hours=4))
+    assert math.isnan(values[0]) and math.isnan(values[1])
+    assert values[2] == 1.0
+    assert math.isnan(values[3])
+    # Hours outside the file are not returned
+    assert len(store.read(MAC, START - timedelta(hours=2), START)) == 0
+    assert len(store.read(MAC, START + timedelta(days=3650), START)) == 0
+    store.close()
+
+
+def test_file_grows_in_blocks_and_rewrites_hours(tmp_path):
+    path = str(tmp_path / "node.energy")
+    node_file = NodeEnergyFile(path)
+    first = hour_number(START) + 10
+    node_file.write(first, 1.0)
+    assert node_file.first_hour() == first - 10
+    assert node_file.end_hour() == first - 10 + STORE_GROW_HOURS
+    view = node_file.read(first, first + 20)
+    node_file.write(first + STORE_GROW_HOURS, 2.0)
+    assert node_file.end_hour() == first - 10 + 2 * STORE_GROW_HOURS
+    # View of replaced map stays valid
+    assert view[0] == 1.0
+    del view
+    gc.collect()
+    node_file.write(first, 3.0)
+    node_file.close()
+    assert os.path.getsize(path) == HEADER.size + 2 * STORE_GROW_HOURS * 8
+    node_file = NodeEnergyFile(path)
+    assert node_file.read(first, first + 1)[0] == 3.0
+    assert (
+        node_file.read(first + STORE_GROW_HOURS, first + STORE_GROW_HOURS + 1)[0] == 2.0
+    )
+    node_file.close()
+
+
+def test_older_hour_prepends_empty_hours(tmp_path):
+    path = str(tmp_path / "node.energy")
+    node_file = NodeEnergyFile(path)
+    first = hour_number(START)
+    node_file.write(first, 1.0)
+    view = node_file.read(first, first + 1)
+    node_file.write(first - 1, 2.0)
+    assert node_file.first_hour() == first - STORE_GROW_HOURS
+    assert list(node_file.read(first - 1, first + 1)) == [2.0, 1.0]
+    # View of replaced file stays valid
+    assert view[0] == 1.0
+    del view
+    gc.collect()
+    node_file.close()
+    assert os.path.getsize(path) == HEADER.size + 2 * STORE_GROW_HOURS * 8
+    node_file = NodeEnergyFile(path)
+    assert node_file.first_hour() == first - STORE_GROW_HOURS
+    assert list(node_file.read(first - 1, first + 1)) == [2.0, 1.0]
+    node_file.close()
+
+
+def test_read_returns_read_only_view(tmp_path):
+    node_file = NodeEnergyFile(str(tmp_path / "node.energy"))
+    node_file.write(hour_number(START), 1.0)
+    values = node_file.read(hour_number(START), hour_number(START) + 1)
+    with pytest.raises((TypeError, ValueError)):
+        values[0] = 2.0
+    assert values[0] == 1.0
+    del values
+    node_file.close()
+
+
+def test_unknown_file_format(tmp_path):
+    path = tmp_path / "node.energy"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(EnergyStoreError):
+        NodeEnergyFile(str(path))